@@ -0,0 +1,366 @@
+"""
+Megismételhető teljesítménymérés a PaintMEZ rajzmagjára, ablak nélkül.
+
+Rögzített seed-ből generált dokumentumokon méri az összesítést, az új
+vonalak véglegesítését, az undo/redo-t, az előnézeti képkockákat, a
+vödör-kitöltést és a PNG exportot; műveletenként p50/p95/p99 időt és memória-csúcsot ad JSON-ban.
+
+Példák:
+    python benchmark.py --output eredmeny.json
+    python benchmark.py --layers 4 --shapes 5000 --stroke-length 300 --thickness 2-20
+    python benchmark.py --output uj.json --compare eredmeny.json
+    python benchmark.py --journal autosave.journal
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+# Kijelző nélkül fusson; a paint_core nem nyit ablakot
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+
+import paint_core
+from frame_profiler import percentile
+from paint_core import BLACK, CanvasView, Document, Layer, PreviewOverlay, flood_fill, make_shape
+from paint_journal import OP_NAMES, Journal, apply_op, read_records
+from paint_project import load_project
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Alapértelmezett forgatókönyvek: (név, rétegek, alakzatok összesen, vonalhossz, vastagság-tartomány)
+DEFAULT_SCENARIOS = [
+    ("small", 1, 200, 40, (1, 5)),
+    ("medium", 3, 1500, 120, (1, 12)),
+    ("large", 5, 5000, 250, (2, 30)),
+]
+
+PALETTE = [(255, 0, 0), (0, 255, 0), (0, 0, 255), BLACK, (255, 128, 0), (128, 0, 128)]
+
+
+def summarize(samples):
+    ms = [s * 1000 for s in samples]
+    return {
+        "n": len(ms),
+        "p50_ms": round(percentile(ms, 50), 4),
+        "p95_ms": round(percentile(ms, 95), 4),
+        "p99_ms": round(percentile(ms, 99), 4),
+        "max_ms": round(max(ms), 4),
+        "mean_ms": round(sum(ms) / len(ms), 4),
+    }
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS bájtban, Linux kilobájtban adja
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def raster_bytes(document):
+    """A rétegek csempéinek és ellenőrzőpontjainak mérete (ezek nem a Python heapen vannak)."""
+    total = 0
+    for layer in document.layers:
+        if layer.cache is not None:
+            total += layer.cache.nbytes()
+        total += paint_core.checkpoint_bytes(layer)
+    return total
+
+# ========== SZINTETIKUS DOKUMENTUMOK ==========
+
+def random_stroke(rng, size, length):
+    x, y = rng.randrange(size[0]), rng.randrange(size[1])
+    points = [(x, y)]
+    angle = rng.uniform(0, 6.283)
+    for _ in range(length - 1):
+        angle += rng.uniform(-0.4, 0.4)
+        step = rng.uniform(1, 6)
+        x = max(0, min(size[0] - 1, int(x + step * math.cos(angle))))
+        y = max(0, min(size[1] - 1, int(y + step * math.sin(angle))))
+        points.append((x, y))
+    return points
+
+
+def random_shape(rng, size, stroke_length, thickness):
+    kind = rng.choice(('rect', 'ellipse', 'line', 'line', 'eraser'))
+    th = rng.randint(*thickness)
+    color = rng.choice(PALETTE)
+    if kind in ('rect', 'ellipse'):
+        start = (rng.randrange(size[0]), rng.randrange(size[1]))
+        end = (start[0] + rng.randint(-200, 200), start[1] + rng.randint(-200, 200))
+        return make_shape(kind, start=start, end=end, color=color, fill=rng.random() < 0.5, thickness=th)
+    length = max(2, int(rng.gauss(stroke_length, stroke_length / 4)))
+    return make_shape(kind, points=random_stroke(rng, size, length), color=color, thickness=th)
+
+
+def make_document(seed, layer_count, shape_count, stroke_length, thickness, size=paint_core.DOCUMENT_SIZE):
+    rng = random.Random(seed)
+    document = Document(size)
+    for i in range(layer_count):
+        document.add_layer(Layer(name=f"Layer {i}", background_color=(255, 255, 255) if i == 0 else None))
+    for i in range(shape_count):
+        document.layers[i % layer_count].add_shape(random_shape(rng, size, stroke_length, thickness))
+    return document, rng
+
+# ========== MÉRÉSEK ==========
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def bench_composite(document, view, repeat):
+    """Teljes újraépítés: minden réteg az elejéről (ellenőrzőpontok nélkül) + összesítés."""
+    def run():
+        for layer in document.layers:
+            layer.checkpoints.clear()
+            layer.invalidate()
+        view.redraw()
+    return timed(run, repeat)
+
+
+def bench_stroke_commit(document, view, rng, count, stroke_length, thickness):
+    """Új vonalak véglegesítése érvényes gyorsítótárra, az összesített kép frissítésével."""
+    layer = document.layers[-1]
+    view.redraw()
+    samples = []
+    for _ in range(count):
+        shape = make_shape('line', points=random_stroke(rng, document.size, stroke_length),
+                           color=rng.choice(PALETTE), thickness=rng.randint(*thickness))
+        t0 = time.perf_counter()
+        layer.add_shape(shape)
+        view.redraw()
+        samples.append(time.perf_counter() - t0)
+    for _ in range(count):
+        layer.pop_shape()
+    view.redraw()
+    return samples
+
+
+def bench_undo_redo(document, view, count):
+    layer = max(document.layers, key=lambda l: len(l.shapes))
+    view.redraw()
+    count = min(count, len(layer.shapes))
+    undo, redo = [], []
+    for _ in range(count):
+        t0 = time.perf_counter()
+        shape = layer.pop_shape()
+        view.redraw()
+        undo.append(time.perf_counter() - t0)
+        layer.redo_stack.append(shape)
+    for _ in range(count):
+        t0 = time.perf_counter()
+        layer.add_shape(layer.redo_stack.pop())
+        view.redraw()
+        redo.append(time.perf_counter() - t0)
+    return undo, redo
+
+
+def bench_preview(document, view, rng, frames):
+    """
+    Téglalap-húzás képkockái úgy, ahogy a főciklus rajzolja: a fedőréteg
+    frissítése (PreviewOverlay.update), majd a változott területen a vászon
+    és rá az előnézet, arra vágva (mint a draw_scene).
+    """
+    composite = view.redraw()
+    screen = pygame.Surface(composite.get_size())
+    screen.blit(composite, (0, 0))
+    overlay = PreviewOverlay(composite.get_size())
+    start = (rng.randrange(document.size[0] // 2), rng.randrange(document.size[1] // 2))
+    samples = []
+    for i in range(frames):
+        end = (start[0] + 5 * i % 600, start[1] + 3 * i % 400)
+        t0 = time.perf_counter()
+        shape = make_shape('rect', start=start, end=end, color=BLACK, fill=False, thickness=3)
+        changed = overlay.update(view.viewport.shape_to_view(shape))
+        if changed is not None:
+            screen.set_clip(changed)
+            screen.fill(BLACK)
+            screen.blit(composite, (0, 0))
+            overlay.draw(screen, (0, 0))
+            screen.set_clip(None)
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def bench_flood_fill(document, view, rng, count):
+    """
+    Vödör-kitöltés véletlen pontokból a legfelső rétegen (terület-keresés,
+    véglegesítés és az összesített kép frissítése), majd visszavonás.
+    NumPy nélkül üres.
+    """
+    if paint_core.numpy is None:
+        return []
+    layer = document.layers[-1]
+    view.redraw()
+    samples = []
+    added = 0
+    for _ in range(count):
+        pos = (rng.randrange(document.size[0]), rng.randrange(document.size[1]))
+        t0 = time.perf_counter()
+        shape = flood_fill(layer, pos, rng.choice(PALETTE))
+        if shape is not None:
+            layer.add_shape(shape)
+            added += 1
+        view.redraw()
+        samples.append(time.perf_counter() - t0)
+    for _ in range(added):
+        layer.pop_shape()
+    view.redraw()
+    return samples
+
+
+def bench_export(document, repeat):
+    def run():
+        buf = io.BytesIO()
+        pygame.image.save(document.flatten(), buf, "export.png")
+    return timed(run, repeat)
+
+
+def run_scenario(name, seed, layer_count, shape_count, stroke_length, thickness, repeat):
+    # A tracemalloc erősen lassít, ezért csak a dokumentum felépítését követi
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    document, rng = make_document(seed, layer_count, shape_count, stroke_length, thickness)
+    view = CanvasView(document, pygame.Rect((0, 0), document.size))
+    view.redraw()
+    build_s = time.perf_counter() - t0
+    _, py_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results = {}
+    results["composite"] = summarize(bench_composite(document, view, repeat))
+    results["stroke_commit"] = summarize(bench_stroke_commit(document, view, rng, repeat * 4, stroke_length, thickness))
+    undo, redo = bench_undo_redo(document, view, repeat * 4)
+    results["undo"] = summarize(undo)
+    results["redo"] = summarize(redo)
+    results["preview_frame"] = summarize(bench_preview(document, view, rng, repeat * 20))
+    fills = bench_flood_fill(document, view, rng, repeat * 2)
+    if fills:
+        results["flood_fill"] = summarize(fills)
+    results["png_export"] = summarize(bench_export(document, max(1, repeat // 2)))
+    return {
+        "name": name,
+        "params": {"seed": seed, "layers": layer_count, "shapes": shape_count,
+                   "stroke_length": stroke_length, "thickness": list(thickness),
+                   "document_size": list(document.size), "repeat": repeat},
+        "build_s": round(build_s, 4),
+        "timings": results,
+        "memory": {"python_peak_kb": py_peak // 1024,
+                   "raster_kb": raster_bytes(document) // 1024,
+                   "rss_peak_kb": peak_rss_kb()},
+    }
+
+def run_journal(filename):
+    """
+    Egy felvett munkamenet (műveletnapló) visszajátszása terhelési tesztként:
+    műveletenként a végrehajtás és az összesített kép frissítése együtt mérve.
+    """
+    generation, records, _ = read_records(filename)
+    document = load_project(Journal(filename).snapshot_name(generation))
+    view = CanvasView(document, pygame.Rect((0, 0), document.size))
+    view.redraw()
+    samples = {}
+    current = 0
+    for op, data in records:
+        t0 = time.perf_counter()
+        current = apply_op(document, current, op, data)
+        view.redraw()
+        samples.setdefault(OP_NAMES.get(op, str(op)), []).append(time.perf_counter() - t0)
+    return {
+        "name": f"journal:{os.path.basename(filename)}",
+        "params": {"journal": filename, "generation": generation, "operations": len(records),
+                   "document_size": list(document.size)},
+        "timings": {op: summarize(values) for op, values in samples.items()},
+        "memory": {"raster_kb": raster_bytes(document) // 1024, "rss_peak_kb": peak_rss_kb()},
+    }
+
+# ========== ÖSSZEHASONLÍTÁS ==========
+
+def compare(current, baseline_path):
+    """Kiírja a p50/p95 változását egy korábbi futáshoz képest."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {s["name"]: s for s in json.load(f)["scenarios"]}
+    for scenario in current["scenarios"]:
+        old = baseline.get(scenario["name"])
+        if old is None:
+            continue
+        for op, stats in scenario["timings"].items():
+            old_stats = old["timings"].get(op)
+            if not old_stats:
+                continue
+            parts = []
+            for key in ("p50_ms", "p95_ms"):
+                ratio = stats[key] / old_stats[key] if old_stats[key] else float("inf")
+                parts.append(f"{key} {old_stats[key]:.3f} -> {stats[key]:.3f} ({ratio:.2f}x)")
+            print(f"{scenario['name']:>8} {op:<14} " + ", ".join(parts), file=sys.stderr)
+
+
+def parse_range(text):
+    lo, _, hi = text.partition("-")
+    return (int(lo), int(hi or lo))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PaintMEZ renderelési benchmark (JSON kimenet).")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--repeat", type=int, default=5, help="Ismétlések alapszáma műveletenként")
+    parser.add_argument("--layers", type=int, help="Egyedi forgatókönyv: rétegek száma")
+    parser.add_argument("--shapes", type=int, help="Egyedi forgatókönyv: alakzatok száma összesen")
+    parser.add_argument("--stroke-length", type=int, default=100, help="Átlagos vonalhossz (pont)")
+    parser.add_argument("--thickness", type=parse_range, default=(1, 12), help="Vastagság-tartomány, pl. 2-20")
+    parser.add_argument("--output", help="JSON kimeneti fájl (alapból a standard kimenet)")
+    parser.add_argument("--compare", help="Korábbi JSON eredmény az összehasonlításhoz")
+    parser.add_argument("--journal", action="append", default=[],
+                        help="Műveletnapló visszajátszása terhelési tesztként (többször is megadható)")
+    args = parser.parse_args(argv)
+
+    pygame.init()
+    if args.layers or args.shapes:
+        scenarios = [("custom", args.layers or 1, args.shapes or 1000, args.stroke_length, args.thickness)]
+    elif args.journal:
+        scenarios = []
+    else:
+        scenarios = DEFAULT_SCENARIOS
+
+    report = {
+        "meta": {"python": platform.python_version(), "pygame": pygame.version.ver,
+                 "platform": platform.platform(), "video_driver": os.environ.get("SDL_VIDEODRIVER")},
+        "scenarios": [],
+    }
+    for name, layer_count, shape_count, stroke_length, thickness in scenarios:
+        print(f"{name}: {layer_count} réteg, {shape_count} alakzat...", file=sys.stderr)
+        report["scenarios"].append(run_scenario(name, args.seed, layer_count, shape_count,
+                                                stroke_length, thickness, args.repeat))
+    for filename in args.journal:
+        print(f"{filename}: napló visszajátszása...", file=sys.stderr)
+        report["scenarios"].append(run_journal(filename))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        compare(report, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
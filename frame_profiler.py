@@ -0,0 +1,202 @@
+"""
+Képkocka-idő mérés a PaintMEZ főciklusához.
+
+A főciklus szakaszait (eseménykezelés, vászon-összesítés rétegenként,
+eszköztár, előnézet, overlay-k, kirajzolás, kijelző-frissítés) méri, az
+utolsó néhány száz képkockát gyűrűpufferben tartja, és kérésre CSV-be vagy
+Chrome trace JSON-ba (chrome://tracing, Perfetto) írja a képkockánkénti
+idővonalat. A count(név) képkockánkénti darabszámokat gyűjt (pl. renderhívások),
+ezek átlaga is a statisztika része. Kikapcsolva a lap() azonnal visszatér, a stage() pedig egy közös,
+üres kontextuskezelőt ad vissza, így a mérőpontok költsége elhanyagolható.
+"""
+import csv
+import json
+import time
+from collections import deque
+
+
+def percentile(values, q):
+    """Legközelebbi rang szerinti percentilis (q: 0..100)."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class _NullStage:
+    """Kikapcsolt mérés: nem csinál semmit."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._record(self.name, self.start, time.perf_counter())
+        return False
+
+
+class FrameProfiler:
+    """
+    Szakaszonkénti idők gyűjtése képkockánként. Egy képkocka a begin_frame()
+    és az end_frame() között tart. A főciklus egymás utáni szakaszait a lap(név)
+    választja el (az előző szakasz ott véget ér, a következő ott kezdődik),
+    a beágyazott részleteket a stage(név) kontextuskezelő méri. A perjeles nevek
+    (pl. "redraw/Base Layer") egy másik szakaszon belüli részletek: a trace-ben
+    megjelennek, de a "leglassabb szakasz" nem közülük kerül ki. A count(név, n)
+    egy képkockán belüli számlálót növel.
+    """
+    def __init__(self, enabled=False, history=240, trace_frames=0):
+        self.enabled = enabled
+        self.frames = deque(maxlen=history)         # (kezdet, munkaidő, {szakasz: idő}, {számláló: db})
+        self.trace = deque(maxlen=trace_frames) if trace_frames else None
+        self.frame_index = 0
+        self.epoch = time.perf_counter()
+        self._frame_start = None
+        self._lap_name = None
+        self._lap_start = 0.0
+        self._stages = {}
+        self._counts = {}
+        self._spans = []
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self._frame_start = None
+
+    def stage(self, name):
+        if self._frame_start is None:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def count(self, name, n=1):
+        if self._frame_start is None:
+            return
+        self._counts[name] = self._counts.get(name, 0) + n
+
+    def _record(self, name, start, end):
+        self._stages[name] = self._stages.get(name, 0.0) + (end - start)
+        if self.trace is not None:
+            self._spans.append((name, start, end))
+
+    def begin_frame(self, first_stage):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self._frame_start = now
+        self._lap_name = first_stage
+        self._lap_start = now
+        self._stages = {}
+        self._counts = {}
+        self._spans = []
+
+    def lap(self, name):
+        """Lezárja az aktuális szakaszt, és elkezdi a következőt."""
+        if self._frame_start is None:
+            return
+        now = time.perf_counter()
+        self._record(self._lap_name, self._lap_start, now)
+        self._lap_name = name
+        self._lap_start = now
+
+    def end_frame(self):
+        if self._frame_start is None:
+            return
+        now = time.perf_counter()
+        self._record(self._lap_name, self._lap_start, now)
+        start = self._frame_start
+        self.frames.append((start, now - start, self._stages, self._counts))
+        if self.trace is not None:
+            self.trace.append((self.frame_index, start, now, self._spans))
+        self.frame_index += 1
+        self._frame_start = None
+
+    # ========== STATISZTIKA ==========
+
+    def stats(self):
+        """
+        FPS, munkaidő-percentilisek (ms), a leglassabb szakasz és a számlálók
+        képkockánkénti átlaga az ablakban; None, ha nincs adat.
+        """
+        if not self.frames:
+            return None
+        work = [f[1] * 1000 for f in self.frames]
+        elapsed = self.frames[-1][0] - self.frames[0][0]
+        fps = (len(self.frames) - 1) / elapsed if elapsed > 0 else 0.0
+        totals = {}
+        counts = {}
+        for _, _, stages, frame_counts in self.frames:
+            for name, seconds in stages.items():
+                if '/' not in name:
+                    totals[name] = totals.get(name, 0.0) + seconds
+            for name, n in frame_counts.items():
+                counts[name] = counts.get(name, 0) + n
+        slowest = max(totals, key=totals.get) if totals else None
+        return {
+            "fps": fps,
+            "p50_ms": percentile(work, 50),
+            "p95_ms": percentile(work, 95),
+            "p99_ms": percentile(work, 99),
+            "max_ms": max(work),
+            "slowest": slowest,
+            "slowest_ms": totals[slowest] * 1000 / len(self.frames) if slowest else 0.0,
+            "counts": {name: n / len(self.frames) for name, n in counts.items()},
+        }
+
+    # ========== TRACE KIÍRÁSA ==========
+
+    def dump(self, filename):
+        """A rögzített képkockák kiírása; .json kiterjesztésnél Chrome trace, egyébként CSV."""
+        if self.trace is None:
+            raise ValueError("A trace rögzítése nincs bekapcsolva (trace_frames=0)")
+        if filename.lower().endswith(".json"):
+            self._dump_chrome(filename)
+        else:
+            self._dump_csv(filename)
+
+    def _us(self, t):
+        return round((t - self.epoch) * 1e6, 1)
+
+    def _dump_chrome(self, filename):
+        events = []
+        for index, start, end, spans in self.trace:
+            events.append({"name": "frame", "ph": "X", "pid": 1, "tid": 1,
+                           "ts": self._us(start), "dur": round((end - start) * 1e6, 1),
+                           "args": {"frame": index}})
+            for name, s, e in spans:
+                events.append({"name": name, "ph": "X", "pid": 1, "tid": 1,
+                               "ts": self._us(s), "dur": round((e - s) * 1e6, 1)})
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def _dump_csv(self, filename):
+        names = []
+        for _, _, _, spans in self.trace:
+            for name, _, _ in spans:
+                if name not in names:
+                    names.append(name)
+        with open(filename, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "start_ms", "total_ms"] + [f"{n}_ms" for n in names])
+            for index, start, end, spans in self.trace:
+                per_stage = {}
+                for name, s, e in spans:
+                    per_stage[name] = per_stage.get(name, 0.0) + (e - s)
+                writer.writerow([index, round((start - self.epoch) * 1000, 3), round((end - start) * 1000, 3)]
+                                + [round(per_stage.get(n, 0.0) * 1000, 3) for n in names])
@@ -1,6 +1,22 @@
 import pygame
 import sys
 import os
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from frame_profiler import FrameProfiler
+from paint_core import (
+    BLACK, BLEND_MODES, DOCUMENT_SIZE, TILE_SIZE, WHITE, ZOOM_STEP, CanvasView, Document, Layer,
+    LoadedImageShape, PreviewOverlay, StrokeInterpolator, flood_fill, make_shape, simplify_stroke,
+)
+from paint_project import atomic_write, encode_png, load_project, save_project
+from paint_export import export_pool, export_scaled
+from paint_journal import (
+    OP_CLEAR_LAYER, OP_REDO, OP_REMOVE_LAYER, OP_SELECT_LAYER, OP_UNDO, Journal,
+)
 
 pygame.init()
 
@@ -9,12 +25,17 @@ pygame.init()
 SCREEN_WIDTH = 1300
 SCREEN_HEIGHT = 900
 UI_HEIGHT = 140  # Megnövelt UI-sáv a gombokhoz (több sor + logó)
+CANVAS_SIZE = (SCREEN_WIDTH, SCREEN_HEIGHT - UI_HEIGHT)
+TOOLBAR_RECT = pygame.Rect(0, 0, SCREEN_WIDTH, UI_HEIGHT)
+CANVAS_RECT = pygame.Rect((0, UI_HEIGHT), CANVAS_SIZE)
+
+# A gombok mindig TOOLBAR_BUTTON_ROWS sorba rendeződnek (alattuk a swatchok és a
+# csúszka), így elférnek a UI-sávban; új gomb esetén a gombok keskenyednek.
+TOOLBAR_BUTTON_ROWS = 2
 
 LIGHT_GRAY = (220, 220, 220)
 GRAY = (180, 180, 180)
 DARK_GRAY = (100, 100, 100)
-WHITE = (255, 255, 255)
-BLACK = (0, 0, 0)
 RED = (255, 0, 0)
 GREEN = (0, 255, 0)
 BLUE = (0, 0, 255)
@@ -25,75 +46,154 @@ LOGO_COLOR = (0, 150, 200)
 
 DEFAULT_PALETTE = [RED, GREEN, BLUE, BLACK, YELLOW, ORANGE, PURPLE, WHITE]
 
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("PaintMEZ - Többrétegű Rajz, Egyéni Színnel")
-
-clock = pygame.time.Clock()
+# Képkocka-ütemezés: húzás / overlay alatt ACTIVE_FPS a felső korlát, tétlenül a
+# ciklus eseményre vár, de legfeljebb IDLE_TIMEOUT_MS-ig (0 = korlátlanul)
+ACTIVE_FPS = 60
+IDLE_TIMEOUT_MS = 500
+
+# A Mentés / Betöltés gomb a réteges projektfájlt használja, az Export PNG a lapított képet.
+# PROJECT_EMBED_RASTERS esetén a rétegek kirajzolt csempéi is a projektbe kerülnek
+# (nagyobb fájl, de betöltéskor nem kell újraraszterizálni).
+PROJECT_FILE = "multi_layer.pmez"
+EXPORT_FILE = "multi_layer.png"
+PROJECT_EMBED_RASTERS = False
+
+# Nagy felbontású export (nyomtatáshoz): az alakzatok EXPORT_SCALE-szeres léptékben
+# rajzolódnak újra, EXPORT_WORKERS folyamaton (None = a magok száma) párhuzamosan.
+HIRES_EXPORT_FILE = "multi_layer_print.png"
+EXPORT_SCALE = 4
+EXPORT_WORKERS = None
+
+# Automatikus mentés: minden véglegesített művelet a JOURNAL_FILE naplóba kerül
+# (None = kikapcsolva), indításkor onnan áll vissza az előző munkamenet. Lemezre
+# írás (fsync) legfeljebb JOURNAL_SYNC_MS-enként, JOURNAL_COMPACT_OPS művelet
+# után a háttérben új pillanatkép készül, és a napló újraindul.
+JOURNAL_FILE = "autosave.journal"
+JOURNAL_SYNC_MS = 1000
+JOURNAL_COMPACT_OPS = 500
+
+# Az aktív réteg átlátszóságának lépésköze a [ és ] billentyűkkel
+OPACITY_STEP = 0.1
+
+# Ennyi kirajzolt szöveg-felületet tartunk meg (LRU)
+TEXT_CACHE_SIZE = 256
+
+# Teljesítménymérés: az F3-mal kapcsolható HUD az utolsó PROFILE_HISTORY képkockából
+# számol, és legfeljebb HUD_REFRESH_MS-enként frissül. Ha a PAINTMEZ_TRACE környezeti
+# változó egy fájlnevet ad meg (.csv vagy .json = Chrome trace), a mérés végig fut,
+# és kilépéskor az utolsó PROFILE_TRACE_FRAMES képkocka idővonala oda íródik.
+PROFILE_HISTORY = 240
+PROFILE_TRACE_FRAMES = 20000
+PROFILE_TRACE_FILE = os.environ.get("PAINTMEZ_TRACE") or None
+HUD_REFRESH_MS = 250
 
 # ========== RAJZ-FUNKCIÓKHOZ TARTOZÓ ÁLLAPOT ==========
 
-current_tool = 'rect'   # 'rect', 'ellipse', 'line', 'eraser'
+current_tool = 'rect'   # 'rect', 'ellipse', 'line', 'eraser', 'fill'
 current_color = BLACK
 fill_shapes = True
 brush_thickness = 3
 
 mouse_is_down = False
+panning = False
 start_pos = (0, 0)
 line_points = []
 
-# ========== TÖBBSZÖRÖS RÉTEG KEZELÉS (vázlat) ==========
-
-class Layer:
-    def __init__(self, name="Layer", background_color=None):
-        self.name = name
-        self.background_color = background_color
-        self.shapes = []
-        self.redo_stack = []
-        self.visible = True
+# ========== DOKUMENTUM ÉS NÉZET ==========
 
-layers = [
-    Layer(name="Base Layer", background_color=WHITE)
-]
+# A modell és a raszterizálás a paint_core modulban van; itt csak a PaintMEZ
+# ablakához tartozó dokumentum és a vászon nézete él.
+document = Document(DOCUMENT_SIZE)
+document.add_layer(Layer(name="Base Layer", background_color=WHITE))
+layers = document.layers
 current_layer_index = 0
 
+canvas_view = CanvasView(document, CANVAS_RECT)
+viewport = canvas_view.viewport
+
+def redraw_all():
+    """
+    Visszaadja a rétegek összesített képét a nézet területén. A visszaadott
+    felület a gyorsítótár maga, ezért rajzolni csak a másolatára szabad.
+    """
+    return canvas_view.redraw()
+
+def take_canvas_damage():
+    return canvas_view.take_damage()
+
+def create_shape_data(stype, start=None, end=None, points=None):
+    """Új alakzat az aktuális színnel, kitöltéssel és vastagsággal."""
+    return make_shape(stype, start=start, end=end, points=points,
+                      color=current_color, fill=fill_shapes, thickness=brush_thickness)
+
 def get_current_layer():
     return layers[current_layer_index]
 
 def add_layer():
     new_layer = Layer(name=f"Layer {len(layers)}", background_color=None)
-    layers.append(new_layer)
+    document.add_layer(new_layer)
+    if journal is not None:
+        journal.record_add_layer(new_layer.name, new_layer.background_color)
     print(f"Új réteg: {new_layer.name}")
 
 def remove_layer():
     global current_layer_index
     if len(layers) > 1:
-        removed = layers.pop(current_layer_index)
+        removed = document.remove_layer(current_layer_index)
         print(f"Réteg törölve: {removed.name}")
+        if journal is not None:
+            journal.record_layer_op(OP_REMOVE_LAYER, current_layer_index)
         current_layer_index = max(0, current_layer_index - 1)
+        record_layer_selection()
     else:
         print("Nem törölhető az utolsó réteg.")
 
 def next_layer():
     global current_layer_index
     current_layer_index = (current_layer_index + 1) % len(layers)
+    record_layer_selection()
     print(f"Aktív réteg: {layers[current_layer_index].name}")
 
 def previous_layer():
     global current_layer_index
     current_layer_index = (current_layer_index - 1) % len(layers)
+    record_layer_selection()
     print(f"Aktív réteg: {layers[current_layer_index].name}")
 
+def record_layer_selection():
+    if journal is not None:
+        journal.record_layer_op(OP_SELECT_LAYER, current_layer_index)
+
 def set_layer_background_color(color):
     layer = get_current_layer()
     layer.background_color = color
+    if journal is not None:
+        journal.record_background(current_layer_index, color)
     print(f"Réteg háttérszíne: {color} ({layer.name})")
 
+def record_layer_style(layer):
+    if journal is not None:
+        journal.record_layer_style(current_layer_index, layer)
+    print(f"Réteg '{layer.name}': {layer.blend_mode}, {round(layer.opacity * 100)}%")
+
+def cycle_blend_mode():
+    layer = get_current_layer()
+    layer.blend_mode = BLEND_MODES[(BLEND_MODES.index(layer.blend_mode) + 1) % len(BLEND_MODES)]
+    record_layer_style(layer)
+
+def change_opacity(delta):
+    layer = get_current_layer()
+    layer.opacity = round(layer.opacity + delta, 2)
+    record_layer_style(layer)
+
 # ========== UNDO/REDO, TÖRLÉS ==========
 
 def layer_undo():
     layer = get_current_layer()
-    if layer.shapes:
-        layer.redo_stack.append(layer.shapes.pop())
+    if layer.can_undo():
+        layer.redo_stack.append(layer.pop_shape())
+        if journal is not None:
+            journal.record_layer_op(OP_UNDO, current_layer_index)
         print(f"Réteg '{layer.name}' - Undo")
     else:
         print("Nincs mit visszavonni.")
@@ -101,116 +201,397 @@ def layer_undo():
 def layer_redo():
     layer = get_current_layer()
     if layer.redo_stack:
-        layer.shapes.append(layer.redo_stack.pop())
+        layer.add_shape(layer.redo_stack.pop())
+        if journal is not None:
+            journal.record_layer_op(OP_REDO, current_layer_index)
         print(f"Réteg '{layer.name}' - Redo")
 
 def clear_current_layer():
     layer = get_current_layer()
-    layer.shapes.clear()
-    layer.redo_stack.clear()
+    layer.clear()
+    if journal is not None:
+        journal.record_layer_op(OP_CLEAR_LAYER, current_layer_index)
     print(f"Réteg '{layer.name}' törölve.")
 
-# ========== SHAPES KEZELÉS, RAJZOLÁS EGY RÉTEGRE ==========
-
-def create_shape_data(stype, start=None, end=None, points=None):
-    if stype in ('rect', 'ellipse'):
-        return {
-            'type': stype,
-            'start': start,
-            'end': end,
-            'color': current_color,
-            'fill': fill_shapes,
-            'thickness': brush_thickness
-        }
-    elif stype == 'line':
-        return {
-            'type': 'line',
-            'points': points,
-            'color': current_color,
-            'thickness': brush_thickness
-        }
-    elif stype == 'eraser':
-        return {
-            'type': 'eraser',
-            'points': points,
-            'thickness': brush_thickness
-        }
-
-def draw_shape_item(surface, item):
-    stype = item['type']
-    if stype == 'loaded_image':
-        loaded_img = item['surface']
-        surface.blit(loaded_img, (0, 0))
+def commit_shape(shape):
+    """
+    Egy befejezett rajzolás véglegesítése az aktív rétegen (és a naplóban).
+    Az új alakzat üríti a réteg redo-vermét; a visszajátszott OP_ADD_SHAPE ugyanígy.
+    """
+    layer = get_current_layer()
+    layer.redo_stack.clear()
+    layer.add_shape(shape)
+    if journal is not None:
+        journal.record_shape(current_layer_index, shape)
+    compact_layer_history(current_layer_index)
+
+def fill_at(canvas_pos):
+    """Vödör: az aktív réteg canvas_pos-sal összefüggő, hasonló színű területe az aktuális színnel."""
+    try:
+        shape = flood_fill(get_current_layer(), canvas_pos, current_color)
+    except RuntimeError as e:
+        print(f"Kitöltés nem lehetséges: {e}")
         return
+    if shape is not None:
+        commit_shape(shape)
+        print(f"Kitöltve: {len(shape)} szakasz, {shape.bounds.w}x{shape.bounds.h} területen")
+
+def compact_layer_history(layer_index):
+    """A régi alakzatok beégetése, ha a réteg túllépte az előzmény-korlátokat (lásd paint_core)."""
+    layer = layers[layer_index]
+    count = layer.compaction_count()
+    if count:
+        layer.compact(count)
+        if journal is not None:
+            journal.record_compaction(layer_index, count)
+        print(f"Réteg '{layer.name}': {count} régi alakzat beégetve, {len(layer.shapes)} maradt")
+
+# ========== ÉLŐ VONAL (folyamatban lévő szabadkézi / radír húzás) ==========
+
+# Átlátszó fedőréteg, amire húzás közben mindig csak a legújabb szakaszok kerülnek;
+# a gyorsítótárazott vászon fölé rajzoljuk, és felengedéskor egyszer véglegesítjük.
+# A képkocka összes egérmozgása egyetlen rajzolással kerül rá (lásd coalesce_motion).
+live_stroke_surface = None
+live_stroke_rect = None  # Az eddig rárajzolt rész befoglaló téglalapja
+stroke_interpolator = None
+
+def begin_live_stroke(canvas_pos):
+    """Új húzás kezdete; a line_points innentől a (sűrített) vonalpontokat gyűjti."""
+    global live_stroke_surface, stroke_interpolator, line_points
+    if live_stroke_surface is None:
+        live_stroke_surface = pygame.Surface(CANVAS_SIZE, pygame.SRCALPHA)
+    end_live_stroke()
+    stroke_interpolator = StrokeInterpolator()
+    line_points = stroke_interpolator.add([canvas_pos])
+
+def add_stroke_samples(canvas_points, color, thickness):
+    """
+    Egy képkocka egérmintái: sűrítés után az új pontok a line_points-ba, és
+    egyetlen rajzolással a fedőrétegre. Visszaadja a módosított téglalapot, vagy None-t.
+    """
+    new_points = stroke_interpolator.add(canvas_points)
+    if not new_points:
+        return None
+    path = line_points[-1:] + new_points
+    line_points.extend(new_points)
+    if len(path) < 2:
+        return None
+    return extend_live_stroke([viewport.to_view(p) for p in path], color, thickness)
+
+def finish_stroke_samples():
+    """Felengedéskor: a még függő utolsó szakasz pontjai a line_points-ba."""
+    line_points.extend(stroke_interpolator.finish())
+
+def extend_live_stroke(points, color, thickness):
+    """A pontokon átmenő törött vonalat rajzolja a fedőrétegre, és visszaadja a módosított téglalapot."""
+    global live_stroke_rect
+    changed = pygame.draw.lines(live_stroke_surface, color, False, points, thickness)
+    profiler.count("render")
+    if live_stroke_rect is None:
+        live_stroke_rect = changed
+    else:
+        live_stroke_rect = live_stroke_rect.union(changed)
+    return changed
 
-    th = item.get('thickness', 1)
-    if stype in ('rect', 'ellipse'):
-        sx, sy = item['start']
-        ex, ey = item['end']
-        left = min(sx, ex)
-        top = min(sy, ey)
-        width = abs(sx - ex)
-        height = abs(sy - ey)
-        color = item.get('color', BLACK)
-        fill = item.get('fill', True)
-
-        if stype == 'rect':
-            if fill:
-                pygame.draw.rect(surface, color, (left, top, width, height))
-            else:
-                pygame.draw.rect(surface, color, (left, top, width, height), th)
-        else:  # ellipse
-            if fill:
-                pygame.draw.ellipse(surface, color, (left, top, width, height))
-            else:
-                pygame.draw.ellipse(surface, color, (left, top, width, height), th)
+def end_live_stroke():
+    """Csak a ténylegesen használt részt törli, nem az egész fedőréteget. Visszaadja a törölt téglalapot."""
+    global live_stroke_rect
+    cleared = live_stroke_rect
+    if cleared is not None:
+        live_stroke_surface.fill((0, 0, 0, 0), cleared)
+        live_stroke_rect = None
+    return cleared
 
-    elif stype == 'line':
-        color = item.get('color', BLACK)
-        points = item['points']
-        if len(points) > 1:
-            pygame.draw.lines(surface, color, False, points, th)
+def draw_live_stroke(surface, offset):
+    if live_stroke_rect is not None:
+        dest = (live_stroke_rect.x + offset[0], live_stroke_rect.y + offset[1])
+        surface.blit(live_stroke_surface, dest, area=live_stroke_rect)
 
-    elif stype == 'eraser':
-        points = item['points']
-        if len(points) > 1:
-            pygame.draw.lines(surface, WHITE, False, points, th)
+# ========== ELŐNÉZET (húzás alatti téglalap / ellipszis) ==========
 
-def redraw_all():
-    final_surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT - UI_HEIGHT), pygame.SRCALPHA)
-    for layer in layers:
-        if not layer.visible:
-            continue
-        layer_surf = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT - UI_HEIGHT), pygame.SRCALPHA)
-        if layer.background_color is not None:
-            layer_surf.fill(layer.background_color)
-        for shape in layer.shapes:
-            draw_shape_item(layer_surf, shape)
-        final_surface.blit(layer_surf, (0, 0))
-    return final_surface
+# Külön átlátszó fedőréteg a vászon fölött (lásd paint_core.PreviewOverlay)
+preview = PreviewOverlay(CANVAS_SIZE)
+
+def update_preview(shape):
+    """
+    Az előnézet lecserélése (shape=None: eltüntetése). Visszaadja a képernyőn
+    frissítendő téglalapot (a régi és az új hely unióját), vagy None-t.
+    """
+    changed = preview.update(viewport.shape_to_view(shape) if shape is not None else None)
+    if preview.rect is not None:
+        profiler.count("render")
+    return changed.move(CANVAS_RECT.topleft) if changed is not None else None
+
+def draw_preview(surface, offset):
+    preview.draw(surface, offset)
 
 # ========== FÁJL MENTÉS / BETÖLTÉS ==========
 
-def save_canvas(filename="multi_layer.png"):
-    final_surf = redraw_all()
-    pygame.image.save(final_surf, filename)
-    print(f"Mentve: {filename}")
+def save_project_file(filename=PROJECT_FILE):
+    # A modell pillanatképe itt, a UI-szálon készül; a kódolás és az írás a háttérben
+    snapshot = document.snapshot(include_rasters=PROJECT_EMBED_RASTERS)
+    submit_save(filename, write_project_snapshot, snapshot)
+
+def load_project_file(filename=PROJECT_FILE):
+    global current_layer_index
+    try:
+        loaded = load_project(filename)
+    except (OSError, ValueError) as e:
+        print(f"Nem sikerült a betöltés: {e}")
+        return
+    document.replace_with(loaded)
+    current_layer_index = 0
+    restart_journal()
+    print(f"Projekt betöltve: {filename} ({len(layers)} réteg)")
+
+def save_canvas(filename=EXPORT_FILE):
+    final_surf = document.flatten()
+    snapshot = (pygame.image.tobytes(final_surf, "RGBA"), final_surf.get_size())
+    submit_save(filename, write_png_snapshot, snapshot)
+
+def export_hires(filename=HIRES_EXPORT_FILE, scale=EXPORT_SCALE):
+    # Csak a modell pillanatképe készül itt; a raszterizálás és a kódolás a munkafolyamatokban
+    submit_save(filename, write_hires_snapshot, (document.snapshot(), scale))
 
-def load_canvas(filename="multi_layer.png"):
+def load_canvas(filename=EXPORT_FILE):
     if os.path.exists(filename):
         loaded = pygame.image.load(filename)
         base_layer = layers[0]
-        base_layer.shapes.clear()
+        base_layer.clear()
         base_layer.background_color = None
-        base_layer.shapes.append({'type': 'loaded_image', 'surface': loaded})
+        base_layer.add_shape(LoadedImageShape(loaded))
+        # A bitkép nem naplózható rekord, ezért a napló új pillanatképről indul
+        restart_journal()
         print(f"Betöltve: {filename}")
     else:
         print("Nincs ilyen fájl.")
 
+def submit_save(filename, writer, snapshot):
+    if saver.submit(filename, writer, snapshot):
+        print(f"Mentés sorban: {filename} (a korábbi, még várakozó kérés helyett)")
+    else:
+        print(f"Mentés indul: {filename}")
+
+def handle_save_event(event):
+    if journal is not None and event.filename == journal.pending_snapshot:
+        # Az automatikus mentés pillanatképe: csak a hibát jelezzük
+        if event.state == 'error':
+            print(f"Az automatikus mentés pillanatképe nem készült el: {event.error}")
+        if event.state != 'progress':
+            journal.finish_compaction(event.state == 'done')
+        return
+    if event.state == 'progress':
+        print(f"Mentés: {event.filename} {event.done}/{event.total}")
+    elif event.state == 'done':
+        print(f"Mentve: {event.filename}")
+    else:
+        print(f"Nem sikerült a mentés ({event.filename}): {event.error}")
+
+# ========== HÁTTÉRBEN MENTÉS ==========
+
+# A háttérszál ilyen típusú eseményekkel jelez vissza: state = 'progress' | 'done' | 'error'
+SAVE_EVENT = pygame.event.custom_type()
+
+class BackgroundSaver:
+    """
+    Mentések egyetlen háttérszálon. A pillanatkép (modell vagy összesített kép)
+    a kérés pillanatában a UI-szálon készül, a kódolás és az írás a szálon fut,
+    az állapotról SAVE_EVENT események érkeznek. Ha ugyanarra a fájlra már vár
+    egy mentés, az új kérés lecseréli annak pillanatképét, így ismételt
+    kattintásra sem kódoljuk ugyanazt többször. A PNG-kódolás külön folyamatba
+    kerül, mert a pygame közben fogja a GIL-t, és a felület megakadna.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = OrderedDict()  # fájlnév -> (író függvény, pillanatkép)
+        self.thread = None
+        self.pool = None
+        self.export_executor = None
+
+    def submit(self, filename, writer, snapshot):
+        """Mentés kérése; True, ha egy még el nem kezdett kérést váltott fel."""
+        with self.lock:
+            coalesced = filename in self.pending
+            self.pending[filename] = (writer, snapshot)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="PaintMEZ mentés", daemon=True)
+                self.thread.start()
+        return coalesced
+
+    def busy(self):
+        return self.thread is not None
+
+    def _post(self, filename, state, **data):
+        try:
+            pygame.event.post(pygame.event.Event(SAVE_EVENT, filename=filename, state=state, **data))
+        except pygame.error:
+            pass  # Az ablak már bezárult, nincs kinek jelezni
+
+    def _run(self):
+        try:
+            while True:
+                with self.lock:
+                    if not self.pending:
+                        self.thread = None
+                        return
+                    filename, (writer, snapshot) = self.pending.popitem(last=False)
+                progress = lambda done, total: self._post(filename, 'progress', done=done, total=total)
+                try:
+                    writer(self, snapshot, filename, progress)
+                except (OSError, ValueError, pygame.error) as e:
+                    self._post(filename, 'error', error=str(e))
+                except Exception as e:
+                    # Egy váratlanul elbukó feladat sem állíthatja le a későbbi mentéseket
+                    self._post(filename, 'error', error=f"{type(e).__name__}: {e}")
+                else:
+                    self._post(filename, 'done')
+        finally:
+            # Ha a szál mégis kivétellel áll le, a várakozó kérésekhez új indul
+            with self.lock:
+                if self.thread is threading.current_thread():
+                    self.thread = None
+                    if self.pending:
+                        self.thread = threading.Thread(target=self._run, name="PaintMEZ mentés", daemon=True)
+                        self.thread.start()
+
+    def encode_png(self, data, size):
+        """PNG-kódolás egy külön folyamatban; ha az nem indítható, itt a szálon."""
+        try:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+            return self.pool.submit(encode_png, data, size).result()
+        except (OSError, BrokenProcessPool):
+            self.pool = None
+            return encode_png(data, size)
+
+    def export_pool(self):
+        """A nagy felbontású export munkafolyamatai; az első exportnál indulnak, utána újrahasznosulnak."""
+        if self.export_executor is None:
+            self.export_executor = export_pool(EXPORT_WORKERS)
+        return self.export_executor
+
+    def shutdown(self):
+        """Megvárja a folyamatban lévő és a várakozó mentéseket (kilépéskor)."""
+        while True:
+            with self.lock:
+                thread = self.thread
+            if thread is None:
+                break
+            thread.join()
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.export_executor is not None:
+            self.export_executor.shutdown()
+            self.export_executor = None
+
+def write_png_snapshot(saver, snapshot, filename, progress):
+    data, size = snapshot
+    png = saver.encode_png(data, size)
+    with atomic_write(filename) as f:
+        f.write(png)
+
+def write_hires_snapshot(saver, snapshot, filename, progress):
+    document, scale = snapshot
+    try:
+        export_scaled(document, filename, scale, executor=saver.export_pool(), workers=EXPORT_WORKERS,
+                      progress=progress)
+    except (OSError, BrokenProcessPool):
+        # A munkafolyamatok nem indíthatók: a sávok itt, a szálon készülnek
+        saver.export_executor = None
+        export_scaled(document, filename, scale, workers=0, progress=progress)
+
+def write_project_snapshot(saver, snapshot, filename, progress):
+    save_project(snapshot, filename, include_rasters=PROJECT_EMBED_RASTERS, progress=progress)
+
+def write_autosave_snapshot(saver, snapshot, filename, progress):
+    save_project(snapshot, filename)
+
+saver = BackgroundSaver()
+
+# ========== AUTOMATIKUS MENTÉS: MŰVELETNAPLÓ ==========
+
+journal = None
+
+def start_journal():
+    """A napló megnyitása indításkor; ha van előző munkamenet, visszaállítja."""
+    global journal, current_layer_index
+    if JOURNAL_FILE is None:
+        return
+    journal = Journal(JOURNAL_FILE, sync_ms=JOURNAL_SYNC_MS, compact_ops=JOURNAL_COMPACT_OPS)
+    restored = journal.restore()
+    if restored is not None:
+        restored_document, current_layer_index, count = restored
+        document.replace_with(restored_document)
+        print(f"Előző munkamenet visszaállítva: {len(layers)} réteg, {count} művelet a naplóból")
+    else:
+        restart_journal()
+
+def restart_journal():
+    """Új pillanatkép azonnal, a napló üresen indul (betöltés után a régi már nem érvényes)."""
+    global journal
+    if journal is None:
+        return
+    try:
+        journal.compact_now(document, current_layer_index)
+    except OSError as e:
+        print(f"Az automatikus mentés ki van kapcsolva: {e}")
+        journal.close()
+        journal = None
+
+def update_journal():
+    """Képkockánként: kötegelt fsync, és szükség esetén háttérben tömörítés."""
+    journal.maybe_sync()
+    if journal.needs_compaction():
+        snapshot = document.snapshot()
+        saver.submit(journal.begin_compaction(current_layer_index), write_autosave_snapshot, snapshot)
+
+def shutdown():
+    """Kilépés előtt: a mentések megvárása, a napló lezárása, a trace kiírása."""
+    saver.shutdown()
+    for event in pygame.event.get(SAVE_EVENT):
+        handle_save_event(event)
+    if journal is not None:
+        journal.close()
+    write_profile_trace()
+
+# ========== BETŰTÍPUSOK ÉS SZÖVEG-GYORSÍTÓTÁR ==========
+
+# Egy Font objektum (name, size, bold) kulcsonként; a SysFont keresés drága lehet
+_font_registry = {}
+# Kirajzolt szövegek (text, font, color, antialias) kulcs szerint, LRU sorrendben
+_text_cache = OrderedDict()
+
+def get_font(name=None, size=18, bold=False):
+    key = (name, size, bold)
+    font = _font_registry.get(key)
+    if font is None:
+        font = pygame.font.SysFont(name, size, bold=bold)
+        _font_registry[key] = font
+    return font
+
+def render_text(font, text, color, antialias=True):
+    """
+    font.render() gyorsítótárral. A visszaadott felület közös, ezért csak
+    blitelni szabad, módosítani nem.
+    """
+    key = (text, font, tuple(color), antialias)
+    surf = _text_cache.get(key)
+    if surf is not None:
+        _text_cache.move_to_end(key)
+        return surf
+    surf = font.render(text, antialias, color)
+    _text_cache[key] = surf
+    if len(_text_cache) > TEXT_CACHE_SIZE:
+        _text_cache.popitem(last=False)
+    return surf
+
 # ========== GOMB, CSÚSZKA, SZÍN SWATCH OSZTÁLYOK ==========
 
 class Button:
-    def __init__(self, text, callback, tooltip=None, w=100, h=30):
+    DEFAULT_WIDTH = 100
+
+    def __init__(self, text, callback, tooltip=None, w=DEFAULT_WIDTH, h=30):
         self.text = text
         self.callback = callback
         self.tooltip = tooltip
@@ -218,31 +599,60 @@ class Button:
         self.h = h
         self.rect = pygame.Rect(0, 0, w, h)
 
-        self.font = pygame.font.SysFont(None, 18)
+        self.font = get_font(None, 18)
         self.bg_color = GRAY
         self.hover_color = DARK_GRAY
         self.text_color = BLACK
+        self.hovered = False
+        self.sprites = {}  # hovered -> előre kirajzolt kép
 
     def set_position(self, x, y):
         self.rect.topleft = (x, y)
 
-    def draw(self, surf):
-        mouse_pos = pygame.mouse.get_pos()
-        color = self.bg_color
-        if self.rect.collidepoint(mouse_pos):
-            color = self.hover_color
-            if self.tooltip:
-                show_tooltip(self.tooltip, mouse_pos)
+    def set_width(self, w):
+        if w != self.w:
+            self.w = w
+            self.rect.w = w
+            self.sprites.clear()
+
+    @property
+    def dirty_rect(self):
+        return self.rect
 
-        pygame.draw.rect(surf, color, self.rect, border_radius=4)
-        txt_surf = self.font.render(self.text, True, self.text_color)
-        txt_rect = txt_surf.get_rect(center=self.rect.center)
-        surf.blit(txt_surf, txt_rect)
+    def update_hover(self, mouse_pos):
+        """Frissíti a hover állapotot; True, ha emiatt a gomb képe megváltozott."""
+        hovered = self.rect.collidepoint(mouse_pos)
+        if hovered and self.tooltip:
+            show_tooltip(self.tooltip, mouse_pos)
+        changed = hovered != self.hovered
+        self.hovered = hovered
+        return changed
+
+    def get_sprite(self):
+        """A gomb képe az aktuális hover állapotban (a UI-sáv hátterével együtt)."""
+        sprite = self.sprites.get(self.hovered)
+        if sprite is None:
+            sprite = pygame.Surface(self.rect.size)
+            sprite.fill(LIGHT_GRAY)
+            local = sprite.get_rect()
+            color = self.hover_color if self.hovered else self.bg_color
+            pygame.draw.rect(sprite, color, local, border_radius=4)
+            txt_surf = render_text(self.font, self.text, self.text_color)
+            txt_rect = txt_surf.get_rect(center=local.center)
+            sprite.blit(txt_surf, txt_rect)
+            self.sprites[self.hovered] = sprite
+        return sprite
+
+    def draw(self, surf):
+        surf.blit(self.get_sprite(), self.rect)
 
     def handle_event(self, event):
+        """Kezeli az eseményt; True, ha a gomb elnyelte (a vászon már nem kapja meg)."""
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
             if self.rect.collidepoint(event.pos):
                 self.callback()
+                return True
+        return False
 
 class ColorSwatch:
     def __init__(self, color, set_bg=False, tooltip=None, size=32):
@@ -251,17 +661,31 @@ class ColorSwatch:
         self.tooltip = tooltip
         self.size = size
         self.rect = pygame.Rect(0, 0, size, size)
+        self.sprite = None
 
     def set_position(self, x, y):
         self.rect.topleft = (x, y)
 
-    def draw(self, surf):
-        mouse_pos = pygame.mouse.get_pos()
-        pygame.draw.rect(surf, self.color, self.rect)
-        pygame.draw.rect(surf, BLACK, self.rect, 2)
+    @property
+    def dirty_rect(self):
+        return self.rect
 
+    def update_hover(self, mouse_pos):
+        # A swatch képe hoverre nem változik, csak a tooltip
         if self.tooltip and self.rect.collidepoint(mouse_pos):
             show_tooltip(self.tooltip, mouse_pos)
+        return False
+
+    def get_sprite(self):
+        if self.sprite is None:
+            self.sprite = pygame.Surface(self.rect.size)
+            local = self.sprite.get_rect()
+            pygame.draw.rect(self.sprite, self.color, local)
+            pygame.draw.rect(self.sprite, BLACK, local, 2)
+        return self.sprite
+
+    def draw(self, surf):
+        surf.blit(self.get_sprite(), self.rect)
 
     def handle_event(self, event):
         global current_color
@@ -272,6 +696,8 @@ class ColorSwatch:
                 else:
                     current_color = self.color
                     print(f"Szín beállítva: {current_color}")
+                return True
+        return False
 
 class Slider:
     def __init__(self, min_val=1, max_val=20, start_val=3, tooltip=None, w=150, h=20):
@@ -284,10 +710,13 @@ class Slider:
         self.rect = pygame.Rect(0, 0, w, h)
         self.handle_width = 12
         self.dragging = False
+        self.drawn_state = None
+        self.sprites = {}  # (érték, fogantyú helye) -> előre kirajzolt kép
         self.update_handle_x()
 
     def set_position(self, x, y):
         self.rect.topleft = (x, y)
+        self.sprites.clear()
         self.update_handle_x()
 
     def update_handle_x(self):
@@ -300,19 +729,44 @@ class Slider:
         val = self.min_val + ratio * (self.max_val - self.min_val)
         return int(round(max(self.min_val, min(self.max_val, val))))
 
-    def draw(self, surf):
-        mouse_pos = pygame.mouse.get_pos()
-        pygame.draw.rect(surf, DARK_GRAY, self.rect)
-        handle_rect = pygame.Rect(self.handle_x, self.rect.y, self.handle_width, self.h)
-        pygame.draw.rect(surf, GRAY, handle_rect)
+    @property
+    def dirty_rect(self):
+        # Az érték felirata a csúszka fölött, a fogantyú felett jelenik meg
+        return pygame.Rect(self.rect.x - 10, self.rect.y - 20, self.rect.w + 20, self.rect.h + 20)
 
-        font = pygame.font.SysFont(None, 18)
-        val_surf = font.render(str(self.value), True, BLACK)
-        val_rect = val_surf.get_rect(midbottom=(handle_rect.centerx, self.rect.y - 2))
-        surf.blit(val_surf, val_rect)
+    def state_key(self):
+        return (self.value, self.handle_x - self.rect.x)
 
+    def update_hover(self, mouse_pos):
+        """True, ha az érték vagy a fogantyú a legutóbbi kirajzolás óta változott."""
         if self.tooltip and self.rect.collidepoint(mouse_pos):
             show_tooltip(self.tooltip, mouse_pos)
+        state = self.state_key()
+        changed = state != self.drawn_state
+        self.drawn_state = state
+        return changed
+
+    def get_sprite(self):
+        """A csúszka és a felirata a dirty_rect méretében, a UI-sáv hátterével."""
+        key = self.state_key()
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            area = self.dirty_rect
+            sprite = pygame.Surface(area.size)
+            sprite.fill(LIGHT_GRAY)
+            local = self.rect.move(-area.x, -area.y)
+            pygame.draw.rect(sprite, DARK_GRAY, local)
+            handle_rect = pygame.Rect(self.handle_x - area.x, local.y, self.handle_width, self.h)
+            pygame.draw.rect(sprite, GRAY, handle_rect)
+
+            val_surf = render_text(get_font(None, 18), str(self.value), BLACK)
+            val_rect = val_surf.get_rect(midbottom=(handle_rect.centerx, local.y - 2))
+            sprite.blit(val_surf, val_rect)
+            self.sprites[key] = sprite
+        return sprite
+
+    def draw(self, surf):
+        surf.blit(self.get_sprite(), self.dirty_rect)
 
     def handle_event(self, event):
         global brush_thickness
@@ -323,6 +777,7 @@ class Slider:
                 self.handle_x = max(self.rect.x, min(self.rect.x + self.rect.w - self.handle_width, self.handle_x))
                 self.value = self.value_from_x(self.handle_x)
                 brush_thickness = self.value
+                return True
 
         elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
             self.dragging = False
@@ -332,6 +787,8 @@ class Slider:
             self.handle_x = max(self.rect.x, min(self.rect.x + self.rect.w - self.handle_width, self.handle_x))
             self.value = self.value_from_x(self.handle_x)
             brush_thickness = self.value
+            return True
+        return False
 
 # ========== TOOLTIP MEGOLDÁS ==========
 
@@ -343,23 +800,30 @@ def show_tooltip(text, pos):
     tooltip_text = text
     tooltip_pos = pos
 
-def draw_tooltip(surf):
+def clear_tooltip():
     global tooltip_text, tooltip_pos
-    if tooltip_text and tooltip_pos:
-        font = pygame.font.SysFont(None, 20)
-        t_surf = font.render(tooltip_text, True, (50, 50, 50))
+    tooltip_text = None
+    tooltip_pos = None
+
+def get_tooltip_rect():
+    if not (tooltip_text and tooltip_pos):
+        return None
+    t_surf = render_text(get_font(None, 20), tooltip_text, (50, 50, 50))
+    pad = 5
+    bg_rect = pygame.Rect((tooltip_pos[0] + 10, tooltip_pos[1] + 10), t_surf.get_size())
+    bg_rect.inflate_ip(pad*2, pad*2)
+    return bg_rect
+
+def draw_tooltip(surf):
+    bg_rect = get_tooltip_rect()
+    if bg_rect is not None:
+        t_surf = render_text(get_font(None, 20), tooltip_text, (50, 50, 50))
         pad = 5
-        bg_rect = t_surf.get_rect()
-        bg_rect.topleft = (tooltip_pos[0] + 10, tooltip_pos[1] + 10)
-        bg_rect.inflate_ip(pad*2, pad*2)
 
         pygame.draw.rect(surf, (255, 255, 210), bg_rect)
         pygame.draw.rect(surf, BLACK, bg_rect, 1)
         surf.blit(t_surf, (bg_rect.x+pad, bg_rect.y+pad))
 
-    tooltip_text = None
-    tooltip_pos = None
-
 # ========== SÚGÓ / HELP ==========
 
 show_help = False
@@ -368,29 +832,108 @@ def toggle_help():
     global show_help
     show_help = not show_help
 
+HELP_LINES = [
+    "PaintMEZ - Többrétegű Rajzprogram, Egyéni Szín megadás",
+    "",
+    "Eszközök, több sorba rendezett gombok fent.",
+    "Rétegek: Új, Köv/Előző, Törlés, Undo/Redo rétegenként.",
+    "Vödör: a kattintott, hasonló színű összefüggő terület kitöltése az aktív rétegen.",
+    "Hosszú munkánál a legutóbbi alakzatoknál régebbiek beégnek a rétegbe, azok már nem vonhatók vissza.",
+    "Háttérszín: 'Set BG' swatch-okkal vagy egyéni színnel állítható.",
+    "Beépített paletta + 'Egyéni szín' gomb, ami HEX vagy RGB bevitelt is elfogad.",
+    "",
+    "Mentés / Betöltés: réteges projektfájl (.pmez), undo-előzménnyel együtt.",
+    "Export PNG: a látható rétegek lapított képe.",
+    f"Export x{EXPORT_SCALE}: ugyanez {EXPORT_SCALE}-szeres felbontásban, az alakzatok újrarajzolásával.",
+    "B: az aktív réteg keverési módja (normal/multiply/screen/overlay), [ és ]: átlátszóság.",
+    "F3: teljesítmény-HUD (FPS, képkockaidők, leglassabb szakasz).",
+    "",
+    "Kattints a HELP gombra újra, hogy bezárd."
+]
+
+# A súgó teljes képe; egyszer készül el, utána minden képkockán egyetlen blit
+_help_overlay_surface = None
+
+def get_help_overlay():
+    global _help_overlay_surface
+    if _help_overlay_surface is None:
+        overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, 160))
+        font = get_font(None, 26)
+        y = 100
+        for line in HELP_LINES:
+            s = render_text(font, line, WHITE)
+            r = s.get_rect(center=(SCREEN_WIDTH//2, y))
+            overlay.blit(s, r)
+            y += 40
+        _help_overlay_surface = overlay
+    return _help_overlay_surface
+
 def draw_help_overlay(surf):
-    overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-    overlay.fill((0, 0, 0, 160))
-    font = pygame.font.SysFont(None, 26)
-    lines = [
-        "PaintMEZ - Többrétegű Rajzprogram, Egyéni Szín megadás",
-        "",
-        "Eszközök, több sorba rendezett gombok fent.",
-        "Rétegek: Új, Köv/Előző, Törlés, Undo/Redo rétegenként.",
-        "Háttérszín: 'Set BG' swatch-okkal vagy egyéni színnel állítható.",
-        "Beépített paletta + 'Egyéni szín' gomb, ami HEX vagy RGB bevitelt is elfogad.",
-        "",
-        "Mentés / Betöltés: pixelképet. A réteges adatok JSON-ban nincsenek mentve.",
-        "",
-        "Kattints a HELP gombra újra, hogy bezárd."
+    surf.blit(get_help_overlay(), (0, 0))
+
+# ========== TELJESÍTMÉNY-HUD (F3) ==========
+
+profiler = FrameProfiler(enabled=PROFILE_TRACE_FILE is not None, history=PROFILE_HISTORY,
+                         trace_frames=PROFILE_TRACE_FRAMES if PROFILE_TRACE_FILE else 0)
+canvas_view.profiler = profiler
+
+show_hud = False
+HUD_RECT = pygame.Rect(SCREEN_WIDTH - 290, UI_HEIGHT + 8, 282, 138)
+_hud_surface = None
+_hud_updated_at = 0
+
+def toggle_hud():
+    global show_hud, _hud_surface
+    show_hud = not show_hud
+    _hud_surface = None
+    # A HUD-hoz mérni kell; trace-fájl kérésekor a mérés eleve végig fut
+    profiler.set_enabled(show_hud or PROFILE_TRACE_FILE is not None)
+
+def hud_lines():
+    stats = profiler.stats()
+    if stats is None:
+        return ["Mérés indul..."]
+    return [
+        f"FPS: {stats['fps']:.1f}  ({len(profiler.frames)} képkocka)",
+        f"p50 / p95 / p99: {stats['p50_ms']:.1f} / {stats['p95_ms']:.1f} / {stats['p99_ms']:.1f} ms",
+        f"max: {stats['max_ms']:.1f} ms",
+        f"leglassabb: {stats['slowest']} ({stats['slowest_ms']:.2f} ms)",
+        f"renderhívás / képkocka: {stats['counts'].get('render', 0.0):.2f}",
+        f"sérült téglalap / képkocka: {stats['counts'].get('damage_rects', 0.0):.2f}",
     ]
-    y = 100
-    for line in lines:
-        s = font.render(line, True, WHITE)
-        r = s.get_rect(center=(SCREEN_WIDTH//2, y))
-        overlay.blit(s, r)
-        y += 40
-    surf.blit(overlay, (0, 0))
+
+def update_hud():
+    """Legfeljebb HUD_REFRESH_MS-enként újrarajzolja a HUD-ot; True, ha a képe megváltozott."""
+    global _hud_surface, _hud_updated_at
+    now = pygame.time.get_ticks()
+    if _hud_surface is not None and now - _hud_updated_at < HUD_REFRESH_MS:
+        return False
+    _hud_updated_at = now
+    hud = pygame.Surface(HUD_RECT.size, pygame.SRCALPHA)
+    hud.fill((0, 0, 0, 180))
+    # A számok képkockánként változnak, ezért nem a szöveg-gyorsítótáron át rajzoljuk őket
+    font = get_font(None, 20)
+    y = 8
+    for line in hud_lines():
+        hud.blit(font.render(line, True, WHITE), (8, y))
+        y += 21
+    _hud_surface = hud
+    return True
+
+def draw_hud(surf):
+    if _hud_surface is not None:
+        surf.blit(_hud_surface, HUD_RECT)
+
+def write_profile_trace():
+    """Kilépéskor kiírja a képkocka-trace-t, ha a PAINTMEZ_TRACE kérte."""
+    if PROFILE_TRACE_FILE is None:
+        return
+    try:
+        profiler.dump(PROFILE_TRACE_FILE)
+        print(f"Képkocka-trace mentve: {PROFILE_TRACE_FILE} ({len(profiler.trace)} képkocka)")
+    except OSError as e:
+        print(f"Nem sikerült a trace mentése: {e}")
 
 # ========== EGYÉNI SZÍN BEVITEL (RGB/HEX) ==========
 
@@ -442,62 +985,116 @@ def parse_color_string(text):
 
     raise ValueError("Nem sikerült értelmezni a színt (HEX vagy RGB formátum).")
 
-def draw_custom_color_overlay(surface):
-    """
-    Egy kis ablak, ahol megjelenik:
-    - "Egyéni szín beírása (RGB vagy HEX):"
-    - A beviteli mező (color_input_text)
-    - Ok gomb, Mégse gomb, esetleg hibajelzés
-    """
-    overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-    overlay.fill((0, 0, 0, 160))
-
-    # Kis téglalap középen
+def get_color_dialog_rects():
+    """A párbeszédablak és gombjai: (doboz, OK, Mégse) – rajzoláshoz és kattintáshoz is."""
     box_width = 400
     box_height = 200
     box_x = (SCREEN_WIDTH - box_width) // 2
     box_y = (SCREEN_HEIGHT - box_height) // 2
-
-    pygame.draw.rect(overlay, (230, 230, 230), (box_x, box_y, box_width, box_height), border_radius=8)
-    pygame.draw.rect(overlay, BLACK, (box_x, box_y, box_width, box_height), 2, border_radius=8)
-
-    font = pygame.font.SysFont(None, 24)
-    title_surf = font.render("Egyéni szín beírása (RGB vagy HEX):", True, BLACK)
-    title_rect = title_surf.get_rect(midtop=(box_x + box_width//2, box_y + 10))
-    overlay.blit(title_surf, title_rect)
-
-    # Beviteli mező
-    input_rect = pygame.Rect(box_x + 30, box_y + 60, box_width - 60, 30)
-    pygame.draw.rect(overlay, WHITE, input_rect, border_radius=5)
-    pygame.draw.rect(overlay, BLACK, input_rect, 2, border_radius=5)
-
-    text_surf = font.render(color_input_text, True, (0, 0, 128))
-    text_rect = text_surf.get_rect(midleft=(input_rect.x + 5, input_rect.y + input_rect.h//2))
-    overlay.blit(text_surf, text_rect)
-
-    # OK és Mégse gomb
+    box_rect = pygame.Rect(box_x, box_y, box_width, box_height)
     ok_rect = pygame.Rect(box_x + 60, box_y + 120, 100, 30)
     cancel_rect = pygame.Rect(box_x + 240, box_y + 120, 100, 30)
+    return box_rect, ok_rect, cancel_rect
 
-    pygame.draw.rect(overlay, (180, 255, 180), ok_rect, border_radius=5)
-    pygame.draw.rect(overlay, BLACK, ok_rect, 2, border_radius=5)
-    ok_surf = font.render("OK", True, BLACK)
-    ok_rect_text = ok_surf.get_rect(center=ok_rect.center)
-    overlay.blit(ok_surf, ok_rect_text)
-
-    pygame.draw.rect(overlay, (255, 180, 180), cancel_rect, border_radius=5)
-    pygame.draw.rect(overlay, BLACK, cancel_rect, 2, border_radius=5)
-    cancel_surf = font.render("Mégse", True, BLACK)
-    cancel_rect_text = cancel_surf.get_rect(center=cancel_rect.center)
-    overlay.blit(cancel_surf, cancel_rect_text)
-
-    # Hibaüzenet, ha van
-    if color_error_message:
-        error_surf = font.render(color_error_message, True, (200, 0, 0))
-        error_rect = error_surf.get_rect(midtop=(box_x + box_width//2, box_y + 100))
-        overlay.blit(error_surf, error_rect)
+class ColorDialog:
+    """
+    Az egyéni szín párbeszédablaka. A sötétítés, a doboz, a cím, az üres
+    beviteli mező és a gombok egyszer kerülnek egy gyorsítótárazott képre;
+    képkockánként csak a beírt szöveg, a hibaüzenet és a kijelölt gomb
+    rajzolódik rá.
+    """
+    BOX_COLOR = (230, 230, 230)
+    BUTTONS = (("OK", (180, 255, 180), (120, 220, 120)),
+               ("Mégse", (255, 180, 180), (220, 120, 120)))
+
+    def __init__(self):
+        self.font = get_font(None, 24)
+        self.base = None
+        self.hovered = None      # Az egér alatti gomb indexe (0 = OK, 1 = Mégse)
+        self.button_sprites = {}  # (index, hovered) -> előre kirajzolt kép
+
+    def rects(self):
+        box_rect, ok_rect, cancel_rect = get_color_dialog_rects()
+        input_rect = pygame.Rect(box_rect.x + 30, box_rect.y + 60, box_rect.w - 60, 30)
+        return box_rect, input_rect, (ok_rect, cancel_rect)
+
+    def get_button_sprite(self, index, hovered):
+        key = (index, hovered)
+        sprite = self.button_sprites.get(key)
+        if sprite is None:
+            label, color, hover_color = self.BUTTONS[index]
+            rect = self.rects()[2][index]
+            sprite = pygame.Surface(rect.size)
+            sprite.fill(self.BOX_COLOR)
+            local = sprite.get_rect()
+            pygame.draw.rect(sprite, hover_color if hovered else color, local, border_radius=5)
+            pygame.draw.rect(sprite, BLACK, local, 2, border_radius=5)
+            txt_surf = render_text(self.font, label, BLACK)
+            sprite.blit(txt_surf, txt_surf.get_rect(center=local.center))
+            self.button_sprites[key] = sprite
+        return sprite
+
+    def get_base(self):
+        if self.base is None:
+            box_rect, input_rect, button_rects = self.rects()
+            overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
+            overlay.fill((0, 0, 0, 160))
+
+            pygame.draw.rect(overlay, self.BOX_COLOR, box_rect, border_radius=8)
+            pygame.draw.rect(overlay, BLACK, box_rect, 2, border_radius=8)
+
+            title_surf = render_text(self.font, "Egyéni szín beírása (RGB vagy HEX):", BLACK)
+            title_rect = title_surf.get_rect(midtop=(box_rect.centerx, box_rect.y + 10))
+            overlay.blit(title_surf, title_rect)
+
+            # Üres beviteli mező
+            pygame.draw.rect(overlay, WHITE, input_rect, border_radius=5)
+            pygame.draw.rect(overlay, BLACK, input_rect, 2, border_radius=5)
+
+            # OK és Mégse gomb alaphelyzetben
+            for i, rect in enumerate(button_rects):
+                overlay.blit(self.get_button_sprite(i, False), rect)
+            self.base = overlay
+        return self.base
+
+    def update(self, mouse_pos):
+        """Frissíti a kijelölt gombot; visszaadja a képernyőn megváltozott téglalapokat."""
+        button_rects = self.rects()[2]
+        hovered = next((i for i, r in enumerate(button_rects) if r.collidepoint(mouse_pos)), None)
+        if hovered == self.hovered:
+            return []
+        changed = [button_rects[i] for i in (self.hovered, hovered) if i is not None]
+        self.hovered = hovered
+        return changed
+
+    def draw(self, surface):
+        surface.blit(self.get_base(), (0, 0))
+        box_rect, input_rect, button_rects = self.rects()
+
+        if color_input_text:
+            text_surf = render_text(self.font, color_input_text, (0, 0, 128))
+            text_rect = text_surf.get_rect(midleft=(input_rect.x + 5, input_rect.y + input_rect.h//2))
+            surface.blit(text_surf, text_rect)
+
+        if self.hovered is not None:
+            surface.blit(self.get_button_sprite(self.hovered, True), button_rects[self.hovered])
+
+        # Hibaüzenet, ha van
+        if color_error_message:
+            error_surf = render_text(self.font, color_error_message, (200, 0, 0))
+            error_rect = error_surf.get_rect(midtop=(box_rect.centerx, box_rect.y + 100))
+            surface.blit(error_surf, error_rect)
+
+color_dialog = ColorDialog()
 
-    surface.blit(overlay, (0, 0))
+def draw_custom_color_overlay(surface):
+    """
+    Egy kis ablak, ahol megjelenik:
+    - "Egyéni szín beírása (RGB vagy HEX):"
+    - A beviteli mező (color_input_text)
+    - Ok gomb, Mégse gomb, esetleg hibajelzés
+    """
+    color_dialog.draw(surface)
 
 # ========== FŐ GOMBOK, SWATCHOK, SLIDER LÉTREHOZÁSA ==========
 
@@ -522,6 +1119,10 @@ def set_tool_eraser():
     global current_tool
     current_tool = 'eraser'
 
+def set_tool_fill():
+    global current_tool
+    current_tool = 'fill'
+
 def toggle_fill():
     global fill_shapes
     fill_shapes = not fill_shapes
@@ -536,12 +1137,23 @@ def clear_cb():
     clear_current_layer()
 
 def save_cb():
-    save_canvas("multi_layer.png")
+    save_project_file(PROJECT_FILE)
 
 def load_cb():
-    load_canvas("multi_layer.png")
+    # Projekt híján a régi, PNG-be mentett rajzot töltjük be
+    if os.path.exists(PROJECT_FILE):
+        load_project_file(PROJECT_FILE)
+    else:
+        load_canvas(EXPORT_FILE)
+
+def export_cb():
+    save_canvas(EXPORT_FILE)
+
+def export_hires_cb():
+    export_hires(HIRES_EXPORT_FILE, EXPORT_SCALE)
 
 def exit_program():
+    shutdown()
     pygame.quit()
     sys.exit()
 
@@ -554,12 +1166,15 @@ def create_ui():
         ("Ellipszis", set_tool_ellipse, "Ellipszis rajzolás"),
         ("Szabadkézi", set_tool_line, "Szabadkézi vonal"),
         ("Radír", set_tool_eraser, "Radírozás"),
+        ("Vödör", set_tool_fill, "Összefüggő, hasonló színű terület kitöltése"),
         ("Kitöltés", toggle_fill, "Kitöltött/körvonal"),
         ("Undo", undo_cb, "Visszavonás (aktuális réteg)"),
         ("Redo", redo_cb, "Újra (aktuális réteg)"),
         ("Törlés", clear_cb, "Aktuális réteg törlése"),
-        ("Mentés", save_cb, "Kép mentése"),
-        ("Betöltés", load_cb, "Kép betöltése"),
+        ("Mentés", save_cb, "Projekt mentése (rétegek, alakzatok, undo)"),
+        ("Betöltés", load_cb, "Projekt betöltése"),
+        ("Export PNG", export_cb, "Lapított kép mentése PNG-be"),
+        (f"Export x{EXPORT_SCALE}", export_hires_cb, f"Nyomtatási export: {EXPORT_SCALE}x felbontás, újrarajzolva"),
         ("Help", toggle_help, "Súgó"),
         ("Kilépés", exit_program, "Kilépés"),
         ("Köv. réteg", next_layer, "Következő réteg"),
@@ -592,21 +1207,19 @@ def layout_buttons_in_rows():
     x = 200
     y = 10
     spacing = 10
-    row_height = 40
+    row_height = 35
     max_width = SCREEN_WIDTH - 10
 
-    # Gombok több sorban
-    for btn in buttons:
-        w = btn.w
-        h = btn.h
-        if x + w + spacing > max_width:
-            x = 200
-            y += row_height + spacing
-        btn.set_position(x, y)
-        x += w + spacing
+    # Gombok TOOLBAR_BUTTON_ROWS sorban; ha egy sorba nem fér ki a szükséges
+    # számú alapméretű gomb, mindegyik egyformán keskenyebb lesz
+    per_row = -(-len(buttons) // TOOLBAR_BUTTON_ROWS)
+    w = min(Button.DEFAULT_WIDTH, (max_width - x) // per_row - spacing)
+    for i, btn in enumerate(buttons):
+        row, col = divmod(i, per_row)
+        btn.set_width(w)
+        btn.set_position(x + col * (w + spacing), y + row * (row_height + spacing))
 
-    x = 200
-    y += row_height + spacing
+    y += TOOLBAR_BUTTON_ROWS * (row_height + spacing)
     # Szín swatch
     for sw in color_swatches:
         size = sw.size
@@ -628,185 +1241,438 @@ def layout_buttons_in_rows():
     x += 20
     slider.set_position(x, y+5)
 
+    # Új elrendezés után a UI-sáv képét újra kell építeni
+    toolbar.invalidate()
+
 # ========== LOGÓ ==========
 
 def draw_logo(surface):
-    font = pygame.font.SysFont(None, 48, bold=True)
+    font = get_font(None, 48, bold=True)
     text = "PaintMEZ"
-    text_surf = font.render(text, True, LOGO_COLOR)
+    text_surf = render_text(font, text, LOGO_COLOR)
     text_rect = text_surf.get_rect(topleft=(10, 10))
     surface.blit(text_surf, text_rect)
 
-# ========== FŐ CIKLUS ==========
+# ========== ELŐRE KIRAJZOLT UI-SÁV ==========
 
-running = True
-layout_buttons_in_rows()
+def ui_widgets():
+    return buttons + color_swatches + bg_color_swatches + [slider]
 
-while running:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
+class Toolbar:
+    """
+    A felső UI-sáv gyorsítótárazott képe. Layout után egyszer épül fel a
+    widgetek előre kirajzolt képeiből; utána csak azok a widgetek kerülnek
+    újra rá, amelyeknek a hover állapota vagy az értéke megváltozott.
+    """
+    def __init__(self, rect):
+        self.rect = pygame.Rect(rect)
+        self.surface = pygame.Surface(self.rect.size)
+        self.valid = False
+
+    def invalidate(self):
+        self.valid = False
+
+    def rebuild(self):
+        self.surface.fill(LIGHT_GRAY)
+        draw_logo(self.surface)
+        for w in ui_widgets():
+            w.draw(self.surface)
+        self.valid = True
+
+    def update(self, mouse_pos):
+        """Frissíti a widgetek állapotát; visszaadja a képernyőn megváltozott téglalapokat."""
+        changed = []
+        for w in ui_widgets():
+            if w.update_hover(mouse_pos) and self.valid:
+                w.draw(self.surface)
+                changed.append(w.dirty_rect)
+        if not self.valid:
+            self.rebuild()
+            changed = [self.rect]
+        return changed
 
-        # Ha az egyéni szín overlay aktív, először azt kezeljük
-        if custom_color_overlay:
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_RETURN:
-                    # OK -> próbáljuk parse-olni
-                    try:
-                        col = parse_color_string(color_input_text)
-                        current_color = col
-                        print(f"Egyéni szín beállítva: {current_color}")
-                        toggle_custom_color()  # Bezárjuk az overlayt
-                    except ValueError as e:
-                        color_error_message = str(e)
-                    # Ha hiba, akkor color_error_message-ben jelezzük
-                elif event.key == pygame.K_ESCAPE:
-                    toggle_custom_color()  # Mégse
-                elif event.key == pygame.K_BACKSPACE:
-                    if len(color_input_text) > 0:
-                        color_input_text = color_input_text[:-1]
-                else:
-                    # Szöveges karaktert fűzünk hozzá
-                    # Korlátozzuk a max hosszát, pl. 20
-                    if len(color_input_text) < 20:
-                        color_input_text += event.unicode
-
-            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                # Nézzük, rákattintott-e az OK / Mégse gombra
-                # Ehhez a draw_custom_color_overlay-ből emlékszünk a rect-jeikre:
-                box_width = 400
-                box_height = 200
-                box_x = (SCREEN_WIDTH - box_width) // 2
-                box_y = (SCREEN_HEIGHT - box_height) // 2
-                ok_rect = pygame.Rect(box_x + 60, box_y + 120, 100, 30)
-                cancel_rect = pygame.Rect(box_x + 240, box_y + 120, 100, 30)
-
-                if ok_rect.collidepoint(event.pos):
-                    # OK gomb
-                    try:
-                        col = parse_color_string(color_input_text)
-                        current_color = col
-                        print(f"Egyéni szín beállítva: {current_color}")
-                        toggle_custom_color()
-                    except ValueError as e:
-                        color_error_message = str(e)
-
-                elif cancel_rect.collidepoint(event.pos):
-                    # Mégse
-                    toggle_custom_color()
-
-            # Ha overlay aktív, nem kezeljük a többi gombot, rajzot, stb.
-            continue
-
-        # Normál eseménykezelés (gombok, csúszka, swatchok, rajz)
-        for b in buttons:
-            b.handle_event(event)
-        for sw in color_swatches:
-            sw.handle_event(event)
-        for sw in bg_color_swatches:
-            sw.handle_event(event)
-        slider.handle_event(event)
-
-        # Rajzterület
-        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-            if event.pos[1] > UI_HEIGHT:
-                mouse_is_down = True
-                layer = get_current_layer()
-                layer.redo_stack.clear()
+    def draw(self, surf):
+        surf.blit(self.surface, self.rect)
 
-                if current_tool in ('rect', 'ellipse'):
-                    start_pos = (event.pos[0], event.pos[1] - UI_HEIGHT)
-                elif current_tool in ('line', 'eraser'):
-                    line_points = [(event.pos[0], event.pos[1] - UI_HEIGHT)]
+toolbar = Toolbar(TOOLBAR_RECT)
 
-        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
-            if mouse_is_down:
-                mouse_is_down = False
-                layer = get_current_layer()
-                if current_tool in ('rect', 'ellipse'):
-                    end_pos = (event.pos[0], event.pos[1] - UI_HEIGHT)
-                    shape_data = create_shape_data(current_tool, start=start_pos, end=end_pos)
-                    layer.shapes.append(shape_data)
-                elif current_tool in ('line', 'eraser'):
-                    if len(line_points) > 1:
-                        shape_data = create_shape_data(current_tool, points=line_points)
-                        layer.shapes.append(shape_data)
-                line_points = []
-
-        elif event.type == pygame.MOUSEMOTION:
-            if mouse_is_down and event.pos[1] > UI_HEIGHT:
-                if current_tool in ('line', 'eraser'):
-                    line_points.append((event.pos[0], event.pos[1] - UI_HEIGHT))
-                    final_surf = redraw_all()
-                    if len(line_points) > 1:
-                        if current_tool == 'line':
-                            pygame.draw.line(final_surf, current_color,
-                                             line_points[-2], line_points[-1], brush_thickness)
-                        else:
-                            pygame.draw.line(final_surf, WHITE,
-                                             line_points[-2], line_points[-1], brush_thickness)
-                    # Képernyő frissítés
-                    screen.fill(LIGHT_GRAY, (0, 0, SCREEN_WIDTH, UI_HEIGHT))
-                    draw_logo(screen)
-                    for b in buttons:
-                        b.draw(screen)
-                    for sw in color_swatches:
-                        sw.draw(screen)
-                    for sw in bg_color_swatches:
-                        sw.draw(screen)
-                    slider.draw(screen)
-
-                    screen.blit(final_surf, (0, UI_HEIGHT))
-                    if show_help:
-                        draw_help_overlay(screen)
-                    draw_tooltip(screen)
-                    pygame.display.flip()
-
-    # ========== Minden frame kirajzolása ==========
-
-    final_surf = redraw_all()
-
-    # Felső UI sáv
-    screen.fill(LIGHT_GRAY, (0, 0, SCREEN_WIDTH, UI_HEIGHT))
-
-    # Logó
-    draw_logo(screen)
-
-    # Gombok, swatchok, slider
-    for b in buttons:
-        b.draw(screen)
-    for sw in color_swatches:
-        sw.draw(screen)
-    for sw in bg_color_swatches:
-        sw.draw(screen)
-    slider.draw(screen)
-
-    # Rétegek
-    screen.blit(final_surf, (0, UI_HEIGHT))
-
-    # Előnézet téglalap / ellipszis
-    if mouse_is_down and current_tool in ('rect', 'ellipse'):
-        mx, my = pygame.mouse.get_pos()
-        if my > UI_HEIGHT:
-            preview_surf = final_surf.copy()
-            end_pos = (mx, my - UI_HEIGHT)
-            shape_data = create_shape_data(current_tool, start=start_pos, end=end_pos)
-            draw_shape_item(preview_surf, shape_data)
-            screen.blit(preview_surf, (0, UI_HEIGHT))
+# ========== KÉPERNYŐ-FRISSÍTÉS: CSAK A MEGVÁLTOZOTT TÉGLALAPOK ==========
+
+class DamageTracker:
+    """
+    Összegyűjti a képernyő egy képkocka alatt megváltozott részeit, hogy
+    csak azokat rajzoljuk újra és küldjük ki pygame.display.update()-tel.
+    Ha túl sok téglalap gyűlik össze, egyetlen befoglaló téglalappá vonja össze őket.
+    """
+    def __init__(self, bounds, max_rects=16):
+        self.bounds = pygame.Rect(bounds)
+        self.max_rects = max_rects
+        self.rects = []
+        self.full = True  # Az első képkockát teljes egészében ki kell rajzolni
+
+    def add(self, rect):
+        if rect is None or self.full:
+            return
+        rect = pygame.Rect(rect).clip(self.bounds)
+        if rect.w > 0 and rect.h > 0:
+            self.rects.append(rect)
+
+    def add_full(self):
+        self.full = True
+        self.rects.clear()
+
+    def has_damage(self):
+        return self.full or bool(self.rects)
+
+    def collect(self):
+        """Visszaadja az összevont sérült téglalapokat, és kiüríti a gyűjtőt."""
+        if self.full:
+            rects = [self.bounds.copy()]
+        else:
+            rects = []
+            for rect in self.rects:
+                # Az átfedő téglalapokat összeolvasztjuk, amíg van átfedés
+                i = 0
+                while i < len(rects):
+                    if rects[i].colliderect(rect):
+                        rect = rect.union(rects.pop(i))
+                        i = 0
+                    else:
+                        i += 1
+                rects.append(rect)
+            if len(rects) > self.max_rects:
+                rects = [rects[0].unionall(rects[1:])]
+        self.full = False
+        self.rects = []
+        return rects
+
+def draw_scene(surf, clip, final_surf):
+    """A teljes képet rajzolja, de csak a clip téglalapon belül."""
+    surf.set_clip(clip)
+
+    if clip.colliderect(TOOLBAR_RECT):
+        # Felső UI sáv: egyetlen blit az előre kirajzolt képből
+        toolbar.draw(surf)
+
+    if clip.colliderect(CANVAS_RECT):
+        # Rétegek
+        surf.fill(BLACK, CANVAS_RECT)
+        surf.blit(final_surf, CANVAS_RECT.topleft)
+
+        # Folyamatban lévő szabadkézi vonal / radírozás
+        if mouse_is_down and current_tool in ('line', 'eraser'):
+            draw_live_stroke(surf, CANVAS_RECT.topleft)
+
+        # Előnézet téglalap / ellipszis a saját fedőrétegéről
+        draw_preview(surf, CANVAS_RECT.topleft)
 
     # Help overlay
     if show_help:
-        draw_help_overlay(screen)
+        draw_help_overlay(surf)
 
     # Ha custom_color_overlay aktív, rárajzoljuk azt is
     if custom_color_overlay:
-        draw_custom_color_overlay(screen)
+        draw_custom_color_overlay(surf)
+
+    if show_hud:
+        draw_hud(surf)
 
     # Tooltip
-    draw_tooltip(screen)
+    draw_tooltip(surf)
+
+    surf.set_clip(None)
 
-    pygame.display.flip()
-    clock.tick(60)
+# ========== KÉPKOCKA-ÜTEMEZÉS: TÉTLEN / AKTÍV MÓD ==========
+
+class FrameScheduler:
+    """
+    Aktív módban (húzás, lenyomott egérgomb, overlay) a ciklus korlátozott
+    FPS-sel fut. Tétlen módban a pygame.event.wait() blokkol a következő
+    eseményig vagy az időkorlát lejártáig, így nyugalomban nem pörög a CPU.
+    """
+    def __init__(self, clock, active_fps=ACTIVE_FPS, idle_timeout_ms=IDLE_TIMEOUT_MS):
+        self.clock = clock
+        self.active_fps = active_fps
+        self.idle_timeout_ms = idle_timeout_ms
+        self.active = True
+
+    def next_events(self, active):
+        """A következő képkocka eseményei; tétlen módban blokkol, amíg nincs mit feldolgozni."""
+        self.active = active
+        if active:
+            return pygame.event.get()
+        if self.idle_timeout_ms:
+            first = pygame.event.wait(self.idle_timeout_ms)
+        else:
+            first = pygame.event.wait()
+        events = [] if first.type == pygame.NOEVENT else [first]
+        events.extend(pygame.event.get())
+        return events
+
+    def end_frame(self):
+        if self.active:
+            self.clock.tick(self.active_fps)
+        else:
+            # Tétlenül nem fékezünk, a várakozás már megtörtént az eseményre
+            self.clock.tick()
+
+def coalesce_motion(events):
+    """
+    Az egymást követő (azonos gombállapotú) MOUSEMOTION események összevonása
+    egyetlen eseménnyé: a pos és a buttons az utolsóé, a rel az összeg, a trail
+    pedig az összes közbülső pozíció sorrendben. Így a képkocka egérmozgásait
+    minden kezelő egyszer dolgozza fel, a vonal egy menetben rajzolódik.
+    """
+    out = []
+    for event in events:
+        if event.type == pygame.MOUSEMOTION:
+            prev = out[-1] if out else None
+            if prev is not None and prev.type == pygame.MOUSEMOTION and prev.buttons == event.buttons:
+                prev.trail.append(event.pos)
+                rel = (prev.rel[0] + event.rel[0], prev.rel[1] + event.rel[1])
+                out[-1] = pygame.event.Event(pygame.MOUSEMOTION, {**event.dict, 'rel': rel, 'trail': prev.trail})
+                continue
+            event = pygame.event.Event(pygame.MOUSEMOTION, {**event.dict, 'trail': [event.pos]})
+        out.append(event)
+    return out
+
+def is_interacting():
+    """Van-e folyamatban húzás vagy nyitott overlay, ami folyamatos frissítést igényel."""
+    return (mouse_is_down or panning or slider.dragging or show_help or custom_color_overlay
+            or any(pygame.mouse.get_pressed()))
+
+# ========== FŐ CIKLUS ==========
+
+def main():
+    global current_color, color_input_text, color_error_message
+    global mouse_is_down, panning, start_pos, line_points
+
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("PaintMEZ - Többrétegű Rajz, Egyéni Színnel")
+    clock = pygame.time.Clock()
+
+    running = True
+    layout_buttons_in_rows()
+    start_journal()
+
+    damage = DamageTracker((0, 0, SCREEN_WIDTH, SCREEN_HEIGHT))
+    drawn_tooltip = None
+    drawn_preview = None
+    drawn_overlay = None
+    drawn_hud = False
+    scheduler = FrameScheduler(clock)
+
+    while running:
+        events = coalesce_motion(scheduler.next_events(is_interacting()))
+        profiler.begin_frame("events")
+        for event in events:
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                damage.add_full()
+            elif event.type == SAVE_EVENT:
+                handle_save_event(event)
+
+            # Ha az egyéni szín overlay aktív, először azt kezeljük
+            if custom_color_overlay:
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_RETURN:
+                        # OK -> próbáljuk parse-olni
+                        try:
+                            col = parse_color_string(color_input_text)
+                            current_color = col
+                            print(f"Egyéni szín beállítva: {current_color}")
+                            toggle_custom_color()  # Bezárjuk az overlayt
+                        except ValueError as e:
+                            color_error_message = str(e)
+                        # Ha hiba, akkor color_error_message-ben jelezzük
+                    elif event.key == pygame.K_ESCAPE:
+                        toggle_custom_color()  # Mégse
+                    elif event.key == pygame.K_BACKSPACE:
+                        if len(color_input_text) > 0:
+                            color_input_text = color_input_text[:-1]
+                    else:
+                        # Szöveges karaktert fűzünk hozzá
+                        # Korlátozzuk a max hosszát, pl. 20
+                        if len(color_input_text) < 20:
+                            color_input_text += event.unicode
+
+                elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                    # Nézzük, rákattintott-e az OK / Mégse gombra
+                    _, ok_rect, cancel_rect = get_color_dialog_rects()
+
+                    if ok_rect.collidepoint(event.pos):
+                        # OK gomb
+                        try:
+                            col = parse_color_string(color_input_text)
+                            current_color = col
+                            print(f"Egyéni szín beállítva: {current_color}")
+                            toggle_custom_color()
+                        except ValueError as e:
+                            color_error_message = str(e)
+
+                    elif cancel_rect.collidepoint(event.pos):
+                        # Mégse
+                        toggle_custom_color()
+
+                # Ha overlay aktív, nem kezeljük a többi gombot, rajzot, stb.
+                continue
+
+            # Normál eseménykezelés (gombok, csúszka, swatchok, rajz)
+            handled = False
+            for w in ui_widgets():
+                handled = w.handle_event(event) or handled
+            # Amit egy UI-elem már kezelt, az nem indít rajzolást a vásznon
+            if handled:
+                continue
+
+            # Rajzterület
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                if event.pos[1] > UI_HEIGHT:
+                    mouse_is_down = True
+
+                    if current_tool in ('rect', 'ellipse'):
+                        start_pos = viewport.to_canvas(event.pos)
+                    elif current_tool in ('line', 'eraser'):
+                        begin_live_stroke(viewport.to_canvas(event.pos))
+                    elif current_tool == 'fill':
+                        fill_at(viewport.to_canvas(event.pos))
+
+            elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+                if mouse_is_down:
+                    mouse_is_down = False
+                    if current_tool in ('rect', 'ellipse'):
+                        end_pos = viewport.to_canvas(event.pos)
+                        shape_data = create_shape_data(current_tool, start=start_pos, end=end_pos)
+                        commit_shape(shape_data)
+                    elif current_tool in ('line', 'eraser'):
+                        finish_stroke_samples()
+                        if len(line_points) > 1:
+                            points = simplify_stroke(line_points)
+                            if len(points) != len(line_points):
+                                print(f"Vonal egyszerűsítve: {len(line_points)} -> {len(points)} pont "
+                                      f"({len(line_points) - len(points)} elhagyva)")
+                            shape_data = create_shape_data(current_tool, points=points)
+                            commit_shape(shape_data)
+                    cleared = end_live_stroke()
+                    if cleared is not None:
+                        damage.add(cleared.move(0, UI_HEIGHT))
+                    line_points = []
+
+            elif event.type == pygame.MOUSEMOTION:
+                if mouse_is_down and event.pos[1] > UI_HEIGHT:
+                    if current_tool in ('line', 'eraser'):
+                        # Csak a képkocka új szakaszai kerülnek a fedőrétegre, a vászon nem épül újra
+                        samples = [viewport.to_canvas(pos) for pos in event.trail if pos[1] > UI_HEIGHT]
+                        stroke_color = current_color if current_tool == 'line' else WHITE
+                        changed = add_stroke_samples(samples, stroke_color, viewport.view_thickness(brush_thickness))
+                        if changed is not None:
+                            damage.add(changed.move(0, UI_HEIGHT))
+                elif panning:
+                    viewport.pan_screen(*event.rel)
+
+            # Nézet: görgővel nagyítás, jobb / középső gombbal mozgatás
+            elif event.type == pygame.MOUSEWHEEL and not mouse_is_down:
+                mouse = pygame.mouse.get_pos()
+                if CANVAS_RECT.collidepoint(mouse):
+                    viewport.zoom_at(mouse, ZOOM_STEP ** event.y)
+
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button in (2, 3):
+                if CANVAS_RECT.collidepoint(event.pos) and not mouse_is_down:
+                    panning = True
+
+            elif event.type == pygame.MOUSEBUTTONUP and event.button in (2, 3):
+                panning = False
+
+            elif event.type == pygame.KEYDOWN and not mouse_is_down:
+                # Nézet görgetése nyilakkal, ha a dokumentum nagyobb az ablaknál
+                step = TILE_SIZE // 2 / viewport.zoom
+                scroll_keys = {pygame.K_LEFT: (-step, 0), pygame.K_RIGHT: (step, 0),
+                               pygame.K_UP: (0, -step), pygame.K_DOWN: (0, step)}
+                if event.key in scroll_keys:
+                    viewport.scroll(*scroll_keys[event.key])
+                elif event.key == pygame.K_F3:
+                    toggle_hud()
+                elif event.key == pygame.K_b:
+                    cycle_blend_mode()
+                elif event.key == pygame.K_LEFTBRACKET:
+                    change_opacity(-OPACITY_STEP)
+                elif event.key == pygame.K_RIGHTBRACKET:
+                    change_opacity(OPACITY_STEP)
+
+        # ========== Mi változott ebben a képkockában? ==========
+
+        profiler.lap("redraw")
+        final_surf = redraw_all()
+        for rect in take_canvas_damage():
+            damage.add(rect.move(0, UI_HEIGHT))
+
+        # Hover- és értékváltozások a gombokon, swatchokon és a csúszkán
+        profiler.lap("toolbar")
+        mouse_pos = pygame.mouse.get_pos()
+        clear_tooltip()
+        for rect in toolbar.update(mouse_pos):
+            damage.add(rect)
+
+        # Tooltip: a régi és az új helyét is frissíteni kell
+        tooltip_state = (tooltip_text, get_tooltip_rect())
+        if tooltip_state != drawn_tooltip:
+            if drawn_tooltip is not None:
+                damage.add(drawn_tooltip[1])
+            damage.add(tooltip_state[1])
+            drawn_tooltip = tooltip_state
+
+        # Előnézet téglalap / ellipszis: csak akkor rajzoljuk újra, ha az alakzat vagy a nézet változott
+        profiler.lap("preview")
+        preview_state = None
+        if mouse_is_down and current_tool in ('rect', 'ellipse'):
+            mx, my = mouse_pos
+            if my > UI_HEIGHT:
+                end_pos = viewport.to_canvas(mouse_pos)
+                preview_state = (create_shape_data(current_tool, start=start_pos, end=end_pos),
+                                 tuple(viewport.origin), viewport.zoom)
+        if preview_state != drawn_preview:
+            changed = update_preview(preview_state[0] if preview_state is not None else None)
+            if changed is not None:
+                damage.add(changed)
+            drawn_preview = preview_state
+
+        # Overlay-k: megnyitás/bezárás az egész képet érinti, gépelés csak a dobozt
+        profiler.lap("overlays")
+        overlay_state = (show_help, custom_color_overlay, color_input_text, color_error_message)
+        if drawn_overlay is None or overlay_state[:2] != drawn_overlay[:2]:
+            damage.add_full()
+        elif overlay_state != drawn_overlay:
+            # A hibaüzenet szélesebb lehet a doboznál, ezért a teljes sávot frissítjük
+            box_rect = get_color_dialog_rects()[0]
+            damage.add((0, box_rect.y, SCREEN_WIDTH, box_rect.h))
+        drawn_overlay = overlay_state
+        if custom_color_overlay:
+            for rect in color_dialog.update(mouse_pos):
+                damage.add(rect)
+        hud_changed = show_hud and update_hud()
+        if hud_changed or show_hud != drawn_hud:
+            damage.add(HUD_RECT)
+        drawn_hud = show_hud
+
+        # ========== Csak a sérült téglalapok kirajzolása ==========
+
+        if damage.has_damage():
+            profiler.lap("draw")
+            rects = damage.collect()
+            profiler.count("damage_rects", len(rects))
+            for rect in rects:
+                draw_scene(screen, rect, final_surf)
+            profiler.lap("flip")
+            pygame.display.update(rects)
+        if journal is not None:
+            update_journal()
+        profiler.end_frame()
+        scheduler.end_frame()
+
+    shutdown()
+    pygame.quit()
+    sys.exit()
 
-pygame.quit()
-sys.exit()
+if __name__ == "__main__":
+    main()
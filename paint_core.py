@@ -0,0 +1,1531 @@
+"""
+PaintMEZ rajzmag: dokumentum-modell (rétegek, alakzatok) és raszterizálás.
+Nem nyit ablakot és nem hív pygame.display-t, így szkriptekből, tesztekből
+vagy szerveren (SDL_VIDEODRIVER=dummy) is importálható.
+"""
+import itertools
+import math
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from contextlib import nullcontext
+
+import pygame
+
+try:
+    import numpy
+except ImportError:  # NumPy nélkül csak a normál keverés és az átlátszóság működik
+    numpy = None
+
+# ========== BEÁLLÍTÁSOK ==========
+
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+
+# A dokumentum (rajzlap) alapmérete: a PaintMEZ ablak vászonterülete. Lehet jóval
+# nagyobb az ablaknál, a rétegek TILE_SIZE-os csempékben tárolódnak, és csak a
+# megrajzolt csempék foglalnak memóriát.
+# A pontok int16-ként tárolódnak, ezért egyik oldal sem lehet 32767-nél nagyobb.
+DOCUMENT_SIZE = (1300, 760)
+TILE_SIZE = 256
+# Egy vonalas alakzat legfeljebb ekkora (pixelszám) segédképre rajzolódik csempézés előtt
+STAMP_MAX_PIXELS = 16 * TILE_SIZE * TILE_SIZE
+
+# Nagyítás: ZOOM_MIN..ZOOM_MAX között, ZOOM_STEP-enként. Kicsinyítéskor a kép a
+# gyorsítótárazott mip-szintekből áll elő (legfeljebb MIP_CACHE_TILES csempe).
+ZOOM_MIN = 1 / 16
+ZOOM_MAX = 8
+ZOOM_STEP = 1.25
+MIP_CACHE_TILES = 256
+
+# Undo-ellenőrzőpontok: minden CHECKPOINT_INTERVAL-edik alakzat után másolat készül
+# a réteg raszteréről; az összes réteg pontjai együtt (a csempéik bájtjai szerint)
+# legfeljebb CHECKPOINT_BUDGET_MB-ot foglalhatnak, afölött a legrégebben készült pont esik ki
+CHECKPOINT_INTERVAL = 50
+CHECKPOINT_BUDGET_MB = 64
+
+# Előzmény-tömörítés: ha egy rétegen HISTORY_MAX_SHAPES-nél több vektoros alakzat vagy
+# HISTORY_MAX_POINTS-nál több vonalpont gyűlik össze, a legutóbbi UNDO_HORIZON alakzatnál
+# régebbiek egyetlen alapraszterbe (RasterShape) égnek be. Ezek már nem vonhatók vissza.
+# Egyszerre legalább HISTORY_MIN_BAKE alakzat kerül be, hogy ne minden új vonal után fusson.
+HISTORY_MAX_SHAPES = 2000
+HISTORY_MAX_POINTS = 500000
+UNDO_HORIZON = 200
+HISTORY_MIN_BAKE = 100
+
+# Szabadkézi vonal / radír utófeldolgozása felengedéskor:
+# 'rdp' (Ramer–Douglas–Peucker), 'decimate' (távolság + szög) vagy None (kikapcsolva)
+STROKE_SIMPLIFY = 'rdp'
+STROKE_TOLERANCE = 1.0      # pixel; ennyinél jobban nem térhet el az egyszerűsített vonal
+STROKE_MIN_ANGLE = 10       # fok; 'decimate' módban ennél kisebb irányváltás elhagyható
+STROKE_SMOOTHING = 0        # Chaikin-simítás lépéseinek száma (0 = nincs)
+
+# Húzás közbeni sűrítés a mintavételezett egérpozíciók között, hogy a gyors vonal ne
+# egyenes húrokból álljon alacsony FPS-nél: 'catmull-rom' (görbe a mintákon át),
+# 'linear' (egyenletes térközű pontok a szakaszokon) vagy None (csak a minták).
+# A beszúrt pontok legfeljebb STROKE_SPACING pixelre vannak egymástól.
+STROKE_INTERPOLATION = 'catmull-rom'
+STROKE_SPACING = 4
+
+# Vödör-kitöltés: egy szomszédos pixel akkor tartozik a kitöltendő területhez, ha
+# egyik csatornája (RGBA) sem tér el a kattintott pixelétől FILL_TOLERANCE-nél jobban (0..255).
+FILL_TOLERANCE = 32
+
+# A rétegenkénti térbeli index rácscelláinak mérete (pixel)
+SHAPE_GRID_CELL = 64
+
+# Rétegek keverési módjai. A nem normál módok és a részleges átlátszóság NumPy-jal,
+# legfeljebb COMPOSITE_BAND_ROWS soros sávokban keverődnek.
+BLEND_MODES = ('normal', 'multiply', 'screen', 'overlay')
+COMPOSITE_BAND_ROWS = TILE_SIZE
+
+# ========== CSEMPÉZETT RASZTER ==========
+
+class TiledRaster:
+    """
+    Egy réteg raszterképe TILE_SIZE méretű csempékre bontva. Csempe csak ott
+    jön létre, ahová rajzoltunk; a hiányzó csempék helyén a háttérszín
+    (vagy átlátszóság) látszik, így a memória a megrajzolt területtel arányos.
+    """
+    def __init__(self, size, background=None):
+        self.rect = pygame.Rect((0, 0), size)
+        self.background = background
+        self.tiles = {}  # (tx, ty) -> SRCALPHA Surface
+
+    def fill_color(self):
+        return self.background if self.background is not None else (0, 0, 0, 0)
+
+    def reset(self, background=None):
+        self.background = background
+        self.tiles.clear()
+
+    def tile_rect(self, key):
+        return pygame.Rect(key[0] * TILE_SIZE, key[1] * TILE_SIZE, TILE_SIZE, TILE_SIZE).clip(self.rect)
+
+    def tile_keys(self, rect):
+        """A rect-et (dokumentum-koordináta) érintő csempék kulcsai."""
+        rect = pygame.Rect(rect).clip(self.rect)
+        if rect.w <= 0 or rect.h <= 0:
+            return []
+        return [(tx, ty)
+                for ty in range(rect.top // TILE_SIZE, (rect.bottom - 1) // TILE_SIZE + 1)
+                for tx in range(rect.left // TILE_SIZE, (rect.right - 1) // TILE_SIZE + 1)]
+
+    def get_tile(self, key):
+        tile = self.tiles.get(key)
+        if tile is None:
+            tile = pygame.Surface(self.tile_rect(key).size, pygame.SRCALPHA)
+            tile.fill(self.fill_color())
+            self.tiles[key] = tile
+        return tile
+
+    def shape_tile_keys(self, shape):
+        """
+        Azok a csempék, amelyeket az alakzat ténylegesen érinthet. Vonalaknál
+        szakaszonként számolunk (a hosszú szakaszokon fél csempényi lépésekben),
+        így egy átlós vonal nem foglalja le a teljes befoglaló téglalapját.
+        """
+        if shape.type == 'raster':
+            # Ugyanaz a csemperács: csak a ténylegesen létező csempék
+            return sorted(shape.raster.tiles)
+        keys = self.tile_keys(shape_bounds(shape))
+        if shape.type not in ('line', 'eraser') or len(keys) <= 4:
+            return keys
+        step = TILE_SIZE // 2
+        pad = shape.thickness + 2
+        last_tx = (self.rect.w - 1) // TILE_SIZE
+        last_ty = (self.rect.h - 1) // TILE_SIZE
+        found = set()
+        pts = shape.points
+        xs, ys = pts[0::2], pts[1::2]
+        for i in range(max(1, len(xs) - 1)):
+            x0, y0 = xs[i], ys[i]
+            x1, y1 = (xs[i + 1], ys[i + 1]) if i + 1 < len(xs) else (x0, y0)
+            n = max(1, int(max(abs(x1 - x0), abs(y1 - y0)) // step))
+            for j in range(n):
+                # A rész-szakasz befoglaló téglalapja, a vastagsággal megnövelve
+                ax = x0 + (x1 - x0) * j // n
+                ay = y0 + (y1 - y0) * j // n
+                bx = x0 + (x1 - x0) * (j + 1) // n
+                by = y0 + (y1 - y0) * (j + 1) // n
+                tx0 = max(0, (min(ax, bx) - pad) // TILE_SIZE)
+                tx1 = min(last_tx, (max(ax, bx) + pad) // TILE_SIZE)
+                ty0 = max(0, (min(ay, by) - pad) // TILE_SIZE)
+                ty1 = min(last_ty, (max(ay, by) + pad) // TILE_SIZE)
+                for ty in range(ty0, ty1 + 1):
+                    for tx in range(tx0, tx1 + 1):
+                        found.add((tx, ty))
+        return sorted(found)
+
+    def _draw_on_tile(self, tile, tr, shape, stamps):
+        """
+        Egy alakzat egy csempére. A vonalakat a pygame a felület szélére vágja,
+        ami eltolja a raszterizálást; ezért a több csempén átnyúló vonalas
+        alakzatok előbb a saját befoglaló téglalapjukra rajzolódnak (stamp),
+        és az kerül a csempékre. Így a kép pontosan ugyanaz, mint egy nagy
+        felületen. STAMP_MAX_PIXELS fölött közvetlenül rajzolunk; ott a
+        csempehatáron egy-egy pixeles eltérés előfordulhat.
+        """
+        bounds = shape_bounds(shape)
+        if (0 < bounds.w * bounds.h <= STAMP_MAX_PIXELS and not tr.contains(bounds)
+                and shape_needs_stamp(shape)):
+            stamp = stamps.get(id(shape))
+            if stamp is None:
+                stamp = pygame.Surface(bounds.size, pygame.SRCALPHA)
+                draw_shape_item(stamp, shape, (-bounds.x, -bounds.y))
+                stamps[id(shape)] = stamp
+            tile.blit(stamp, (bounds.x - tr.x, bounds.y - tr.y))
+        else:
+            draw_shape_item(tile, shape, (-tr.x, -tr.y))
+
+    def draw_shape(self, shape):
+        """Az alakzat rárajzolása minden érintett csempére."""
+        stamps = {}
+        for key in self.shape_tile_keys(shape):
+            self._draw_on_tile(self.get_tile(key), self.tile_rect(key), shape, stamps)
+
+    def redraw_region(self, rect, shapes):
+        """
+        A rect területének újrarajzolása a háttérből és a shapes alakzatokból.
+        A vágás (set_clip) megváltoztatja, hogyan rajzolja a pygame a vastag
+        vonalakat és a körvonalakat, ezért az alakzatok vágás nélkül, egy
+        háttérszínű munkacsempére kerülnek, és arról csak a rect része másolódik vissza.
+        """
+        stamps = {}
+        for key in self.tile_keys(rect):
+            tr = self.tile_rect(key)
+            touching = [shape for shape in shapes if shape_bounds(shape).colliderect(tr)]
+            if key not in self.tiles:
+                # Üres csempére csak akkor kell rajzolni, ha egy alakzat tényleg eléri
+                touching = [shape for shape in touching if key in self.shape_tile_keys(shape)]
+                if not touching:
+                    continue
+            tile = self.get_tile(key)
+            local = pygame.Rect(rect).clip(tr).move(-tr.x, -tr.y)
+            scratch = pygame.Surface(tr.size, pygame.SRCALPHA)
+            scratch.fill(self.fill_color())
+            for shape in touching:
+                self._draw_on_tile(scratch, tr, shape, stamps)
+            # Keverés nélküli másolás: kinullázott célra az összeadás pontosan a forrást adja
+            tile.fill((0, 0, 0, 0), local)
+            tile.blit(scratch, local, local, special_flags=pygame.BLEND_RGBA_ADD)
+
+    def blit_to(self, dest, area, dest_pos):
+        """Az area (dokumentum-koordináta) tartalmát dest-re rajzolja dest_pos-tól, csempénként."""
+        area = pygame.Rect(area)
+        for key in self.tile_keys(area):
+            tr = self.tile_rect(key)
+            part = area.clip(tr)
+            pos = (dest_pos[0] + part.x - area.x, dest_pos[1] + part.y - area.y)
+            tile = self.tiles.get(key)
+            if tile is not None:
+                dest.blit(tile, pos, part.move(-tr.x, -tr.y))
+            elif self.background is not None:
+                # Átlátszatlan háttér: a kitöltés ugyanazt adja, mint a blit
+                dest.fill(self.background, (pos, part.size))
+
+    def copy(self):
+        clone = TiledRaster(self.rect.size, self.background)
+        clone.tiles = {key: tile.copy() for key, tile in self.tiles.items()}
+        return clone
+
+    def nbytes(self):
+        return sum(tile.get_pitch() * tile.get_height() for tile in self.tiles.values())
+
+# ========== RÉTEGEK ==========
+
+class ShapeIndex:
+    """
+    Egyenletes rács az alakzatok befoglaló téglalapjai fölött. Az alakzatokat
+    a réteg shapes listájában elfoglalt helyükkel (indexükkel) tárolja, így a
+    lekérdezés eredménye rajzolási sorrendbe rendezhető. Az extend()-del
+    tömegesen felvett téglalapok (fájl betöltése) csak az első lekérdezéskor
+    kerülnek a rácsba.
+    """
+    def __init__(self, cell_size=SHAPE_GRID_CELL):
+        self.cell_size = cell_size
+        self.cells = {}   # (cx, cy) -> alakzat-indexek listája
+        self.bounds = []  # index -> pygame.Rect
+        self.indexed = 0  # az első ennyi téglalap van benne a rácsban
+
+    def _cells(self, rect):
+        cs = self.cell_size
+        for cx in range(rect.left // cs, (rect.right - 1) // cs + 1):
+            for cy in range(rect.top // cs, (rect.bottom - 1) // cs + 1):
+                yield (cx, cy)
+
+    @staticmethod
+    def _normalized(rect):
+        rect = pygame.Rect(rect)
+        rect.w = max(rect.w, 1)
+        rect.h = max(rect.h, 1)
+        return rect
+
+    def append(self, rect):
+        self.bounds.append(self._normalized(rect))
+        if self.indexed == len(self.bounds) - 1:
+            self._index_pending()
+
+    def extend(self, rects):
+        """Sok téglalap felvétele egyszerre; a rácsba csak az első lekérdezéskor kerülnek."""
+        self.bounds.extend(self._normalized(rect) for rect in rects)
+
+    def _index_pending(self):
+        cells = self.cells
+        for index in range(self.indexed, len(self.bounds)):
+            for key in self._cells(self.bounds[index]):
+                bucket = cells.get(key)
+                if bucket is None:
+                    cells[key] = [index]
+                else:
+                    bucket.append(index)
+        self.indexed = len(self.bounds)
+
+    def pop(self):
+        """Az utoljára felvett alakzat eltávolítása (ez mindig a cellalisták végén van); visszaadja a téglalapját."""
+        rect = self.bounds.pop()
+        if self.indexed > len(self.bounds):
+            self.indexed = len(self.bounds)
+            for key in self._cells(rect):
+                bucket = self.cells[key]
+                bucket.pop()
+                if not bucket:
+                    del self.cells[key]
+        return rect
+
+    def clear(self):
+        self.cells.clear()
+        self.bounds.clear()
+        self.indexed = 0
+
+    def query(self, rect):
+        """A rect-tel átfedő alakzatok indexei, növekvő (rajzolási) sorrendben."""
+        rect = pygame.Rect(rect)
+        if rect.w <= 0 or rect.h <= 0:
+            return []
+        if self.indexed < len(self.bounds):
+            self._index_pending()
+        found = set()
+        for key in self._cells(rect):
+            for index in self.cells.get(key, ()):
+                if index not in found and self.bounds[index].colliderect(rect):
+                    found.add(index)
+        return sorted(found)
+
+    def query_point(self, pos):
+        if self.indexed < len(self.bounds):
+            self._index_pending()
+        key = (pos[0] // self.cell_size, pos[1] // self.cell_size)
+        return [i for i in self.cells.get(key, ()) if self.bounds[i].collidepoint(pos)]
+
+class Layer:
+    def __init__(self, name="Layer", background_color=None):
+        self.name = name
+        self.document = None  # A tartalmazó Document; Document.add_layer() állítja be
+        self._background_color = background_color
+        self.shapes = []
+        self.redo_stack = []
+        self._visible = True
+        self._opacity = 1.0
+        self._blend_mode = 'normal'
+
+        # Raszter-gyorsítótár (TiledRaster): a réteg kirajzolt képe, csak változáskor épül újra
+        self.cache = None
+        self.cache_valid = False
+        # (alakzatok száma, raszter-másolat, készítési sorszám) hármasok, növekvő sorrendben
+        self.checkpoints = []
+        self.index = ShapeIndex()
+
+    @property
+    def visible(self):
+        return self._visible
+
+    @visible.setter
+    def visible(self, value):
+        if value != self._visible:
+            self._visible = value
+            self.notify()
+
+    @property
+    def opacity(self):
+        return self._opacity
+
+    @opacity.setter
+    def opacity(self, value):
+        # Csak az összesítést érinti, a réteg raszterét nem
+        value = max(0.0, min(1.0, float(value)))
+        if value != self._opacity:
+            self._opacity = value
+            self.notify()
+
+    @property
+    def blend_mode(self):
+        return self._blend_mode
+
+    @blend_mode.setter
+    def blend_mode(self, mode):
+        if mode not in BLEND_MODES:
+            raise ValueError(f"Ismeretlen keverési mód: {mode!r} (lehet: {', '.join(BLEND_MODES)})")
+        if mode != self._blend_mode:
+            self._blend_mode = mode
+            self.notify()
+
+    @property
+    def background_color(self):
+        return self._background_color
+
+    @background_color.setter
+    def background_color(self, color):
+        self._background_color = color
+        self.checkpoints.clear()
+        self.invalidate()
+
+    def invalidate(self):
+        """A réteg gyorsítótárát (és az összesített képet) újraépítendőnek jelöli."""
+        self.cache_valid = False
+        self.notify()
+
+    def notify(self, rect=None, shape=None):
+        """A dokumentum nézeteinek értesítése: rect=None esetén az egész réteg változott."""
+        if self.document is not None:
+            self.document.layer_changed(self, rect, shape)
+
+    @property
+    def size(self):
+        return self.document.size if self.document is not None else DOCUMENT_SIZE
+
+    def add_shape(self, shape):
+        """Új alakzat hozzáadása: a gyorsítótárra csak ez az egy alakzat rajzolódik rá."""
+        self.shapes.append(shape)
+        self.index.append(shape_bounds(shape))
+        if not self.cache_valid:
+            self.notify()
+            return
+        self.cache.draw_shape(shape)
+        self.maybe_checkpoint(len(self.shapes))
+        self.notify(shape_bounds(shape), shape)
+
+    def pop_shape(self):
+        """
+        Az utolsó alakzat levétele (undo); a nála újabb ellenőrzőpontok elvesznek.
+        Érvényes gyorsítótárnál csak az alakzat területe rajzolódik újra, ha ott
+        kevesebb alakzat van, mint amennyit az ellenőrzőpontról kellene visszajátszani.
+        """
+        shape = self.shapes.pop()
+        bounds = self.index.pop()
+        self.drop_checkpoints_after(len(self.shapes))
+        if self.cache_valid and shape.type != 'loaded_image':
+            candidates = self.index.query(bounds)
+            tail = len(self.shapes) - (self.checkpoints[-1][0] if self.checkpoints else 0)
+            if len(candidates) <= tail:
+                self.redraw_region(bounds, candidates)
+                return shape
+        self.invalidate()
+        return shape
+
+    def can_undo(self):
+        """Van-e visszavonható alakzat (a beégetett alapraszter nem az)."""
+        return bool(self.shapes) and self.shapes[-1].type != 'raster'
+
+    def history_size(self):
+        """
+        (vektoros alakzatok száma, vonalpontok száma) a rétegen, a redo-vermet
+        nem számolva; a kitöltések szakaszai pontnak számítanak.
+        """
+        shapes = points = 0
+        for shape in self.shapes:
+            if shape.type in ('line', 'eraser', 'fill'):
+                points += len(shape)
+            if shape.type != 'raster':
+                shapes += 1
+        return shapes, points
+
+    def compaction_count(self, max_shapes=None, max_points=None, horizon=None, min_bake=None):
+        """
+        Hány alakzatot kellene most beégetni (compact()); 0, ha egyik korlát
+        sincs túllépve, vagy a horizonton túl még kevesebb mint min_bake alakzat van.
+        A meg nem adott korlátok a HISTORY_* / UNDO_HORIZON beállításokból jönnek.
+        """
+        max_shapes = HISTORY_MAX_SHAPES if max_shapes is None else max_shapes
+        max_points = HISTORY_MAX_POINTS if max_points is None else max_points
+        horizon = UNDO_HORIZON if horizon is None else horizon
+        min_bake = HISTORY_MIN_BAKE if min_bake is None else min_bake
+        shapes, points = self.history_size()
+        if shapes <= max_shapes and points <= max_points:
+            return 0
+        count = len(self.shapes) - horizon
+        has_base = bool(self.shapes) and self.shapes[0].type == 'raster'
+        return count if count - has_base >= min_bake else 0
+
+    def compact(self, count):
+        """
+        Az első count alakzat beégetése egy alapraszterbe, ami a lista elejére
+        kerül (a korábbi alapraszter is beleolvad). A kép nem változik, ezért a
+        gyorsítótár érvényes marad; az ellenőrzőpontok sorszámai eltolódnak.
+        """
+        count = min(count, len(self.shapes))
+        if count <= 0 or (count == 1 and self.shapes[0].type == 'raster'):
+            return
+        base = TiledRaster(self.size)
+        baked = 0
+        for shape in self.shapes[:count]:
+            base.draw_shape(shape)
+            baked += shape.baked if shape.type == 'raster' else 1
+        merged = [RasterShape(base, baked)] if base.tiles else []
+        self.shapes[:count] = merged
+        rects = self.index.bounds[count:]
+        self.index.clear()
+        self.index.extend([shape_bounds(shape) for shape in merged] + rects)
+        shift = count - len(merged)
+        self.checkpoints = [(n - shift, snapshot, serial) for n, snapshot, serial in self.checkpoints if n >= count]
+
+    def clear(self):
+        self.shapes.clear()
+        self.redo_stack.clear()
+        self.checkpoints.clear()
+        self.index.clear()
+        self.invalidate()
+
+    def snapshot(self, include_raster=False):
+        """
+        Független másolat háttérben mentéshez. Az alakzatok nem változnak
+        létrehozásuk után, ezért azokat megosztja, csak a listákat másolja.
+        """
+        clone = Layer(name=self.name, background_color=self.background_color)
+        clone._visible = self._visible
+        clone._opacity = self._opacity
+        clone._blend_mode = self._blend_mode
+        clone.shapes = list(self.shapes)
+        clone.redo_stack = list(self.redo_stack)
+        clone.index.extend(self.index.bounds)
+        if include_raster:
+            clone.cache = self.render().copy()
+            clone.cache_valid = True
+        return clone
+
+    def shapes_in(self, rect):
+        """A rect-et érintő alakzatok, rajzolási sorrendben."""
+        return [self.shapes[i] for i in self.index.query(rect)]
+
+    def shapes_at(self, pos):
+        """A pos alatti alakzatok, a legfelsővel kezdve (későbbi kijelölő eszközökhöz)."""
+        hits = [self.shapes[i] for i in self.index.query_point(pos)]
+        return [shape for shape in reversed(hits) if shape_hit(shape, pos)]
+
+    def redraw_region(self, rect, candidates=None):
+        """
+        A gyorsítótár egy részének újrarajzolása: csak a rect-et érintő
+        alakzatok kerülnek rá, a rect-re vágva. Az összesített képen is
+        csak ez a rész frissül.
+        """
+        rect = pygame.Rect(rect).clip(pygame.Rect((0, 0), self.size))
+        if not self.cache_valid or rect.w <= 0 or rect.h <= 0:
+            self.invalidate()
+            return
+        if candidates is None:
+            candidates = self.index.query(rect)
+        self.cache.redraw_region(rect, [self.shapes[i] for i in candidates])
+        self.notify(rect)
+
+    def maybe_checkpoint(self, count):
+        """Ellenőrzőpontot készít, ha a cache most pontosan count alakzatot tartalmaz, és az intervallum ezt kéri."""
+        if count == 0 or count % CHECKPOINT_INTERVAL:
+            return
+        if self.checkpoints and self.checkpoints[-1][0] >= count:
+            return
+        self.checkpoints.append((count, self.cache.copy(), next(_checkpoint_serial)))
+        enforce_checkpoint_budget(self.document.layers if self.document is not None else [self])
+
+    def drop_checkpoints_after(self, count):
+        while self.checkpoints and self.checkpoints[-1][0] > count:
+            self.checkpoints.pop()
+
+    def render(self):
+        """
+        Visszaadja a réteg raszterét, szükség esetén újraépítve. Az újraépítés
+        a legközelebbi ellenőrzőpontról indul, és csak az utána jövő alakzatokat
+        rajzolja újra.
+        """
+        if self.cache is None:
+            self.cache = TiledRaster(self.size, self.background_color)
+        if not self.cache_valid:
+            start = 0
+            if self.checkpoints:
+                start, snapshot, _ = self.checkpoints[-1]
+                # Másolat kell, mert a cache-re tovább rajzolunk
+                self.cache = snapshot.copy()
+            else:
+                self.cache.reset(self.background_color)
+            for i in range(start, len(self.shapes)):
+                self.cache.draw_shape(self.shapes[i])
+                self.maybe_checkpoint(i + 1)
+            self.cache_valid = True
+        return self.cache
+
+# Az ellenőrzőpontok készítési sorrendje (minden rétegen közös számláló)
+_checkpoint_serial = itertools.count()
+
+def checkpoint_bytes(layer):
+    return sum(snap.nbytes() for _, snap, _ in layer.checkpoints)
+
+def enforce_checkpoint_budget(layers):
+    """
+    A keretet túllépő ellenőrzőpontok kiejtése: amíg az összes réteg pontjainak
+    mérete (csempe-bájtokban) nagyobb a keretnél, a legrégebben készült pont
+    esik ki, bármelyik rétegen van. Egy rétegen belül mindig az első a legrégebbi.
+    """
+    budget = CHECKPOINT_BUDGET_MB * 1024 * 1024
+    total = sum(checkpoint_bytes(l) for l in layers)
+    while total > budget:
+        holders = [l for l in layers if l.checkpoints]
+        if not holders:
+            break
+        victim = min(holders, key=lambda l: l.checkpoints[0][2])
+        total -= victim.checkpoints.pop(0)[1].nbytes()
+
+# ========== RÉTEGEK ÖSSZESÍTÉSE ==========
+
+def composite_layers(layers, dest, area, dest_pos=(0, 0), profiler=None):
+    """
+    A látható rétegek area (dokumentum-koordináta) részének összesítése dest-re,
+    dest_pos-tól. A célterületnek átlátszónak kell lennie. Ha minden réteg normál
+    módú és teljesen fedő, rétegenként blit-elünk; egyébként NumPy-jal keverünk,
+    ami normál módban, 100%-on pixelre ugyanazt adja, mint a blit.
+    """
+    area = pygame.Rect(area)
+    layers = [layer for layer in layers if layer.visible and layer.opacity > 0]
+    if area.w <= 0 or area.h <= 0 or not layers:
+        return
+    plain = all(layer.blend_mode == 'normal' and layer.opacity >= 1 for layer in layers)
+    if numpy is not None and not plain:
+        for top in range(area.top, area.bottom, COMPOSITE_BAND_ROWS):
+            band = pygame.Rect(area.x, top, area.w, min(COMPOSITE_BAND_ROWS, area.bottom - top))
+            _composite_band(layers, dest, band, (dest_pos[0], dest_pos[1] + top - area.top), profiler)
+        return
+    for layer in layers:
+        with profiler.stage("redraw/" + layer.name) if profiler is not None else nullcontext():
+            if layer.opacity >= 1:
+                layer.render().blit_to(dest, area, dest_pos)
+            else:
+                # NumPy nélkül: az átlátszóság felület-alfával, a keverési mód normálként
+                part = pygame.Surface(area.size, pygame.SRCALPHA)
+                layer.render().blit_to(part, area, (0, 0))
+                part.set_alpha(round(layer.opacity * 255))
+                dest.blit(part, dest_pos)
+
+def _blend(mode, backdrop, source):
+    """A keverési függvény B(Cb, Cs) 0..255 egész színekre."""
+    if mode == 'multiply':
+        return (backdrop * source + 127) // 255
+    if mode == 'screen':
+        return backdrop + source - (backdrop * source + 127) // 255
+    if mode == 'overlay':
+        return numpy.where(backdrop < 128, (2 * backdrop * source + 127) // 255,
+                           255 - (2 * (255 - backdrop) * (255 - source) + 127) // 255)
+    return source
+
+def _composite_band(layers, dest, area, dest_pos, profiler):
+    part = pygame.Surface(area.size, pygame.SRCALPHA)
+    color = numpy.zeros((area.w, area.h, 3), numpy.int32)
+    alpha = numpy.zeros((area.w, area.h), numpy.int32)
+    for layer in layers:
+        with profiler.stage("redraw/" + layer.name) if profiler is not None else nullcontext():
+            part.fill((0, 0, 0, 0))
+            layer.render().blit_to(part, area, (0, 0))
+            src = pygame.surfarray.array3d(part).astype(numpy.int32)
+            src_a = pygame.surfarray.array_alpha(part).astype(numpy.int32)
+            if layer.opacity < 1:
+                src_a = (src_a * round(layer.opacity * 255) + 127) // 255
+            if layer.blend_mode != 'normal':
+                # Ahol az alatta lévő kép átlátszó, a réteg saját színe látszik
+                blended = _blend(layer.blend_mode, color, src)
+                src = src + (blended - src) * alpha[..., None] // 255
+            # A pygame SRCALPHA -> SRCALPHA blit-jének képlete, egész aritmetikával
+            sa = src_a[..., None]
+            mixed = (((src - color) * sa + src) >> 8) + color
+            empty = alpha == 0
+            mixed[empty] = src[empty]
+            alpha = numpy.where(empty, src_a, src_a + alpha - (src_a * alpha) // 255)
+            color = mixed
+    pygame.surfarray.pixels3d(part)[...] = color
+    pygame.surfarray.pixels_alpha(part)[...] = alpha
+    # Átlátszó célra a blit pontosan másol
+    dest.blit(part, dest_pos)
+
+# ========== DOKUMENTUM ==========
+
+class Document:
+    """
+    A rétegek listája és a rajzlap mérete. A rétegek változásairól értesíti
+    a feliratkozott nézeteket (CanvasView), így a modell ablak nélkül is használható.
+    """
+    def __init__(self, size=DOCUMENT_SIZE):
+        self.size = tuple(size)
+        self.layers = []
+        self.views = []
+
+    def add_layer(self, layer, index=None):
+        layer.document = self
+        if index is None:
+            self.layers.append(layer)
+        else:
+            self.layers.insert(index, layer)
+        self.changed()
+        return layer
+
+    def remove_layer(self, index):
+        layer = self.layers.pop(index)
+        layer.document = None
+        self.changed()
+        return layer
+
+    def snapshot(self, include_rasters=False):
+        """A rétegek pillanatképe nézetek nélkül (lásd Layer.snapshot)."""
+        clone = Document(self.size)
+        for layer in self.layers:
+            clone.add_layer(layer.snapshot(include_rasters))
+        return clone
+
+    def replace_with(self, other):
+        """
+        Egy másik (pl. fájlból betöltött) dokumentum méretének és rétegeinek
+        átvétele. A layers lista ugyanaz az objektum marad, a nézetek feliratkozva maradnak.
+        """
+        for layer in self.layers:
+            layer.document = None
+        self.size = tuple(other.size)
+        self.layers[:] = other.layers
+        for layer in self.layers:
+            layer.document = self
+        other.layers = []
+        for view in self.views:
+            view.document_resized()
+        self.changed()
+
+    def changed(self):
+        """Az egész dokumentum változott (réteg hozzáadása, törlése)."""
+        for view in self.views:
+            view.invalidate()
+
+    def layer_changed(self, layer, rect=None, shape=None):
+        for view in self.views:
+            view.layer_changed(layer, rect, shape)
+
+    def flatten(self):
+        """A látható rétegek összesített képe a teljes dokumentum méretében."""
+        surf = pygame.Surface(self.size, pygame.SRCALPHA)
+        composite_layers(self.layers, surf, surf.get_rect())
+        return surf
+
+    def render(self, size=None):
+        """Az összesített kép, kérésre a megadott méretre kicsinyítve / nagyítva."""
+        surf = self.flatten()
+        if size is not None and tuple(size) != self.size:
+            surf = pygame.transform.smoothscale(surf, size)
+        return surf
+
+def document_from_image(image, name="Base Layer"):
+    """Egy bitképből egyrétegű dokumentum (a régi PNG-mentések betöltéséhez)."""
+    document = Document(image.get_size())
+    layer = document.add_layer(Layer(name=name))
+    layer.add_shape(LoadedImageShape(image))
+    return document
+
+def load_document(filename):
+    """Egy mentett dokumentum betöltése: PaintMEZ projektfájl (.pmez) vagy bitkép (PNG stb.)."""
+    # Késleltetett import: a paint_project maga is a paint_core-ra épül
+    from paint_project import is_project_file, load_project
+    if is_project_file(filename):
+        return load_project(filename)
+    return document_from_image(pygame.image.load(filename))
+
+# ========== ALAKZATOK ==========
+
+# Az alakzatok __slots__-os osztályok, nem dict-ek: egy alakzat néhány mezőből
+# áll, a szabadkézi vonal pontjai pedig egyetlen tömörített array('h')-ban
+# vannak (x0, y0, x1, y1, ...), pontonként 4 bájton, tuple-objektumok nélkül.
+
+class Shape:
+    __slots__ = ()
+    type = None
+
+    def fields(self):
+        return tuple(getattr(self, name) for cls in type(self).__mro__
+                     for name in getattr(cls, '__slots__', ()))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.fields() == other.fields()
+
+    __hash__ = None
+
+class BoxShape(Shape):
+    """Téglalap vagy ellipszis két sarokpontja és stílusa."""
+    __slots__ = ('start', 'end', 'color', 'fill', 'thickness')
+
+    def __init__(self, start, end, color, fill, thickness):
+        self.start = start
+        self.end = end
+        self.color = color
+        self.fill = fill
+        self.thickness = thickness
+
+    def box(self):
+        sx, sy = self.start
+        ex, ey = self.end
+        return min(sx, ex), min(sy, ey), abs(sx - ex), abs(sy - ey)
+
+class RectShape(BoxShape):
+    __slots__ = ()
+    type = 'rect'
+
+class EllipseShape(BoxShape):
+    __slots__ = ()
+    type = 'ellipse'
+
+def pack_points(points):
+    """(x, y) párok listája -> lapos array('h')."""
+    packed = array('h')
+    for x, y in points:
+        packed.append(x)
+        packed.append(y)
+    return packed
+
+class StrokeShape(Shape):
+    __slots__ = ('points', 'color', 'thickness')
+
+    def __init__(self, points, color, thickness):
+        self.points = points if isinstance(points, array) else pack_points(points)
+        self.color = color
+        self.thickness = thickness
+
+    def __len__(self):
+        return len(self.points) // 2
+
+    def point_list(self):
+        """A pontok (x, y) párokként, a pygame.draw hívásokhoz."""
+        pts = self.points
+        return list(zip(pts[0::2], pts[1::2]))
+
+class LineShape(StrokeShape):
+    __slots__ = ()
+    type = 'line'
+
+class EraserShape(StrokeShape):
+    __slots__ = ()
+    type = 'eraser'
+
+    def __init__(self, points, thickness):
+        super().__init__(points, WHITE, thickness)
+
+class LoadedImageShape(Shape):
+    __slots__ = ('surface',)
+    type = 'loaded_image'
+
+    def __init__(self, surface):
+        self.surface = surface
+
+class RasterShape(Shape):
+    """
+    Beégetett korábbi alakzatok képe (előzmény-tömörítés, Layer.compact()).
+    Mindig a réteg legalsó alakzata; a raszter háttér nélküli, és létrehozás
+    után nem változik, így a pillanatképek megoszthatják.
+    """
+    __slots__ = ('raster', 'baked', 'bounds')
+    type = 'raster'
+
+    def __init__(self, raster, baked):
+        self.raster = raster
+        self.baked = baked      # ennyi eredeti alakzat van benne
+        bounds = None
+        for key in raster.tiles:
+            rect = raster.tile_rect(key)
+            bounds = rect if bounds is None else bounds.union(rect)
+        self.bounds = bounds if bounds is not None else pygame.Rect(0, 0, 0, 0)
+
+class FillShape(Shape):
+    """
+    Vödör-kitöltés eredménye sorfolytonos (run-length) maszkként: a runs
+    (y, x0, x1) hármasok lapos array('h')-ja, y majd x0 szerint rendezve,
+    az x1 már nincs benne. A maszk egyszínű, átlátszatlan.
+    """
+    __slots__ = ('runs', 'color', 'bounds')
+    type = 'fill'
+
+    def __init__(self, runs, color, bounds=None):
+        self.runs = runs if isinstance(runs, array) else array('h', runs)
+        self.color = color
+        if bounds is None:
+            bounds = pygame.Rect(0, 0, 0, 0)
+            if self.runs:
+                ys, x0s, x1s = self.runs[0::3], self.runs[1::3], self.runs[2::3]
+                bounds = pygame.Rect(min(x0s), ys[0], max(x1s) - min(x0s), ys[-1] - ys[0] + 1)
+        self.bounds = bounds
+
+    def __len__(self):
+        return len(self.runs) // 3
+
+    def first_run(self, y):
+        """Az első olyan szakasz sorszáma, amelynek sora legalább y (bináris kereséssel)."""
+        runs = self.runs
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if runs[3 * mid] < y:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+def make_shape(stype, start=None, end=None, points=None, color=BLACK, fill=True, thickness=1):
+    if stype == 'rect':
+        return RectShape(start, end, color, fill, thickness)
+    elif stype == 'ellipse':
+        return EllipseShape(start, end, color, fill, thickness)
+    elif stype == 'line':
+        return LineShape(points, color, thickness)
+    elif stype == 'eraser':
+        return EraserShape(points, thickness)
+
+def draw_shape_item(surface, item, offset=(0, 0)):
+    """Az alakzat kirajzolása; offset-tel eltolva, ha a surface nem a dokumentum (0, 0) pontjánál kezdődik."""
+    stype = item.type
+    ox, oy = offset
+    if stype == 'loaded_image':
+        surface.blit(item.surface, offset)
+        return
+    if stype == 'raster':
+        item.raster.blit_to(surface, pygame.Rect((-ox, -oy), surface.get_size()), (0, 0))
+        return
+    if stype == 'fill':
+        # Csak a felületre eső sorok szakaszai, szakaszonként egy fill(); a
+        # téglalapot előre vágjuk, mert a fill() negatív x-nél nem vág helyesen
+        runs, color = item.runs, item.color
+        clip = surface.get_clip()
+        bottom = clip.bottom - oy
+        for i in range(3 * item.first_run(clip.top - oy), len(runs), 3):
+            y = runs[i]
+            if y >= bottom:
+                break
+            surface.fill(color, clip.clip(runs[i + 1] + ox, y + oy, runs[i + 2] - runs[i + 1], 1))
+        return
+
+    th = item.thickness
+    if stype in ('rect', 'ellipse'):
+        left, top, width, height = item.box()
+        rect = (left + ox, top + oy, width, height)
+        if stype == 'rect':
+            if item.fill:
+                pygame.draw.rect(surface, item.color, rect)
+            else:
+                pygame.draw.rect(surface, item.color, rect, th)
+        else:  # ellipse
+            if item.fill:
+                pygame.draw.ellipse(surface, item.color, rect)
+            else:
+                pygame.draw.ellipse(surface, item.color, rect, th)
+
+    elif stype in ('line', 'eraser'):
+        if len(item) > 1:
+            points = item.point_list()
+            if ox or oy:
+                points = [(x + ox, y + oy) for x, y in points]
+            pygame.draw.lines(surface, item.color, False, points, th)
+
+def shape_hit(item, pos):
+    """Pontos találatvizsgálat egy alakzatra (a befoglaló téglalapon túl)."""
+    x, y = pos
+    stype = item.type
+    if stype == 'loaded_image':
+        return item.surface.get_rect().collidepoint(pos)
+    if stype == 'raster':
+        tile = item.raster.tiles.get((x // TILE_SIZE, y // TILE_SIZE))
+        return tile is not None and tile.get_at((x % TILE_SIZE, y % TILE_SIZE)).a > 0
+    if stype == 'fill':
+        runs = item.runs
+        for i in range(3 * item.first_run(y), len(runs), 3):
+            if runs[i] != y or runs[i + 1] > x:
+                return False
+            if x < runs[i + 2]:
+                return True
+        return False
+    if stype in ('rect', 'ellipse'):
+        left, top, width, height = item.box()
+        if not pygame.Rect(left, top, width + 1, height + 1).collidepoint(pos):
+            return False
+        if stype == 'ellipse':
+            rx, ry = max(width / 2, 0.5), max(height / 2, 0.5)
+            dx, dy = (x - left - rx) / rx, (y - top - ry) / ry
+            if dx * dx + dy * dy > 1:
+                return False
+            if not item.fill:
+                inner_rx, inner_ry = rx - item.thickness, ry - item.thickness
+                return (inner_rx <= 0 or inner_ry <= 0
+                        or ((x - left - rx) / inner_rx) ** 2 + ((y - top - ry) / inner_ry) ** 2 >= 1)
+            return True
+        if not item.fill:
+            th = item.thickness
+            return not pygame.Rect(left + th, top + th, width - 2 * th, height - 2 * th).collidepoint(pos)
+        return True
+    reach = item.thickness / 2 + 1
+    pts = item.point_list()
+    return any(_point_segment_distance(pos, a, b) <= reach for a, b in zip(pts, pts[1:]))
+
+def shape_needs_stamp(item):
+    """Vonalakból álló alakzat-e (ezeknél számít, hol vágja a pygame a rajzolást)."""
+    return item.type in ('line', 'eraser') or (item.type in ('rect', 'ellipse') and not item.fill)
+
+def shape_bounds(item):
+    """Az alakzat által (legfeljebb) érintett terület a vásznon, pygame.Rect-ként."""
+    stype = item.type
+    if stype == 'loaded_image':
+        return item.surface.get_rect()
+    if stype in ('raster', 'fill'):
+        return pygame.Rect(item.bounds)
+    if stype in ('rect', 'ellipse'):
+        left, top, width, height = item.box()
+        return pygame.Rect(left, top, width + 1, height + 1)
+    xs = item.points[0::2]
+    ys = item.points[1::2]
+    pad = item.thickness + 2
+    return pygame.Rect(min(xs) - pad, min(ys) - pad, max(xs) - min(xs) + 2 * pad, max(ys) - min(ys) + 2 * pad)
+
+# ========== VONAL-EGYSZERŰSÍTÉS ==========
+
+def _point_segment_distance(p, a, b):
+    ax, ay = a
+    dx, dy = b[0] - ax, b[1] - ay
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return math.hypot(p[0] - ax, p[1] - ay)
+    t = max(0.0, min(1.0, ((p[0] - ax) * dx + (p[1] - ay) * dy) / length_sq))
+    return math.hypot(p[0] - (ax + t * dx), p[1] - (ay + t * dy))
+
+def rdp_points(points, tolerance):
+    """Ramer–Douglas–Peucker, verem alapon (hosszú vonalnál sincs rekurziós mélység)."""
+    if len(points) < 3:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_dist = -1.0
+        index = first
+        for i in range(first + 1, last):
+            d = _point_segment_distance(points[i], points[first], points[last])
+            if d > max_dist:
+                max_dist = d
+                index = i
+        if max_dist > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [p for p, k in zip(points, keep) if k]
+
+def decimate_points(points, min_distance, min_angle):
+    """
+    Elhagyja azokat a pontokat, amelyek min_distance-nél közelebb vannak az
+    előző megtartotthoz, vagy ahol az irány min_angle foknál kevésbé változik.
+    Egy csúcs csak akkor vonható össze, ha az előző csúcs óta elhagyott összes
+    pont min_distance-en belül marad az új szakasztól, így a hiba nem halmozódik.
+    """
+    if len(points) < 3:
+        return list(points)
+    result = [points[0]]
+    since_prev = []     # az utolsó előtti és az utolsó csúcs között elhagyott pontok
+    since_last = []     # az utolsó csúcs óta (túl közel lévőként) elhagyott pontok
+    for p in points[1:-1]:
+        last = result[-1]
+        if math.hypot(p[0] - last[0], p[1] - last[1]) < min_distance:
+            since_last.append(p)
+            continue
+        if len(result) > 1:
+            prev = result[-2]
+            a1 = math.atan2(last[1] - prev[1], last[0] - prev[0])
+            a2 = math.atan2(p[1] - last[1], p[0] - last[0])
+            turn = abs((math.degrees(a2 - a1) + 180) % 360 - 180)
+            dropped = since_prev + [last] + since_last
+            # Hosszú egyenesen sem nő korlátlanul az ellenőrzendő lista (legfeljebb 32 pont)
+            if (turn < min_angle and len(dropped) <= 32
+                    and all(_point_segment_distance(q, prev, p) <= min_distance for q in dropped)):
+                # Egyenesen folytatódik: a középső pont helyére az új kerül
+                result[-1] = p
+                since_prev, since_last = dropped, []
+                continue
+        result.append(p)
+        since_prev, since_last = since_last, []
+    result.append(points[-1])
+    return result
+
+def smooth_points(points, iterations):
+    """Chaikin-féle sarokvágás; a két végpont marad a helyén."""
+    for _ in range(iterations):
+        if len(points) < 3:
+            break
+        smoothed = [points[0]]
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            smoothed.append((0.75 * x0 + 0.25 * x1, 0.75 * y0 + 0.25 * y1))
+            smoothed.append((0.25 * x0 + 0.75 * x1, 0.25 * y0 + 0.75 * y1))
+        smoothed[1] = points[0]
+        smoothed[-1] = points[-1]
+        points = smoothed[1:]
+    return [(int(round(x)), int(round(y))) for x, y in points]
+
+def simplify_stroke(points, method=None, tolerance=None):
+    """
+    A felengedéskor véglegesített vonal pontjainak ritkítása / simítása a
+    STROKE_* beállítások szerint. Visszaadja az új pontlistát.
+    """
+    method = STROKE_SIMPLIFY if method is None else method
+    tolerance = STROKE_TOLERANCE if tolerance is None else tolerance
+    if method == 'rdp':
+        points = rdp_points(points, tolerance)
+    elif method == 'decimate':
+        points = decimate_points(points, tolerance, STROKE_MIN_ANGLE)
+    if STROKE_SMOOTHING:
+        points = smooth_points(points, STROKE_SMOOTHING)
+    return points
+
+# ========== VONAL-INTERPOLÁCIÓ ==========
+
+class StrokeInterpolator:
+    """
+    Az élő vonal mintáinak folyamatos sűrítése. Az add() a mintákból a már
+    véglegesíthető új vonalpontokat adja vissza: Catmull-Rom esetén egy szakasz
+    csak akkor, ha az utána következő minta is megvan (az görbíti), a finish()
+    pedig felengedéskor a hátralévő utolsó szakaszt.
+    """
+    def __init__(self, method=None, spacing=None):
+        self.method = STROKE_INTERPOLATION if method is None else method
+        self.spacing = max(1, STROKE_SPACING if spacing is None else spacing)
+        self.samples = []
+        self.done = 0       # az első ennyi minta előtti szakaszok már ki lettek adva
+        self.last = None    # az utoljára kiadott pont
+
+    def _emit(self, out, point):
+        point = (int(round(point[0])), int(round(point[1])))
+        if point != self.last:
+            out.append(point)
+            self.last = point
+
+    def _segment(self, out, i):
+        """Az i-edik és az (i+1)-edik minta közti pontok (a kezdőpont nélkül)."""
+        samples = self.samples
+        p1, p2 = samples[i], samples[i + 1]
+        steps = max(1, math.ceil(math.hypot(p2[0] - p1[0], p2[1] - p1[1]) / self.spacing))
+        if self.method == 'catmull-rom':
+            p0 = samples[i - 1] if i > 0 else p1
+            p3 = samples[i + 2] if i + 2 < len(samples) else p2
+            for k in range(1, steps + 1):
+                t = k / steps
+                t2, t3 = t * t, t * t * t
+                self._emit(out, tuple(0.5 * (2 * b + (c - a) * t + (2 * a - 5 * b + 4 * c - d) * t2
+                                             + (3 * b - a - 3 * c + d) * t3)
+                                      for a, b, c, d in zip(p0, p1, p2, p3)))
+        elif self.method == 'linear':
+            for k in range(1, steps + 1):
+                t = k / steps
+                self._emit(out, (p1[0] + (p2[0] - p1[0]) * t, p1[1] + (p2[1] - p1[1]) * t))
+        else:
+            self._emit(out, p2)
+
+    def add(self, points):
+        out = []
+        for point in points:
+            if self.samples and point == self.samples[-1]:
+                continue
+            self.samples.append(point)
+            if len(self.samples) == 1:
+                self._emit(out, point)
+        # Catmull-Rom-nál az utolsó szakasz a következő mintára vár
+        ready = len(self.samples) - (2 if self.method == 'catmull-rom' else 1)
+        while self.done < ready:
+            self._segment(out, self.done)
+            self.done += 1
+        return out
+
+    def finish(self):
+        out = []
+        while self.done < len(self.samples) - 1:
+            self._segment(out, self.done)
+            self.done += 1
+        return out
+
+# ========== KITÖLTÉS (VÖDÖR) ==========
+
+def _color_runs(surface, seed, tolerance):
+    """
+    A surface seed színéhez tolerance-en belül eső pixelei soronkénti
+    szakaszokként (NumPy-jal, egyben az egész képre): (sorok, kezdetek, végek)
+    tömbök, sor, azon belül x szerint rendezve.
+    """
+    target = surface.get_at(seed)
+    rgb = pygame.surfarray.pixels3d(surface)
+    alpha = pygame.surfarray.pixels_alpha(surface)
+    # A surfarray (x, y) sorrendű; transzponálva soronként haladunk
+    channels = [rgb[:, :, 0].T, rgb[:, :, 1].T, rgb[:, :, 2].T, alpha.T]
+    height, width = channels[0].shape
+    match = numpy.zeros((height, width + 2), numpy.int8)
+    inside = match[:, 1:-1]
+    inside[...] = 1
+    for channel, value in zip(channels, target):
+        # uint8-ban maradva: |c - value| = max - min, túlcsordulás nélkül
+        diff = numpy.maximum(channel, value) - numpy.minimum(channel, value)
+        inside &= diff <= tolerance
+    del rgb, alpha, channels
+    edges = numpy.diff(match, axis=1)
+    rows, starts = numpy.nonzero(edges == 1)
+    _, ends = numpy.nonzero(edges == -1)
+    return rows, starts, ends
+
+def flood_fill(layer, pos, color, tolerance=None):
+    """
+    A réteg kirajzolt képén a pos-sal összefüggő (4-szomszédos), hasonló színű
+    terület FillShape-ként, vagy None, ha pos a vásznon kívül esik, vagy a
+    kitöltés nem változtatna semmit. A pixelek összevetése NumPy-jal történik,
+    a terület bejárása szakaszonként (scanline): egy szakasz a felette és
+    alatta lévő sor átfedő szakaszaihoz kapcsolódik. NumPy nélkül RuntimeError.
+    """
+    if numpy is None:
+        raise RuntimeError("A kitöltéshez NumPy szükséges")
+    tolerance = FILL_TOLERANCE if tolerance is None else tolerance
+    x, y = pos
+    size = layer.size
+    if not (0 <= x < size[0] and 0 <= y < size[1]):
+        return None
+    surface = pygame.Surface(size, pygame.SRCALPHA)
+    layer.render().blit_to(surface, surface.get_rect(), (0, 0))
+    target = surface.get_at(pos)
+    if tuple(target) == tuple(color[:3]) + (255,):
+        return None
+    rows, starts, ends = _color_runs(surface, pos, tolerance)
+
+    # Soronként az első szakasz indexe; a végek soron belül növekvők
+    first = numpy.searchsorted(rows, numpy.arange(size[1] + 1)).tolist()
+    starts_list, ends_list = starts.tolist(), ends.tolist()
+    seed = bisect_right(ends_list, x, first[y], first[y + 1])
+    visited = bytearray(len(starts_list))
+    visited[seed] = 1
+    stack = [(seed, y)]
+    while stack:
+        i, row = stack.pop()
+        a, b = starts_list[i], ends_list[i]
+        for next_row in (row - 1, row + 1):
+            if not 0 <= next_row < size[1]:
+                continue
+            # Az első szakasz a szomszéd sorban, amely a-n túl ér, majd amíg b előtt kezdődik
+            j = bisect_right(ends_list, a, first[next_row], first[next_row + 1])
+            end = first[next_row + 1]
+            while j < end and starts_list[j] < b:
+                if not visited[j]:
+                    visited[j] = 1
+                    stack.append((j, next_row))
+                j += 1
+
+    chosen = numpy.flatnonzero(numpy.frombuffer(visited, numpy.uint8))
+    triples = numpy.stack([rows[chosen], starts[chosen], ends[chosen]], axis=1).astype(numpy.int16)
+    runs = array('h')
+    runs.frombytes(triples.tobytes())
+    bounds = pygame.Rect(int(starts[chosen].min()), int(rows[chosen[0]]),
+                         int(ends[chosen].max() - starts[chosen].min()),
+                         int(rows[chosen[-1]] - rows[chosen[0]]) + 1)
+    return FillShape(runs, tuple(color[:3]), bounds)
+
+# ========== NÉZET ÉS ÖSSZESÍTETT KÉP ==========
+
+class Viewport:
+    """
+    A dokumentum ablakban látható része. Az origin a bal felső sarok
+    dokumentum-koordinátában (lehet tört is), a zoom a nagyítás; a rect a
+    látható terület egész dokumentum-pixelekre kerekítve. A screen_rect a
+    vászon helye a képernyőn.
+    """
+    def __init__(self, screen_rect, document_size, on_change=None):
+        self.screen_rect = pygame.Rect(screen_rect)
+        self.document_rect = pygame.Rect((0, 0), document_size)
+        self.origin = [0.0, 0.0]
+        self.zoom = 1.0
+        self.on_change = on_change  # Görgetéskor / nagyításkor hívódik
+
+    @property
+    def rect(self):
+        ox, oy = self.origin
+        left, top = math.floor(ox), math.floor(oy)
+        right = math.ceil(ox + self.screen_rect.w / self.zoom)
+        bottom = math.ceil(oy + self.screen_rect.h / self.zoom)
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+    def to_canvas(self, pos):
+        """Képernyő-pont -> dokumentum-pont."""
+        return (math.floor(self.origin[0] + (pos[0] - self.screen_rect.x) / self.zoom),
+                math.floor(self.origin[1] + (pos[1] - self.screen_rect.y) / self.zoom))
+
+    def to_view(self, pos):
+        """Dokumentum-pont -> az összesített kép (nézet) koordinátái."""
+        return (int(round((pos[0] - self.origin[0]) * self.zoom)),
+                int(round((pos[1] - self.origin[1]) * self.zoom)))
+
+    def to_view_rect(self, rect):
+        rect = pygame.Rect(rect)
+        if self.zoom == 1:
+            return rect.move(-int(self.origin[0]), -int(self.origin[1]))
+        ox, oy = self.origin
+        left = math.floor((rect.left - ox) * self.zoom)
+        top = math.floor((rect.top - oy) * self.zoom)
+        right = math.ceil((rect.right - ox) * self.zoom)
+        bottom = math.ceil((rect.bottom - oy) * self.zoom)
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+    def to_screen_rect(self, rect):
+        return self.to_view_rect(rect).move(self.screen_rect.topleft)
+
+    def view_thickness(self, thickness):
+        return max(1, int(round(thickness * self.zoom)))
+
+    def shape_to_view(self, shape):
+        """Téglalap / ellipszis a nézet koordinátáiban (az előnézet rajzolásához)."""
+        if self.zoom == 1 and self.origin == [0.0, 0.0]:
+            return shape
+        return type(shape)(self.to_view(shape.start), self.to_view(shape.end), shape.color,
+                           shape.fill, self.view_thickness(shape.thickness))
+
+    def mip_level(self, max_level):
+        """A megjelenítéshez használt mip-szint: a legkisebb, ami még nem kisebb felbontású a nézetnél."""
+        if self.zoom >= 1:
+            return 0
+        return min(int(math.floor(math.log2(1 / self.zoom) + 1e-9)), max_level)
+
+    def _clamp(self):
+        view_w = self.screen_rect.w / self.zoom
+        view_h = self.screen_rect.h / self.zoom
+        for axis, view_size, doc_size in ((0, view_w, self.document_rect.w), (1, view_h, self.document_rect.h)):
+            if view_size >= doc_size:
+                # A dokumentum kisebb a nézetnél: középre kerül
+                self.origin[axis] = (doc_size - view_size) / 2
+            else:
+                self.origin[axis] = max(0.0, min(doc_size - view_size, self.origin[axis]))
+            if self.zoom == 1:
+                # 1:1-ben egész pixelre igazítunk, így a kép pontosan a rétegek pixeleit mutatja
+                self.origin[axis] = float(round(self.origin[axis]))
+
+    def _set(self, origin, zoom):
+        old = (tuple(self.origin), self.zoom)
+        self.origin = list(origin)
+        self.zoom = zoom
+        self._clamp()
+        if (tuple(self.origin), self.zoom) != old and self.on_change is not None:
+            self.on_change()
+
+    def scroll(self, dx, dy):
+        """Mozgatás dokumentum-pixelben."""
+        self._set((self.origin[0] + dx, self.origin[1] + dy), self.zoom)
+
+    def pan_screen(self, dx, dy):
+        """Mozgatás képernyő-pixelben (egérhúzás): a kép a kurzorral együtt mozog."""
+        self.scroll(-dx / self.zoom, -dy / self.zoom)
+
+    def zoom_at(self, screen_pos, factor):
+        """Nagyítás úgy, hogy a screen_pos alatti dokumentum-pont a helyén maradjon."""
+        zoom = max(ZOOM_MIN, min(ZOOM_MAX, self.zoom * factor))
+        if abs(zoom - 1) < 1e-6:
+            zoom = 1.0
+        sx = (screen_pos[0] - self.screen_rect.x)
+        sy = (screen_pos[1] - self.screen_rect.y)
+        ax = self.origin[0] + sx / self.zoom
+        ay = self.origin[1] + sy / self.zoom
+        self._set((ax - sx / zoom, ay - sy / zoom), zoom)
+
+class MipPyramid:
+    """
+    Az összesített kép kicsinyített szintjei csempénként. A k. szint egy
+    csempéje 2^k * TILE_SIZE dokumentum-pixelt fed le TILE_SIZE méretben;
+    a 0. szint a rétegekből, a többi a négy gyerek-csempéből készül.
+    Változáskor csak az érintett csempék esnek ki minden szinten; a
+    gyorsítótár LRU, legfeljebb MIP_CACHE_TILES csempét tart.
+    """
+    def __init__(self, document, max_tiles=MIP_CACHE_TILES):
+        self.document = document
+        self.document_rect = pygame.Rect((0, 0), document.size)
+        self.max_tiles = max_tiles
+        self.tiles = OrderedDict()  # (szint, tx, ty) -> Surface
+        self.max_level = 0
+        while (TILE_SIZE << self.max_level) < max(document.size):
+            self.max_level += 1
+
+    def doc_rect(self, level, key):
+        span = TILE_SIZE << level
+        return pygame.Rect(key[0] * span, key[1] * span, span, span).clip(self.document_rect)
+
+    def tile_keys(self, level, rect):
+        span = TILE_SIZE << level
+        rect = pygame.Rect(rect).clip(self.document_rect)
+        if rect.w <= 0 or rect.h <= 0:
+            return []
+        return [(tx, ty)
+                for ty in range(rect.top // span, (rect.bottom - 1) // span + 1)
+                for tx in range(rect.left // span, (rect.right - 1) // span + 1)]
+
+    def invalidate(self, rect=None):
+        if rect is None:
+            self.tiles.clear()
+            return
+        for level in range(self.max_level + 1):
+            for key in self.tile_keys(level, rect):
+                self.tiles.pop((level,) + key, None)
+
+    def get(self, level, key):
+        cache_key = (level,) + key
+        surf = self.tiles.get(cache_key)
+        if surf is not None:
+            self.tiles.move_to_end(cache_key)
+            return surf
+        area = self.doc_rect(level, key)
+        if level == 0:
+            surf = pygame.Surface(area.size, pygame.SRCALPHA)
+            composite_layers(self.document.layers, surf, area)
+        else:
+            # A négy gyerek-csempe egymás mellé, majd felére kicsinyítve
+            span = TILE_SIZE << (level - 1)
+            child_area = pygame.Rect(area.x, area.y, math.ceil(area.w / span) * TILE_SIZE,
+                                     math.ceil(area.h / span) * TILE_SIZE)
+            joined = pygame.Surface(child_area.size, pygame.SRCALPHA)
+            for child in self.tile_keys(level - 1, area):
+                pos = ((child[0] - 2 * key[0]) * TILE_SIZE, (child[1] - 2 * key[1]) * TILE_SIZE)
+                joined.blit(self.get(level - 1, child), pos)
+            size = (max(1, math.ceil(area.w / (1 << level))), max(1, math.ceil(area.h / (1 << level))))
+            used = pygame.Rect(0, 0, size[0] * 2, size[1] * 2).clip(joined.get_rect())
+            surf = pygame.transform.smoothscale(joined.subsurface(used), size)
+        self.tiles[cache_key] = surf
+        while len(self.tiles) > self.max_tiles:
+            # A 0. szint a legolcsóbb újraépíteni (és a legtöbb van belőle), ezért az megy először
+            victim = next((k for k in self.tiles if k[0] == 0), None)
+            if victim is None:
+                self.tiles.popitem(last=False)
+            else:
+                del self.tiles[victim]
+        return surf
+
+class PreviewOverlay:
+    """
+    Húzás alatti előnézet (téglalap / ellipszis) külön átlátszó fedőrétegen,
+    a nézet koordinátáiban. Ha az előnézet változik, csak a régi helye törlődik
+    és az új rajzolódik rá, így egy képkocka költsége az alakzat méretével
+    arányos, nem a vászonéval.
+    """
+    def __init__(self, size):
+        self.surface = pygame.Surface(size, pygame.SRCALPHA)
+        self.rect = None    # Az előnézet jelenlegi helye
+
+    def update(self, view_shape):
+        """
+        Az előnézet lecserélése egy nézet-koordinátás alakzatra (None: eltüntetése).
+        Visszaadja a változott téglalapok unióját, vagy None-t.
+        """
+        old = self.rect
+        if old is not None:
+            self.surface.fill((0, 0, 0, 0), old)
+            self.rect = None
+        if view_shape is not None:
+            drawn = shape_bounds(view_shape).clip(self.surface.get_rect())
+            if drawn.w > 0 and drawn.h > 0:
+                draw_shape_item(self.surface, view_shape)
+                self.rect = drawn
+        changed = [rect for rect in (old, self.rect) if rect is not None]
+        return changed[0].unionall(changed[1:]) if changed else None
+
+    def draw(self, surface, offset):
+        if self.rect is not None:
+            surface.blit(self.surface, (self.rect.x + offset[0], self.rect.y + offset[1]), area=self.rect)
+
+class CanvasView:
+    """
+    A dokumentum egy képernyőn látható képe: nézet (görgetés, nagyítás),
+    mip-piramis és az összesített kép a nézet méretében. A megváltozott
+    részeket (nézet-koordinátában) gyűjti, amíg a hívó el nem viszi őket.
+    """
+    def __init__(self, document, screen_rect):
+        self.document = document
+        self.viewport = Viewport(screen_rect, document.size, on_change=self.invalidate_view)
+        self.mip = MipPyramid(document)
+        self.surface = None
+        self.valid = False
+        self.damage = []
+        # Opcionális képkocka-mérő (frame_profiler.FrameProfiler); rétegenként mér
+        self.profiler = None
+        document.views.append(self)
+
+    def mark_dirty(self, rect=None):
+        if rect is None:
+            rect = pygame.Rect((0, 0), self.viewport.screen_rect.size)
+        self.damage.append(rect)
+
+    def take_damage(self):
+        rects = self.damage[:]
+        self.damage.clear()
+        return rects
+
+    def document_resized(self):
+        """A dokumentum mérete megváltozott (másik dokumentum betöltése)."""
+        self.viewport.document_rect = pygame.Rect((0, 0), self.document.size)
+        self.viewport._set(self.viewport.origin, self.viewport.zoom)
+        self.mip = MipPyramid(self.document)
+
+    def invalidate(self):
+        """A dokumentum tartalma mindenhol változhatott: a mip-szintek is elavulnak."""
+        self.mip.invalidate()
+        self.invalidate_view()
+
+    def invalidate_view(self):
+        """Csak a nézet változott (görgetés, nagyítás): a mip-szintek érvényesek maradnak."""
+        self.valid = False
+        self.mark_dirty()
+
+    def layer_changed(self, layer, rect=None, shape=None):
+        """
+        Egy réteg változott. Ha ismert a terület (új alakzat, részleges
+        újrarajzolás), csak azt állítja elő újra a réteg-csempékből.
+        """
+        if rect is None or not self.valid or (shape is not None and shape.type == 'loaded_image'):
+            self.invalidate()
+            return
+        if layer.visible:
+            self.mip.invalidate(rect)
+            self.composite_area(rect)
+
+    def composite_area(self, rect):
+        """
+        A rect (dokumentum-koordináta) látható részének összesítése, csempénként.
+        1:1 nézetben közvetlenül a réteg-csempékből, egyébként a nézethez
+        legközelebbi mip-szintből, csak a látható csempéket átméretezve.
+        """
+        viewport = self.viewport
+        area = pygame.Rect(rect).clip(viewport.rect)
+        if area.w <= 0 or area.h <= 0:
+            return
+        view = viewport.to_view_rect(area)
+        self.surface.fill((0, 0, 0, 0), view)
+        if viewport.zoom == 1:
+            composite_layers(self.document.layers, self.surface, area, view.topleft, self.profiler)
+        else:
+            level = viewport.mip_level(self.mip.max_level)
+            scale = pygame.transform.scale if viewport.zoom > 1 else pygame.transform.smoothscale
+            self.surface.set_clip(view)
+            for key in self.mip.tile_keys(level, area):
+                dest = viewport.to_view_rect(self.mip.doc_rect(level, key))
+                if dest.w > 0 and dest.h > 0:
+                    self.surface.blit(scale(self.mip.get(level, key), dest.size), dest)
+            self.surface.set_clip(None)
+        self.mark_dirty(view)
+
+    def redraw(self):
+        """
+        Visszaadja a rétegek összesített képét a nézet területén. A visszaadott
+        felület a gyorsítótár maga, ezért rajzolni csak a másolatára szabad.
+        """
+        if self.surface is None:
+            self.surface = pygame.Surface(self.viewport.screen_rect.size, pygame.SRCALPHA)
+        if not self.valid:
+            self.surface.fill((0, 0, 0, 0))
+            self.composite_area(self.viewport.rect)
+            self.valid = True
+        return self.surface
@@ -0,0 +1,282 @@
+"""
+Nagy felbontású PNG-export a PaintMEZ-hez (pl. nyomtatáshoz, 4-8x nagyításban).
+
+Az export nem a képernyőképet nagyítja, hanem az alakzat-listákat
+raszterizálja újra a kért léptékkel. A kimenet EXPORT_BAND_ROWS soros
+sávokra bomlik; minden sávot egy munkafolyamat rajzol ki (rétegenként,
+átlátszósággal és keverési móddal, ahogy a vászon), és maga tömörít is. A
+sávok nyers deflate-folyamai sorrendben, egymás után kerülnek a PNG IDAT
+darabjaiba, így a kódolás is párhuzamos, a memóriában pedig egyszerre csak
+néhány sáv van.
+
+A munkafolyamatok a dokumentumot egy ideiglenes projektfájlból (.pmez)
+olvassák; ez ugyanaz a sorosított alakzat-adat, amit a Mentés is ír.
+A betöltött bitképek, a beégetett előzmény (alapraszter) és a kitöltések
+legközelebbi szomszéd szerint nagyítódnak, így a sávhatárokon nincs illesztési hiba. A
+nagyon nagy (STAMP_MAX_PIXELS feletti) körvonalas alakzatoknál a sávhatáron
+egy-egy pixeles eltérés előfordulhat.
+"""
+import math
+import multiprocessing
+import os
+import struct
+import tempfile
+import zlib
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pygame
+
+from paint_core import Document, FillShape, Layer, LoadedImageShape, TiledRaster, make_shape, shape_bounds
+from paint_project import atomic_write, load_project, save_project
+
+# Egy sáv magassága a kimeneten (pixelsor); ennyi sorra fér el egy munkaegység
+EXPORT_BAND_ROWS = 256
+# A kimenet egyik oldala sem lehet ennél nagyobb (a vonalpontok int16-ként tárolódnak)
+MAX_EXPORT_SIDE = 32767
+# A vonalpontok int16-ként tárolódnak; ezen kívül eső nagyított pontoknál a vonal a sávra vágódik
+INT16_RANGE = pygame.Rect(-32768, -32768, 65535, 65535)
+# A deflate tömörítési szintje (0-9)
+EXPORT_COMPRESSION = 6
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def export_size(document, scale):
+    """A kimenet mérete; ValueError, ha a lépték hibás vagy a kép túl nagy lenne."""
+    if scale <= 0:
+        raise ValueError(f"A léptéknek pozitívnak kell lennie: {scale}")
+    w, h = (max(1, round(side * scale)) for side in document.size)
+    if max(w, h) > MAX_EXPORT_SIDE:
+        raise ValueError(f"Túl nagy export: {w}x{h} (legfeljebb {MAX_EXPORT_SIDE} pixel oldalanként)")
+    return w, h
+
+# ========== SÁV KIRAJZOLÁSA ==========
+
+def _clip_polyline(points, rect):
+    """A törött vonal rect-be eső darabjai (pontlisták), szakaszonként pygame.Rect.clipline()-nal."""
+    pieces = []
+    current = None
+    for a, b in zip(points, points[1:]):
+        clipped = rect.clipline(a, b)
+        if not clipped:
+            current = None
+            continue
+        start, end = clipped
+        if current is not None and current[-1] == start:
+            current.append(end)
+        else:
+            current = [start, end]
+            pieces.append(current)
+    return pieces
+
+def _scaled_shapes(shape, scale, band):
+    """
+    Az alakzat a kimenet léptékében, a sáv tetejéhez igazítva, alakzatok
+    listájaként. Ha egy vonal nagyított pontjai nem férnek el int16-ban (pl.
+    a dokumentumon messze túlnyúló vonal), a vonal a vastagságával megnövelt
+    sávra vágva, darabokban kerül ki; a sávban látható rész ugyanaz.
+    """
+    thickness = max(1, round(shape.thickness * scale))
+    top = band.top
+    if shape.type in ('rect', 'ellipse'):
+        (x0, y0), (x1, y1) = shape.start, shape.end
+        return [make_shape(shape.type, start=(round(x0 * scale), round(y0 * scale) - top),
+                           end=(round(x1 * scale), round(y1 * scale) - top),
+                           color=shape.color, fill=shape.fill, thickness=thickness)]
+    points = [(round(x * scale), round(y * scale) - top) for x, y in shape.point_list()]
+    pieces = [points]
+    if not all(INT16_RANGE.collidepoint(p) for p in points):
+        pad = thickness + 2
+        reach = pygame.Rect(-pad, -pad, band.w + 2 * pad, band.h + 2 * pad).clip(INT16_RANGE)
+        pieces = _clip_polyline(points, reach)
+    return [make_shape(shape.type, points=piece, color=shape.color, thickness=thickness) for piece in pieces]
+
+def _scaled_image(shape, scale, band):
+    """
+    Egy betöltött bitkép vagy beégetett alapraszter sávba eső sorai
+    felnagyítva, a sáv méretű felületen.
+    """
+    if shape.type == 'raster':
+        width, height = shape.raster.rect.size
+    else:
+        width, height = shape.surface.get_size()
+    src_top = max(0, math.floor(band.top / scale))
+    src_bottom = min(height, math.ceil(band.bottom / scale))
+    if src_bottom <= src_top:
+        return None
+    source = pygame.Rect(0, src_top, width, src_bottom - src_top)
+    if shape.type == 'raster':
+        part = pygame.Surface(source.size, pygame.SRCALPHA)
+        shape.raster.blit_to(part, source, (0, 0))
+    else:
+        part = shape.surface.subsurface(source)
+    top, bottom = round(src_top * scale), round(src_bottom * scale)
+    scaled = pygame.transform.scale(part, (round(width * scale), bottom - top))
+    out = pygame.Surface(band.size, pygame.SRCALPHA)
+    out.blit(scaled, (0, top - band.top))
+    return LoadedImageShape(out)
+
+def _scaled_fill(shape, scale, band):
+    """
+    Egy kitöltés sávba eső része felnagyítva, a sáv tetejéhez igazítva: a
+    forrás y sora a kimenet round(y * scale)..round((y + 1) * scale) sorait adja.
+    """
+    runs = shape.runs
+    out = array('h')
+    i = 3 * shape.first_run(math.floor(band.top / scale))
+    while i < len(runs):
+        y = runs[i]
+        top, bottom = max(band.top, round(y * scale)), min(band.bottom, round((y + 1) * scale))
+        if round(y * scale) >= band.bottom:
+            break
+        # A sor összes szakasza, a kimenet minden érintett sorára
+        j = i
+        while j < len(runs) and runs[j] == y:
+            j += 3
+        spans = [(round(runs[k + 1] * scale), round(runs[k + 2] * scale)) for k in range(i, j, 3)]
+        for out_y in range(top, bottom):
+            for x0, x1 in spans:
+                out.extend((out_y - band.top, x0, x1))
+        i = j
+    return FillShape(out, shape.color) if out else None
+
+def render_band(document, scale, band):
+    """
+    A dokumentum band (kimeneti koordinátájú) része a scale léptékben,
+    a vászonnal azonos összesítéssel. A sáv rétegei nem kerülnek a
+    dokumentumba, és nem készítenek undo-ellenőrzőpontot.
+    """
+    strip = Document(band.size)
+    for layer in document.layers:
+        if not layer.visible:
+            continue
+        scaled = Layer(name=layer.name, background_color=layer.background_color)
+        scaled.opacity = layer.opacity
+        scaled.blend_mode = layer.blend_mode
+        strip.add_layer(scaled)
+        scaled.cache = raster = TiledRaster(band.size, layer.background_color)
+        scaled.cache_valid = True
+        for shape in layer.shapes:
+            if shape.type in ('loaded_image', 'raster'):
+                image = _scaled_image(shape, scale, band)
+                if image is not None:
+                    raster.draw_shape(image)
+                continue
+            if shape.type == 'fill':
+                fill = _scaled_fill(shape, scale, band)
+                if fill is not None:
+                    raster.draw_shape(fill)
+                continue
+            b = shape_bounds(shape)
+            reach = pygame.Rect(math.floor(b.x * scale), math.floor(b.y * scale),
+                                math.ceil(b.w * scale) + 1, math.ceil(b.h * scale) + 1)
+            if reach.colliderect(band):
+                for part in _scaled_shapes(shape, scale, band):
+                    raster.draw_shape(part)
+    return strip.flatten()
+
+# ========== TÖMÖRÍTÉS ÉS PNG-ÍRÁS ==========
+
+def compress_band(surface, last):
+    """
+    A sáv sorai PNG-szűrőbájttal (0 = nincs szűrés), nyers deflate-tel
+    tömörítve. Egy nem utolsó sáv bájthatáron, lezáratlan blokkal végződik,
+    így a sávok folyamai egyszerűen egymás után fűzhetők.
+    Visszaadja: (tömörített adat, adler32, nyers hossz).
+    """
+    width, height = surface.get_size()
+    pixels = pygame.image.tobytes(surface, "RGBA")
+    stride = width * 4
+    raw = b"".join(b"\0" + pixels[y * stride:(y + 1) * stride] for y in range(height))
+    compressor = zlib.compressobj(EXPORT_COMPRESSION, zlib.DEFLATED, -15)
+    data = compressor.compress(raw) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return data, zlib.adler32(raw), len(raw)
+
+def adler32_combine(first, second, second_length):
+    """Két egymás utáni adatrész adler32-jének összevonása (mint a zlib adler32_combine())."""
+    base = 65521
+    s1 = ((first & 0xFFFF) + (second & 0xFFFF) - 1) % base
+    s2 = ((first >> 16) + (second >> 16) + second_length * ((first & 0xFFFF) - 1)) % base
+    return (s2 << 16) | s1
+
+def _write_chunk(f, kind, data):
+    f.write(struct.pack(">I", len(data)))
+    f.write(kind)
+    f.write(data)
+    f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+# ========== MUNKAFOLYAMATOK ==========
+
+# Munkafolyamatonként az utoljára betöltött dokumentum: (fájlnév, dokumentum)
+_worker_document = (None, None)
+
+def _band_job(source, scale, band, last):
+    """Egy sáv kirajzolása és tömörítése egy munkafolyamatban."""
+    global _worker_document
+    if _worker_document[0] != source:
+        _worker_document = (source, load_project(source, include_rasters=False))
+    return compress_band(render_band(_worker_document[1], scale, pygame.Rect(band)), last)
+
+def export_pool(workers=None):
+    """Munkafolyamat-készlet az exporthoz (spawn: a szülő pygame-állapota nem öröklődik)."""
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                               mp_context=multiprocessing.get_context("spawn"))
+
+def export_scaled(document, filename, scale, executor=None, workers=None, progress=None):
+    """
+    A dokumentum kiírása PNG-be scale léptékben. Az executor egy meglévő
+    ProcessPoolExecutor (pl. export_pool()); ha nincs megadva, workers
+    folyamattal (alapból a magok száma) indul egy, workers=0 esetén pedig
+    minden sáv itt, sorban készül. Egyszerre legfeljebb 2 * workers sáv van úton. A progress(kész, összes) minden sáv után
+    meghívódik. Visszaadja a kimenet méretét.
+    """
+    width, height = export_size(document, scale)
+    bands = [pygame.Rect(0, top, width, min(EXPORT_BAND_ROWS, height - top))
+             for top in range(0, height, EXPORT_BAND_ROWS)]
+    own_pool = None
+    source = None
+    if executor is None and workers != 0:
+        executor = own_pool = export_pool(workers)
+    try:
+        if executor is not None:
+            # A munkafolyamatok a sorosított projektből dolgoznak
+            fd, source = tempfile.mkstemp(suffix=".pmez", prefix="paintmez-export-")
+            os.close(fd)
+            save_project(document, source)
+            window = 2 * (workers or os.cpu_count() or 1)
+            submit = lambda i: executor.submit(_band_job, source, scale, tuple(bands[i]), i == len(bands) - 1)
+        else:
+            window = 1
+            submit = None
+
+        with atomic_write(filename) as f:
+            f.write(PNG_SIGNATURE)
+            _write_chunk(f, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+            _write_chunk(f, b"IDAT", b"\x78\x9c")  # zlib-fejléc: deflate, 32K ablak
+            checksum = 1
+            pending = deque()
+            next_band = 0
+            for done in range(len(bands)):
+                # Legfeljebb window sáv van úton, így a memória nem nő a kép méretével
+                while submit is not None and next_band < len(bands) and len(pending) < window:
+                    pending.append(submit(next_band))
+                    next_band += 1
+                if submit is not None:
+                    data, adler, length = pending.popleft().result()
+                else:
+                    data, adler, length = compress_band(render_band(document, scale, bands[done]),
+                                                        done == len(bands) - 1)
+                _write_chunk(f, b"IDAT", data)
+                checksum = adler32_combine(checksum, adler, length)
+                if progress is not None:
+                    progress(done + 1, len(bands))
+            _write_chunk(f, b"IDAT", struct.pack(">I", checksum))
+            _write_chunk(f, b"IEND", b"")
+    finally:
+        if source is not None:
+            os.remove(source)
+        if own_pool is not None:
+            own_pool.shutdown()
+    return width, height
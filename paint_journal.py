@@ -0,0 +1,350 @@
+"""
+Összeomlás-biztos, csak hozzáfűzős műveletnapló a PaintMEZ-hez.
+
+Minden véglegesített művelet (új alakzat, undo, redo, réteg hozzáadása /
+törlése / váltása, háttérszín, átlátszóság és keverési mód, réteg törlése,
+előzmény-tömörítés) egy kicsi, önálló rekordként
+kerül a napló végére; a lemezre írás (fsync) kötegelve történik. A napló egy
+projekt-pillanatképre (.pmez) épül: a fejlécében lévő generációszám mondja
+meg, melyikre. Tömörítéskor új pillanatkép készül, és a napló üresen indul
+újra; a régi napló addig érvényes marad, amíg az új pillanatkép el nem készül.
+
+Indításkor a pillanatkép betöltése és a napló visszajátszása visszaadja a
+dokumentumot. A visszajátszás determinisztikus, így a napló terhelési
+tesztek bemenete is lehet (lásd benchmark.py --journal).
+
+Rekord: művelet (u8), hossz (u32), adat, CRC32 (u32). A félbeszakadt vagy
+sérült rekordnál a visszajátszás megáll, és a napló ott csonkolódik.
+"""
+import os
+import struct
+import time
+import zlib
+
+from paint_core import BLEND_MODES, Layer
+from paint_project import ProjectReader, pack_shape, save_project, unpack_shape
+
+MAGIC = b"PMEZJRNL"
+VERSION = 1
+
+_HEADER = struct.Struct("<8sHI")        # magic, verzió, generáció
+_FRAME = struct.Struct("<BI")           # művelet, adathossz
+_CRC = struct.Struct("<I")
+_INDEX = struct.Struct("<H")
+_COLOR = struct.Struct("<B3B")          # van szín, RGB
+_STYLE = struct.Struct("<HfB")          # réteg, átlátszóság, keverési mód
+_COMPACT = struct.Struct("<HI")         # réteg, beégetett alakzatok száma
+
+OP_ADD_SHAPE = 1
+OP_UNDO = 2
+OP_REDO = 3
+OP_ADD_LAYER = 4
+OP_REMOVE_LAYER = 5
+OP_SELECT_LAYER = 6
+OP_SET_BACKGROUND = 7
+OP_CLEAR_LAYER = 8
+OP_SET_LAYER_STYLE = 9
+OP_COMPACT_LAYER = 10
+
+OP_NAMES = {OP_ADD_SHAPE: 'add_shape', OP_UNDO: 'undo', OP_REDO: 'redo', OP_ADD_LAYER: 'add_layer',
+            OP_REMOVE_LAYER: 'remove_layer', OP_SELECT_LAYER: 'select_layer',
+            OP_SET_BACKGROUND: 'set_background', OP_CLEAR_LAYER: 'clear_layer',
+            OP_SET_LAYER_STYLE: 'set_layer_style', OP_COMPACT_LAYER: 'compact_layer'}
+
+# ========== REKORDOK KÓDOLÁSA ==========
+
+def _pack_color(color):
+    return _COLOR.pack(color is not None, *(color[:3] if color is not None else (0, 0, 0)))
+
+def _unpack_color(data, offset=0):
+    has, r, g, b = _COLOR.unpack_from(data, offset)
+    return (r, g, b) if has else None
+
+# ========== VISSZAJÁTSZÁS ==========
+
+def apply_op(document, current, op, data):
+    """
+    Egy naplózott művelet végrehajtása a dokumentumon, pontosan úgy, ahogy a
+    felület teszi. Visszaadja az aktív réteg (esetleg új) indexét.
+    """
+    layers = document.layers
+    if op == OP_ADD_SHAPE:
+        layer = layers[_INDEX.unpack_from(data)[0]]
+        # Új rajz kezdete a felületen is üríti a réteg redo-vermét
+        layer.redo_stack.clear()
+        layer.add_shape(unpack_shape(memoryview(data)[_INDEX.size:]))
+    elif op == OP_UNDO:
+        layer = layers[_INDEX.unpack_from(data)[0]]
+        layer.redo_stack.append(layer.pop_shape())
+    elif op == OP_REDO:
+        layer = layers[_INDEX.unpack_from(data)[0]]
+        layer.add_shape(layer.redo_stack.pop())
+    elif op == OP_ADD_LAYER:
+        name = bytes(data[_COLOR.size:]).decode("utf-8")
+        document.add_layer(Layer(name=name, background_color=_unpack_color(data)))
+    elif op == OP_REMOVE_LAYER:
+        document.remove_layer(_INDEX.unpack_from(data)[0])
+    elif op == OP_SELECT_LAYER:
+        current = _INDEX.unpack_from(data)[0]
+    elif op == OP_SET_BACKGROUND:
+        layers[_INDEX.unpack_from(data)[0]].background_color = _unpack_color(data, _INDEX.size)
+    elif op == OP_CLEAR_LAYER:
+        layers[_INDEX.unpack_from(data)[0]].clear()
+    elif op == OP_SET_LAYER_STYLE:
+        index, opacity, blend = _STYLE.unpack_from(data)
+        layers[index].opacity = round(opacity, 6)  # float32-ből
+        layers[index].blend_mode = BLEND_MODES[blend]
+    elif op == OP_COMPACT_LAYER:
+        index, count = _COMPACT.unpack_from(data)
+        layers[index].compact(count)
+    else:
+        raise ValueError(f"Ismeretlen művelet a naplóban: {op}")
+    return min(current, len(layers) - 1)
+
+def read_records(filename):
+    """
+    A napló fejléce és ép rekordjai: (generáció, [(művelet, adat)], az ép rész hossza).
+    Az első csonka vagy hibás CRC-jű rekordnál megáll.
+    """
+    with open(filename, "rb") as f:
+        content = f.read()
+    if len(content) < _HEADER.size:
+        raise ValueError(f"Nem PaintMEZ napló: {filename}")
+    magic, version, generation = _HEADER.unpack_from(content)
+    if magic != MAGIC or version > VERSION:
+        raise ValueError(f"Nem PaintMEZ napló vagy ismeretlen verzió: {filename}")
+    records = []
+    pos = _HEADER.size
+    view = memoryview(content)
+    while pos + _FRAME.size + _CRC.size <= len(content):
+        op, length = _FRAME.unpack_from(content, pos)
+        end = pos + _FRAME.size + length
+        if end + _CRC.size > len(content):
+            break
+        (crc,) = _CRC.unpack_from(content, end)
+        if zlib.crc32(view[pos:end]) != crc:
+            break
+        records.append((op, view[pos + _FRAME.size:end]))
+        pos = end + _CRC.size
+    return generation, records, pos
+
+def replay(document, records, current=0):
+    for op, data in records:
+        current = apply_op(document, current, op, data)
+    return current
+
+# ========== NAPLÓ ==========
+
+class Journal:
+    """
+    A nyitott napló. A record_*() metódusok csak a fájl pufferébe írnak; a
+    sync() (legfeljebb sync_ms-enként a maybe_sync()-ből) viszi lemezre.
+    Tömörítés közben a rekordok a régi és a készülő új naplóba is bekerülnek,
+    így a pillanatkép elkészültéig a régi pár (pillanatkép + napló) érvényes.
+    """
+    def __init__(self, filename, sync_ms=1000, compact_ops=500):
+        self.filename = filename
+        self.sync_ms = sync_ms
+        self.compact_ops = compact_ops
+        self.generation = 0
+        self.file = None
+        self.next_file = None       # tömörítés alatt a következő generáció naplója
+        self.pending_snapshot = None
+        self.ops_since_compact = 0
+        self.dirty = False
+        self.last_sync = time.monotonic()
+
+    def snapshot_name(self, generation):
+        return f"{self.filename}.{generation}.pmez"
+
+    def _new_log(self, filename, generation):
+        f = open(filename, "wb")
+        f.write(_HEADER.pack(MAGIC, VERSION, generation))
+        f.flush()
+        os.fsync(f.fileno())
+        return f
+
+    # ---------- megnyitás, visszaállítás ----------
+
+    def restore(self):
+        """
+        A korábbi munkamenet visszaállítása: (dokumentum, aktív réteg, visszajátszott
+        műveletek), vagy None, ha nincs (ép) napló. Siker esetén a napló írásra nyitva marad.
+        A vissza nem állítható napló és pillanatképei félrekerülnek (set_aside()).
+        """
+        if not os.path.exists(self.filename):
+            return None
+        try:
+            generation, records, valid_end = read_records(self.filename)
+            with ProjectReader(self.snapshot_name(generation)) as reader:
+                document = reader.read_document()
+            current = replay(document, records)
+        except Exception as e:
+            # Bármilyen hiba (sérült pillanatkép, hibás rekord) után is el kell tudni indulni
+            print(f"A napló nem állítható vissza ({self.filename}): {type(e).__name__}: {e}")
+            moved = self.set_aside()
+            if moved:
+                print(f"A régi automatikus mentés félretéve: {', '.join(moved)}")
+            return None
+        self.generation = generation
+        self._remove_stale()
+        # A sérült farok levágása, hogy az új rekordok ép rész után jöjjenek
+        self.file = open(self.filename, "r+b")
+        self.file.truncate(valid_end)
+        self.file.seek(valid_end)
+        self.ops_since_compact = len(records)
+        return document, current, len(records)
+
+    def start(self, document, current=0):
+        """Új napló indítása a dokumentum azonnali pillanatképével."""
+        self.close()
+        self.generation += 1
+        save_project(document, self.snapshot_name(self.generation))
+        tmp = self.filename + ".new"
+        f = self._new_log(tmp, self.generation)
+        if current:
+            self._write(f, OP_SELECT_LAYER, _INDEX.pack(current))
+            f.flush()
+        f.close()
+        os.replace(tmp, self.filename)
+        self.file = open(self.filename, "ab")
+        self.ops_since_compact = 0
+        self._remove_stale()
+
+    def _journal_files(self):
+        """A napló pillanatképei és félbemaradt naplói a mappában (teljes úttal)."""
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        prefix = os.path.basename(self.filename) + "."
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and name.endswith((".pmez", ".new")):
+                yield os.path.join(directory, name)
+
+    def set_aside(self):
+        """
+        A napló és a pillanatképei átnevezése .bad végűre, hogy az új munkamenet
+        ne írja felül és ne törölje őket (kézzel még menthetők). Visszaadja az új neveket.
+        """
+        moved = []
+        for path in [os.path.abspath(self.filename)] + list(self._journal_files()):
+            try:
+                os.replace(path, path + ".bad")
+            except OSError:
+                continue
+            moved.append(path + ".bad")
+        return moved
+
+    def _remove_stale(self):
+        """A jelenlegi generáción kívüli pillanatképek és félbemaradt naplók törlése."""
+        keep = {os.path.basename(self.snapshot_name(self.generation))}
+        if self.pending_snapshot is not None:
+            keep.add(os.path.basename(self.pending_snapshot))
+            keep.add(os.path.basename(self.filename + ".new"))
+        for path in list(self._journal_files()):
+            if os.path.basename(path) not in keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    # ---------- rögzítés ----------
+
+    @staticmethod
+    def _write(f, op, data):
+        frame = _FRAME.pack(op, len(data)) + data
+        f.write(frame + _CRC.pack(zlib.crc32(frame)))
+
+    def record(self, op, data=b""):
+        if self.file is None:
+            return
+        self._write(self.file, op, data)
+        if self.next_file is not None:
+            self._write(self.next_file, op, data)
+        self.dirty = True
+        self.ops_since_compact += 1
+
+    def record_shape(self, layer_index, shape):
+        self.record(OP_ADD_SHAPE, _INDEX.pack(layer_index) + pack_shape(shape))
+
+    def record_layer_op(self, op, layer_index):
+        """Egy réteg-indexű művelet: undo, redo, réteg törlése / váltása / kiürítése."""
+        self.record(op, _INDEX.pack(layer_index))
+
+    def record_add_layer(self, name, background_color):
+        self.record(OP_ADD_LAYER, _pack_color(background_color) + name.encode("utf-8"))
+
+    def record_background(self, layer_index, color):
+        self.record(OP_SET_BACKGROUND, _INDEX.pack(layer_index) + _pack_color(color))
+
+    def record_layer_style(self, layer_index, layer):
+        self.record(OP_SET_LAYER_STYLE, _STYLE.pack(layer_index, layer.opacity, BLEND_MODES.index(layer.blend_mode)))
+
+    def record_compaction(self, layer_index, count):
+        self.record(OP_COMPACT_LAYER, _COMPACT.pack(layer_index, count))
+
+    def sync(self):
+        for f in (self.file, self.next_file):
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+        self.dirty = False
+        self.last_sync = time.monotonic()
+
+    def maybe_sync(self):
+        """Kötegelt lemezre írás: legfeljebb sync_ms-enként egy fsync."""
+        if self.dirty and (time.monotonic() - self.last_sync) * 1000 >= self.sync_ms:
+            self.sync()
+
+    # ---------- tömörítés ----------
+
+    def needs_compaction(self):
+        return self.file is not None and self.pending_snapshot is None and self.ops_since_compact >= self.compact_ops
+
+    def begin_compaction(self, current=0):
+        """
+        Új generáció nyitása; visszaadja a pillanatkép fájlnevét, amit a hívó
+        (akár háttérben) megír, majd finish_compaction()-nel jelez vissza. A
+        pillanatkép nem tárolja az aktív réteget (current), ezért az új napló
+        első rekordja az, mint a start()-nál.
+        """
+        self.pending_snapshot = self.snapshot_name(self.generation + 1)
+        self.next_file = self._new_log(self.filename + ".new", self.generation + 1)
+        if current:
+            self._write(self.next_file, OP_SELECT_LAYER, _INDEX.pack(current))
+        self.ops_since_compact = 0
+        return self.pending_snapshot
+
+    def finish_compaction(self, ok):
+        if self.pending_snapshot is None:
+            return
+        new_log, self.next_file = self.next_file, None
+        if ok:
+            new_log.flush()
+            os.fsync(new_log.fileno())
+            new_log.close()
+            self.file.close()
+            os.replace(self.filename + ".new", self.filename)
+            self.file = open(self.filename, "ab")
+            self.generation += 1
+        else:
+            new_log.close()
+            # A régi pár érvényes maradt; a tömörítést később újra megpróbáljuk
+            self.ops_since_compact = self.compact_ops // 2
+        self.pending_snapshot = None
+        self._remove_stale()
+
+    def compact_now(self, document, current=0):
+        """Szinkron tömörítés (pl. fájl betöltése után, amikor a régi napló már nem érvényes)."""
+        if self.pending_snapshot is not None:
+            self.finish_compaction(False)
+        self.start(document, current)
+
+    def close(self):
+        if self.next_file is not None:
+            self.next_file.close()
+            self.next_file = None
+            self.pending_snapshot = None
+        if self.file is not None:
+            if self.dirty:
+                self.sync()
+            self.file.close()
+            self.file = None
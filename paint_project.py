@@ -0,0 +1,449 @@
+"""
+A PaintMEZ saját, réteges projektformátuma (.pmez).
+
+A PNG-mentéssel ellentétben megőrzi a rétegeket (név, láthatóság, háttér),
+az alakzatokat típusos rekordokként, a szabadkézi vonalak tömörített
+pontjait, az undo/redo előzményt, és kérésre a rétegek kirajzolt csempéit
+is, így betöltés után nem kell mindent újraraszterizálni.
+
+Felépítés (minden szám little-endian):
+
+    fejléc      MAGIC, verzió, jelzők, szélesség, magasság, rétegszám
+    könyvtár    rétegenként (eltolás, hossz) -> a rétegblokkok bárhonnan olvashatók
+    rétegblokk  név, láthatóság, háttér, darabszámok, átlátszóság és keverési mód (2. verziótól),
+                alakzat-rekordok (fix 32 bájt; undo- majd redo-sorrendben),
+                vonalpontok int16 tömbként, betöltött bitképek, csempék (RGBA)
+
+Az előzmény-tömörítés alaprasztere (3. verziótól) egyetlen rekord: a csempéi
+a bitképek közé, a csempekulcsai a vonalpontok közé kerülnek. A vödör-kitöltés
+(4. verziótól) szakaszai (y, x0, x1 hármasok) szintén a vonalpontok közé.
+
+A ProjectReader a fájlt memóriába képezi (mmap), a fejlécet és a könyvtárat
+olvassa be azonnal, a rétegeket pedig csak kérésre dekódolja.
+
+Minden írás ideiglenes fájlba történik, amely csak a végén nevezi át magát
+a célra, így egy félbeszakadt mentés nem teszi tönkre a korábbit.
+"""
+import io
+import mmap
+import os
+import struct
+import sys
+from array import array
+from contextlib import contextmanager
+
+import pygame
+
+from paint_core import (
+    BLEND_MODES, Document, FillShape, Layer, LoadedImageShape, RasterShape, TiledRaster, make_shape,
+    shape_bounds,
+)
+
+PROJECT_EXTENSION = ".pmez"
+MAGIC = b"PMEZPROJ"
+VERSION = 4
+
+_HEADER = struct.Struct("<8sHHIII")       # magic, verzió, jelzők, szélesség, magasság, rétegek
+_DIRECTORY_ENTRY = struct.Struct("<QQ")   # rétegblokk eltolása és hossza
+_LAYER_HEAD = struct.Struct("<BB3BxIIIII")  # látható, van háttér, háttér RGB, alakzatok, redo, int16-ok, képek, csempék
+_LAYER_STYLE = struct.Struct("<fB")       # átlátszóság (0..1), keverési mód (BLEND_MODES indexe)
+_SHAPE = struct.Struct("<B3BBxHiiiiII")   # típus, szín, kitöltés, vastagság, 4 koordináta, 2 paraméter
+_IMAGE_HEAD = struct.Struct("<II")
+_TILE_HEAD = struct.Struct("<HHHH")
+
+# A rekordok típuskódjai; a koordináták téglalapnál / ellipszisnél a két sarokpont,
+# vonalnál a befoglaló téglalap (x, y, w, h), a paraméterek pedig a pontok helye
+# (kezdő int16-index, darab) a pont-tömbben, illetve a bitkép sorszáma. Az alapraszternél
+# a koordináták: első csempe-bitkép, csempék száma, beégetett alakzatok száma; a
+# paraméterek a csempekulcsok (tx, ty párok) helye a pont-tömbben. A kitöltésnél a
+# koordináták a befoglaló téglalap, a paraméterek a szakaszok helye, mint a vonalnál.
+SHAPE_CODES = {'rect': 1, 'ellipse': 2, 'line': 3, 'eraser': 4, 'loaded_image': 5, 'raster': 6, 'fill': 7}
+SHAPE_TYPES = {code: name for name, code in SHAPE_CODES.items()}
+
+
+def is_project_file(filename):
+    try:
+        with open(filename, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+# ========== FÁJLBA ÍRÁS ==========
+
+@contextmanager
+def atomic_write(filename):
+    """
+    Bináris írás a filename melletti ideiglenes fájlba; hiba nélküli befejezéskor
+    az lemezre kerül és átnevezéssel a helyére lép, hiba esetén törlődik.
+    """
+    tmp = f"{filename}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, filename)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def encode_png(data, size):
+    """
+    RGBA bájtok PNG-be kódolása. Csak a pygame kell hozzá, így külön folyamatban
+    is futtatható (a pygame a kódolás alatt nem engedi el a GIL-t).
+    """
+    buf = io.BytesIO()
+    pygame.image.save(pygame.image.frombytes(data, size, "RGBA"), buf, "export.png")
+    return buf.getvalue()
+
+def rgba_bytes(surface):
+    """
+    A felület RGBA bájtjai. Alfa-csatorna nélküli felületnél (pl. betöltött
+    JPG, RGB PNG) a pygame "RGBA"-ként nem mindig 255-ös alfát ad, ezért
+    ilyenkor előbb egy SRCALPHA felületre másolunk.
+    """
+    if not surface.get_flags() & pygame.SRCALPHA:
+        opaque = pygame.Surface(surface.get_size(), pygame.SRCALPHA)
+        opaque.blit(surface, (0, 0))
+        surface = opaque
+    return pygame.image.tobytes(surface, "RGBA")
+
+# ========== ÖNÁLLÓ ALAKZAT-REKORD ==========
+
+def pack_shape(shape):
+    """
+    Egy alakzat önálló bájtsorként (pl. a műveletnaplóhoz): a projektfájl
+    rekordja, vonalnál közvetlenül utána a pontok, kitöltésnél a szakaszok.
+    """
+    stype = shape.type
+    if stype in ('rect', 'ellipse'):
+        (x0, y0), (x1, y1) = shape.start, shape.end
+        return _SHAPE.pack(SHAPE_CODES[stype], *shape.color[:3], shape.fill, shape.thickness,
+                           x0, y0, x1, y1, 0, 0)
+    if stype in ('line', 'eraser'):
+        points = array('h', shape.points)
+        if sys.byteorder == "big":
+            points.byteswap()
+        return _SHAPE.pack(SHAPE_CODES[stype], *shape.color[:3], 0, shape.thickness,
+                           0, 0, 0, 0, 0, len(points)) + points.tobytes()
+    if stype == 'fill':
+        runs = array('h', shape.runs)
+        if sys.byteorder == "big":
+            runs.byteswap()
+        b = shape.bounds
+        return _SHAPE.pack(SHAPE_CODES[stype], *shape.color[:3], 0, 0,
+                           b.x, b.y, b.w, b.h, 0, len(runs)) + runs.tobytes()
+    raise ValueError(f"Ez az alakzattípus nem írható önálló rekordba: {stype}")
+
+
+def unpack_shape(data):
+    """A pack_shape() párja."""
+    code, r, g, b, fill, thickness, x0, y0, x1, y1, _, count = _SHAPE.unpack_from(data)
+    stype = SHAPE_TYPES.get(code)
+    if stype in ('rect', 'ellipse'):
+        return make_shape(stype, start=(x0, y0), end=(x1, y1), color=(r, g, b), fill=bool(fill),
+                          thickness=thickness)
+    if stype in ('line', 'eraser', 'fill'):
+        points = array('h')
+        points.frombytes(data[_SHAPE.size:_SHAPE.size + count * 2])
+        if sys.byteorder == "big":
+            points.byteswap()
+        if stype == 'fill':
+            return FillShape(points, (r, g, b), pygame.Rect(x0, y0, x1, y1))
+        return make_shape(stype, points=points, color=(r, g, b), thickness=thickness)
+    raise ValueError(f"Ismeretlen alakzattípus ({code})")
+
+# ========== MENTÉS ==========
+
+def _encode_layer(layer, include_raster):
+    """Egy réteg blokkjának darabjai (bytes-szerű objektumok listája)."""
+    name = layer.name.encode("utf-8")
+    records = []
+    points = array('h')
+    images = []
+    for shape in list(layer.shapes) + list(layer.redo_stack):
+        stype = shape.type
+        code = SHAPE_CODES[stype]
+        if stype in ('rect', 'ellipse'):
+            (x0, y0), (x1, y1) = shape.start, shape.end
+            records.append(_SHAPE.pack(code, *shape.color[:3], shape.fill, shape.thickness,
+                                       x0, y0, x1, y1, 0, 0))
+        elif stype in ('line', 'eraser'):
+            b = shape_bounds(shape)
+            records.append(_SHAPE.pack(code, *shape.color[:3], 0, shape.thickness,
+                                       b.x, b.y, b.w, b.h, len(points), len(shape.points)))
+            points.extend(shape.points)
+        elif stype == 'fill':
+            b = shape.bounds
+            records.append(_SHAPE.pack(code, *shape.color[:3], 0, 0,
+                                       b.x, b.y, b.w, b.h, len(points), len(shape.runs)))
+            points.extend(shape.runs)
+        elif stype == 'raster':
+            keys = sorted(shape.raster.tiles)
+            records.append(_SHAPE.pack(code, 0, 0, 0, 0, 0, len(images), len(keys), shape.baked, 0,
+                                       len(points), 2 * len(keys)))
+            for key in keys:
+                points.extend(key)
+                images.append(shape.raster.tiles[key])
+        else:
+            records.append(_SHAPE.pack(code, 0, 0, 0, 0, 0, 0, 0, 0, 0, len(images), 0))
+            images.append(shape.surface)
+
+    tiles = []
+    if include_raster:
+        # Csak a ténylegesen létező csempék kerülnek be; a többi a háttérszín
+        tiles = sorted(layer.render().tiles.items())
+
+    bg = layer.background_color
+    chunks = [
+        struct.pack("<H", len(name)), name,
+        _LAYER_HEAD.pack(layer.visible, bg is not None, *(bg[:3] if bg is not None else (0, 0, 0)),
+                         len(layer.shapes), len(layer.redo_stack), len(points), len(images), len(tiles)),
+        _LAYER_STYLE.pack(layer.opacity, BLEND_MODES.index(layer.blend_mode)),
+        b"".join(records),
+    ]
+    if sys.byteorder == "big":
+        points.byteswap()
+    chunks.append(points.tobytes())
+    for surf in images:
+        chunks.append(_IMAGE_HEAD.pack(*surf.get_size()))
+        chunks.append(rgba_bytes(surf))
+    for (tx, ty), tile in tiles:
+        chunks.append(_TILE_HEAD.pack(tx, ty, *tile.get_size()))
+        chunks.append(pygame.image.tobytes(tile, "RGBA"))
+    return chunks
+
+
+def save_project(document, filename, include_rasters=False, progress=None):
+    """
+    A dokumentum kiírása rétegenként, folyamatosan: a fejléc és a könyvtár
+    helye előre lefoglalódik, a rétegblokkok egymás után íródnak, végül a
+    könyvtár a valós eltolásokkal töltődik ki. A progress(kész, összes)
+    minden réteg után meghívódik, ha meg van adva.
+    """
+    with atomic_write(filename) as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, 0, document.size[0], document.size[1], len(document.layers)))
+        directory_pos = f.tell()
+        f.write(b"\0" * _DIRECTORY_ENTRY.size * len(document.layers))
+        entries = []
+        for layer in document.layers:
+            start = f.tell()
+            for chunk in _encode_layer(layer, include_rasters):
+                f.write(chunk)
+            entries.append((start, f.tell() - start))
+            if progress is not None:
+                progress(len(entries), len(document.layers))
+        f.seek(directory_pos)
+        for entry in entries:
+            f.write(_DIRECTORY_ENTRY.pack(*entry))
+
+# ========== BETÖLTÉS ==========
+
+class ProjectReader:
+    """
+    Megnyitott projektfájl. A fejléc és a rétegkönyvtár azonnal beolvasódik,
+    a rétegek tartalma csak a read_layer() hívásakor, közvetlenül a memóriába
+    képzett fájlból; a pontok tömbjei egyetlen másolással kerülnek az alakzatokba.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Üres vagy nem leképezhető fájl; a fejléc-ellenőrzés úgyis elutasítja
+            self._map = self._file.read()
+        self._view = memoryview(self._map)
+        if len(self._view) < _HEADER.size:
+            self.close()
+            raise ValueError(f"Nem PaintMEZ projektfájl: {filename}")
+        magic, version, _, width, height, count = _HEADER.unpack_from(self._view)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Nem PaintMEZ projektfájl: {filename}")
+        if version > VERSION:
+            self.close()
+            raise ValueError(f"Újabb projektverzió ({version}), mint amit ez a program ismer ({VERSION})")
+        self.version = version
+        self.size = (width, height)
+        try:
+            self.directory = [_DIRECTORY_ENTRY.unpack_from(self._view, _HEADER.size + i * _DIRECTORY_ENTRY.size)
+                              for i in range(count)]
+        except struct.error:
+            self.close()
+            raise ValueError(f"Sérült vagy csonka projektfájl: {filename}") from None
+        if any(offset + length > len(self._view) for offset, length in self.directory):
+            self.close()
+            raise ValueError(f"Sérült vagy csonka projektfájl: {filename}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if isinstance(self._map, mmap.mmap):
+            try:
+                self._map.close()
+            except BufferError:
+                # Egy szelet még él (pl. egy kivétel traceback-jében); a leképezés
+                # akkor záródik, amikor az is felszabadul
+                pass
+        self._file.close()
+
+    def _corrupt(self, index, error):
+        return ValueError(f"Sérült vagy csonka projektfájl: {self.filename} ({index}. réteg: {error})")
+
+    @property
+    def layer_count(self):
+        return len(self.directory)
+
+    def _layer_head(self, index):
+        """
+        A rétegblokk szelete és fejléce. A szeletet a hívó engedi el (release()),
+        különben az mmap nem zárható be; hibánál ez itt történik meg.
+        """
+        offset, length = self.directory[index]
+        view = self._view[offset:offset + length]
+        try:
+            (name_len,) = struct.unpack_from("<H", view)
+            pos = 2 + name_len
+            name = bytes(view[2:pos]).decode("utf-8")
+            head = _LAYER_HEAD.unpack_from(view, pos)
+            pos += _LAYER_HEAD.size
+            style = (1.0, 0)
+            if self.version >= 2:
+                opacity, blend = _LAYER_STYLE.unpack_from(view, pos)
+                style = (round(opacity, 6), blend)  # float32-ből
+                pos += _LAYER_STYLE.size
+        except (struct.error, UnicodeDecodeError) as e:
+            view.release()
+            raise self._corrupt(index, e) from None
+        return view, name, head, style, pos
+
+    @staticmethod
+    def _blend_mode(code):
+        if code >= len(BLEND_MODES):
+            raise ValueError(f"Ismeretlen keverési mód a projektben ({code})")
+        return BLEND_MODES[code]
+
+    def layer_info(self, index):
+        """A réteg adatai a tartalom dekódolása nélkül."""
+        view, name, head, (opacity, blend), _ = self._layer_head(index)
+        view.release()
+        visible, has_bg, r, g, b, shapes, redo, values, images, tiles = head
+        return {"name": name, "visible": bool(visible), "background_color": (r, g, b) if has_bg else None,
+                "opacity": opacity, "blend_mode": self._blend_mode(blend),
+                "shapes": shapes, "redo": redo, "points": values // 2, "images": images, "tiles": tiles}
+
+    def read_layer(self, index, include_raster=True):
+        """
+        Az index-edik réteg dekódolása egy (dokumentumhoz még nem adott) Layer-be.
+        Sérült vagy csonka rétegblokknál ValueError.
+        """
+        view, name, head, (opacity, blend), pos = self._layer_head(index)
+        try:
+            return self._decode_layer(view, name, head, opacity, blend, pos, include_raster)
+        except (struct.error, IndexError, KeyError) as e:
+            raise self._corrupt(index, e) from None
+        finally:
+            # A szeletek elengedése nélkül a close() nem tudná lezárni az mmap-et
+            view.release()
+
+    def _decode_layer(self, view, name, head, opacity, blend, pos, include_raster):
+        visible, has_bg, r, g, b, shape_count, redo_count, value_count, image_count, tile_count = head
+        layer = Layer(name=name, background_color=(r, g, b) if has_bg else None)
+        layer.visible = bool(visible)
+        layer.opacity = opacity
+        layer.blend_mode = self._blend_mode(blend)
+
+        record_count = shape_count + redo_count
+        # Másolat (rekordonként 32 bájt), így nem marad élő szelet az mmap-re
+        records = bytes(view[pos:pos + record_count * _SHAPE.size])
+        pos += record_count * _SHAPE.size
+        points_pos = pos
+        pos += value_count * 2
+        if pos > len(view):
+            raise IndexError("a rekordok és a pontok túlnyúlnak a rétegblokkon")
+
+        images = []
+        for _ in range(image_count):
+            w, h = _IMAGE_HEAD.unpack_from(view, pos)
+            pos += _IMAGE_HEAD.size
+            images.append(pygame.image.frombytes(bytes(view[pos:pos + w * h * 4]), (w, h), "RGBA"))
+            pos += w * h * 4
+
+        swap = sys.byteorder == "big"
+        shapes = []
+        bounds = []
+        for code, cr, cg, cb, fill, thickness, x0, y0, x1, y1, p0, p1 in _SHAPE.iter_unpack(records):
+            stype = SHAPE_TYPES.get(code)
+            if stype in ('rect', 'ellipse'):
+                shape = make_shape(stype, start=(x0, y0), end=(x1, y1), color=(cr, cg, cb),
+                                   fill=bool(fill), thickness=thickness)
+                bounds.append(None)
+            elif stype in ('line', 'eraser'):
+                packed = array('h')
+                packed.frombytes(view[points_pos + p0 * 2:points_pos + (p0 + p1) * 2])
+                if swap:
+                    packed.byteswap()
+                shape = make_shape(stype, points=packed, color=(cr, cg, cb), thickness=thickness)
+                bounds.append(pygame.Rect(x0, y0, x1, y1))
+            elif stype == 'fill':
+                runs = array('h')
+                runs.frombytes(view[points_pos + p0 * 2:points_pos + (p0 + p1) * 2])
+                if swap:
+                    runs.byteswap()
+                shape = FillShape(runs, (cr, cg, cb), pygame.Rect(x0, y0, x1, y1))
+                bounds.append(None)
+            elif stype == 'loaded_image':
+                shape = LoadedImageShape(images[p0])
+                bounds.append(None)
+            elif stype == 'raster':
+                keys = array('h')
+                keys.frombytes(view[points_pos + p0 * 2:points_pos + (p0 + p1) * 2])
+                if swap:
+                    keys.byteswap()
+                raster = TiledRaster(self.size)
+                raster.tiles = {(keys[2 * i], keys[2 * i + 1]): images[x0 + i] for i in range(y0)}
+                shape = RasterShape(raster, x1)
+                bounds.append(None)
+            else:
+                raise ValueError(f"Ismeretlen alakzattípus ({code}) a(z) {name!r} rétegben")
+            shapes.append(shape)
+
+        layer.shapes = shapes[:shape_count]
+        layer.redo_stack = shapes[shape_count:]
+        layer.index.extend(rect if rect is not None else shape_bounds(shape)
+                           for shape, rect in zip(layer.shapes, bounds))
+
+        if include_raster and tile_count:
+            raster = TiledRaster(self.size, layer.background_color)
+            for _ in range(tile_count):
+                tx, ty, w, h = _TILE_HEAD.unpack_from(view, pos)
+                pos += _TILE_HEAD.size
+                raster.tiles[(tx, ty)] = pygame.image.frombytes(bytes(view[pos:pos + w * h * 4]), (w, h), "RGBA")
+                pos += w * h * 4
+            layer.cache = raster
+            layer.cache_valid = True
+        return layer
+
+    def read_document(self, include_rasters=True):
+        document = Document(self.size)
+        for i in range(self.layer_count):
+            document.add_layer(self.read_layer(i, include_rasters))
+        return document
+
+
+def load_project(filename, include_rasters=True):
+    with ProjectReader(filename) as reader:
+        return reader.read_document(include_rasters)
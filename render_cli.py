@@ -0,0 +1,97 @@
+"""
+Mentett PaintMEZ dokumentumok (.pmez projekt vagy PNG) kötegelt kirajzolása
+PNG-be, ablak nélkül.
+
+A --size a kész képet méretezi át; a --scale ehelyett az alakzatokat rajzolja
+újra a kért léptékben (nyomtatáshoz), sávonként, párhuzamos folyamatokban.
+
+Példa:
+    python render_cli.py rajz1.pmez rajz2.png --size 2600x1520 --out-dir kimenet
+    python render_cli.py rajz1.pmez --scale 8 --jobs 4
+"""
+import argparse
+import os
+import sys
+
+# Kijelző nélkül is fusson (szerveren, CI-ban); a paint_core nem nyit ablakot
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+
+from paint_core import load_document
+from paint_export import export_pool, export_scaled
+
+
+def parse_size(text):
+    try:
+        w, h = (int(v) for v in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Hibás méret: {text!r} (pl. 1300x760)")
+    if w <= 0 or h <= 0:
+        raise argparse.ArgumentTypeError(f"A méretnek pozitívnak kell lennie: {text!r}")
+    return (w, h)
+
+
+def parse_scale(text):
+    try:
+        scale = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Hibás lépték: {text!r} (pl. 4)")
+    if scale <= 0:
+        raise argparse.ArgumentTypeError(f"A léptéknek pozitívnak kell lennie: {text!r}")
+    return scale
+
+
+def output_path(source, out_dir, suffix):
+    base = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(out_dir or os.path.dirname(source) or ".", f"{base}{suffix}.png")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PaintMEZ dokumentumok kirajzolása PNG-be.")
+    parser.add_argument("documents", nargs="+", help="A kirajzolandó dokumentumok (.pmez vagy bitkép)")
+    parser.add_argument("--size", type=parse_size, default=None,
+                        help="Kimeneti méret SZÉLESSÉGxMAGASSÁG formában (alapból a dokumentum mérete)")
+    parser.add_argument("--scale", type=parse_scale, default=None,
+                        help="Újrarajzolás ennyiszeres léptékben (a --size helyett)")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Párhuzamos folyamatok a --scale-hez (alapból a magok száma, 0 = egy folyamat)")
+    parser.add_argument("--out-dir", default=None, help="Kimeneti mappa (alapból a forrás mellé)")
+    parser.add_argument("--suffix", default="_render", help="A kimeneti fájlnév utótagja")
+    args = parser.parse_args(argv)
+    if args.scale is not None and args.size is not None:
+        parser.error("A --size és a --scale nem adható meg egyszerre")
+
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    # A munkafolyamatok az összes dokumentumhoz közösek
+    pool = export_pool(args.jobs) if args.scale is not None and args.jobs != 0 else None
+    failed = 0
+    try:
+        for source in args.documents:
+            target = output_path(source, args.out_dir, args.suffix)
+            try:
+                document = load_document(source)
+                if args.scale is not None:
+                    export_scaled(document, target, args.scale, executor=pool, workers=args.jobs)
+                else:
+                    pygame.image.save(document.render(args.size), target)
+            except (pygame.error, OSError, ValueError) as e:
+                failed += 1
+                print(f"Hiba: {source}: {e}", file=sys.stderr)
+                continue
+            except Exception as e:
+                # Egy váratlanul elbukó dokumentum se állítsa le a köteg többi részét
+                failed += 1
+                print(f"Hiba: {source}: {type(e).__name__}: {e}", file=sys.stderr)
+                continue
+            print(f"{source} -> {target}")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
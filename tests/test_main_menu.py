@@ -0,0 +1,33 @@
+"""A PaintMEZ UI-sáv elrendezésének tesztjei (ablak nélkül)."""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+
+import main_menu
+
+
+def test_toolbar_widgets_fit_in_toolbar():
+    main_menu.layout_buttons_in_rows()
+    main_menu.toolbar.rebuild()
+
+    widgets = main_menu.ui_widgets()
+    assert "Vödör" in [btn.text for btn in main_menu.buttons]
+    for w in widgets:
+        assert main_menu.TOOLBAR_RECT.contains(w.dirty_rect), w.dirty_rect
+    # Egymást sem takarhatják (a csúszka képe a felirata miatt magasabb)
+    rects = [w.dirty_rect for w in widgets]
+    for i, rect in enumerate(rects):
+        assert rect.collidelist(rects[i + 1:]) == -1, rect
+
+
+def test_toolbar_click_is_not_passed_to_canvas():
+    main_menu.layout_buttons_in_rows()
+    swatch = main_menu.color_swatches[1]
+    event = pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=swatch.rect.center)
+    assert swatch.handle_event(event)
+    assert main_menu.current_color == swatch.color
+
+    outside = pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=main_menu.CANVAS_RECT.center)
+    assert not any(w.handle_event(outside) for w in main_menu.ui_widgets())
@@ -0,0 +1,92 @@
+"""A paint_core regressziós tesztjei (ablak nélkül)."""
+import os
+import random
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import pytest
+
+import paint_core
+from paint_core import WHITE, Document, Layer, make_shape
+
+SIZE = (700, 500)
+
+
+def random_shape(rng):
+    stype = rng.choice(['rect', 'ellipse', 'line', 'eraser'])
+    color = rng.choice([(255, 0, 0), (0, 0, 255), (0, 0, 0)])
+    thickness = rng.randint(1, 25)
+    if stype in ('rect', 'ellipse'):
+        start = (rng.randrange(SIZE[0]), rng.randrange(SIZE[1]))
+        end = (start[0] + rng.randint(-300, 300), start[1] + rng.randint(-300, 300))
+        return make_shape(stype, start=start, end=end, color=color, fill=rng.random() < 0.3, thickness=thickness)
+    points = [(rng.randrange(SIZE[0]), rng.randrange(SIZE[1])) for _ in range(rng.randint(2, 8))]
+    return make_shape(stype, points=points, color=color, thickness=thickness)
+
+
+def layer_pixels(layer):
+    surface = pygame.Surface(layer.size, pygame.SRCALPHA)
+    layer.render().blit_to(surface, surface.get_rect(), (0, 0))
+    return pygame.image.tobytes(surface, "RGBA")
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_undo_matches_full_rebuild(seed):
+    """A részleges újrarajzolás (undo) ugyanazt a képet adja, mint a teljes újraépítés."""
+    rng = random.Random(seed)
+    document = Document(SIZE)
+    layer = Layer(background_color=WHITE if seed % 2 else None)
+    document.add_layer(layer)
+    for _ in range(40):
+        layer.add_shape(random_shape(rng))
+    for _ in range(15):
+        layer.pop_shape()
+        undone = layer_pixels(layer)
+        layer.checkpoints.clear()
+        layer.invalidate()
+        assert undone == layer_pixels(layer)
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_compaction_undo_redo_match_full_rebuild(seed, monkeypatch):
+    """
+    Tömörítés, undo és redo tetszőleges sorrendben: a kép mindig egyezik a
+    soha nem tömörített előzmény teljes újraépítésével.
+    """
+    # Sűrű ellenőrzőpontok szűk kerettel, hogy a kiszorítás is sorra kerüljön
+    monkeypatch.setattr(paint_core, "CHECKPOINT_INTERVAL", 4)
+    monkeypatch.setattr(paint_core, "CHECKPOINT_BUDGET_MB", 2)
+    rng = random.Random(seed)
+    document = Document(SIZE)
+    layer = Layer(background_color=WHITE if seed % 2 else None)
+    document.add_layer(layer)
+    reference = Layer(background_color=layer.background_color)
+    Document(SIZE).add_layer(reference)
+    layer_pixels(layer)
+
+    for step in range(120):
+        roll = rng.random()
+        if roll < 0.45:
+            shape = random_shape(rng)
+            for target in (layer, reference):
+                target.redo_stack.clear()
+                target.add_shape(shape)
+        elif roll < 0.7:
+            if layer.can_undo():
+                for target in (layer, reference):
+                    target.redo_stack.append(target.pop_shape())
+        elif roll < 0.9:
+            if layer.redo_stack:
+                for target in (layer, reference):
+                    target.add_shape(target.redo_stack.pop())
+        else:
+            layer.compact(rng.randint(1, max(1, len(layer.shapes) - 2)))
+        if step % 3 == 0:
+            assert layer_pixels(layer) == layer_pixels(reference)
+
+    assert layer.shapes[0].type == 'raster'
+    assert layer_pixels(layer) == layer_pixels(reference)
+    reference.checkpoints.clear()
+    reference.invalidate()
+    assert layer_pixels(layer) == layer_pixels(reference)
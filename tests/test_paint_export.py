@@ -0,0 +1,108 @@
+"""A paint_export sávos PNG-exportjának tesztjei (ablak nélkül)."""
+import os
+import random
+import struct
+import zlib
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import pytest
+
+import paint_export
+from paint_core import WHITE, Document, FillShape, Layer, LoadedImageShape, make_shape
+from paint_export import PNG_SIGNATURE, adler32_combine, export_scaled
+
+SIZE = (420, 610)
+
+
+def sample_document():
+    """Rétegek átlátszósággal, keverési móddal, rejtett réteggel és minden alakzattípussal."""
+    rng = random.Random(5)
+    document = Document(SIZE)
+    base = Layer(name="Alap", background_color=WHITE)
+    document.add_layer(base)
+    for i in range(30):
+        x, y = rng.randrange(SIZE[0]), rng.randrange(SIZE[1])
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        if i % 3 == 0:
+            base.add_shape(make_shape('ellipse', start=(x, y), end=(x + rng.randint(-150, 150), y + 200),
+                                      color=color, fill=i % 2 == 0, thickness=rng.randint(1, 9)))
+        else:
+            points = [(rng.randrange(-50, SIZE[0] + 50), rng.randrange(-50, SIZE[1] + 50)) for _ in range(5)]
+            base.add_shape(make_shape('line', points=points, color=color, thickness=rng.randint(1, 20)))
+    base.compact(10)
+    base.add_shape(FillShape([300, 10, 200, 301, 5, 210, 302, 0, 220], (0, 90, 0)))
+    image = pygame.Surface((70, 300), pygame.SRCALPHA)
+    image.fill((200, 50, 20, 160))
+    base.add_shape(LoadedImageShape(image))
+
+    multiply = Layer(name="Szorzás")
+    document.add_layer(multiply)
+    multiply.blend_mode = 'multiply'
+    multiply.opacity = 0.6
+    multiply.add_shape(make_shape('rect', start=(40, 100), end=(380, 560), color=(255, 200, 0), fill=True))
+    multiply.add_shape(make_shape('eraser', points=[(0, 0), (419, 609)], thickness=25))
+
+    hidden = Layer(name="Rejtett", background_color=(0, 0, 0))
+    document.add_layer(hidden)
+    hidden.visible = False
+    return document
+
+
+def read_png(filename):
+    """(szélesség, magasság, az IDAT-darabok összefűzött tartalma); a CRC-ket is ellenőrzi."""
+    with open(filename, "rb") as f:
+        data = f.read()
+    assert data.startswith(PNG_SIGNATURE)
+    pos = len(PNG_SIGNATURE)
+    idat = []
+    size = None
+    while pos < len(data):
+        (length,) = struct.unpack_from(">I", data, pos)
+        kind = data[pos + 4:pos + 8]
+        body = data[pos + 8:pos + 8 + length]
+        (crc,) = struct.unpack_from(">I", data, pos + 8 + length)
+        assert zlib.crc32(body, zlib.crc32(kind)) == crc
+        if kind == b"IHDR":
+            size = struct.unpack_from(">II", body)
+        elif kind == b"IDAT":
+            idat.append(body)
+        pos += 12 + length
+    assert kind == b"IEND"
+    return size[0], size[1], b"".join(idat)
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+@pytest.mark.parametrize("band_rows", [256, 37])
+def test_scale_one_matches_flatten(tmp_path, monkeypatch, workers, band_rows):
+    monkeypatch.setattr(paint_export, "EXPORT_BAND_ROWS", band_rows)
+    document = sample_document()
+    filename = str(tmp_path / "export.png")
+    progress = []
+    assert export_scaled(document, filename, 1, workers=workers,
+                         progress=lambda done, total: progress.append((done, total))) == SIZE
+    bands = -(-SIZE[1] // band_rows)
+    assert progress == [(i + 1, bands) for i in range(bands)]
+
+    expected = pygame.image.tobytes(document.flatten(), "RGBA")
+    assert pygame.image.tobytes(pygame.image.load(filename), "RGBA") == expected
+
+    # A sávonként tömörített folyamok egyetlen érvényes zlib-folyammá állnak össze;
+    # a decompress() az összevont adler32-t is ellenőrzi
+    width, height, stream = read_png(filename)
+    assert (width, height) == SIZE
+    raw = zlib.decompress(stream)
+    stride = width * 4 + 1
+    assert len(raw) == height * stride
+    assert raw[::stride] == bytes(height)   # minden sor szűrés nélküli (0)
+    assert b"".join(raw[y * stride + 1:(y + 1) * stride] for y in range(height)) == expected
+
+
+def test_adler32_combine():
+    rng = random.Random(1)
+    data = bytes(rng.randrange(256) for _ in range(200000))
+    for cut in (0, 1, 5552, 65521, 100000, len(data)):
+        first, second = data[:cut], data[cut:]
+        combined = adler32_combine(zlib.adler32(first), zlib.adler32(second), len(second))
+        assert combined == zlib.adler32(data)
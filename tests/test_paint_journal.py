@@ -0,0 +1,180 @@
+"""A paint_journal visszaállításának tesztjei (ablak nélkül)."""
+import os
+import random
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+
+from paint_core import WHITE, Document, Layer, make_shape
+from paint_journal import (
+    OP_CLEAR_LAYER, OP_REDO, OP_SELECT_LAYER, OP_UNDO, Journal, read_records,
+)
+from paint_project import save_project
+
+SIZE = (500, 350)
+
+
+def random_shape(rng):
+    color = rng.choice([(255, 0, 0), (0, 0, 255), (0, 0, 0)])
+    if rng.random() < 0.5:
+        start = (rng.randrange(SIZE[0]), rng.randrange(SIZE[1]))
+        end = (rng.randrange(SIZE[0]), rng.randrange(SIZE[1]))
+        return make_shape(rng.choice(['rect', 'ellipse']), start=start, end=end, color=color,
+                          fill=rng.random() < 0.3, thickness=rng.randint(1, 9))
+    points = [(rng.randrange(SIZE[0]), rng.randrange(SIZE[1])) for _ in range(rng.randint(2, 6))]
+    return make_shape(rng.choice(['line', 'eraser']), points=points, color=color, thickness=rng.randint(1, 15))
+
+
+class Session:
+    """A main_menu műveletei (rajz, undo, redo, rétegek, tömörítés) naplózva, ablak nélkül."""
+    def __init__(self, filename):
+        self.document = Document(SIZE)
+        self.document.add_layer(Layer(name="Base Layer", background_color=WHITE))
+        self.current = 0
+        self.journal = Journal(filename, sync_ms=0)
+        self.journal.start(self.document)
+
+    def draw(self, shape):
+        layer = self.document.layers[self.current]
+        layer.redo_stack.clear()
+        layer.add_shape(shape)
+        self.journal.record_shape(self.current, shape)
+
+    def undo(self):
+        layer = self.document.layers[self.current]
+        if layer.can_undo():
+            layer.redo_stack.append(layer.pop_shape())
+            self.journal.record_layer_op(OP_UNDO, self.current)
+
+    def redo(self):
+        layer = self.document.layers[self.current]
+        if layer.redo_stack:
+            layer.add_shape(layer.redo_stack.pop())
+            self.journal.record_layer_op(OP_REDO, self.current)
+
+    def random_op(self, rng):
+        roll = rng.random()
+        if roll < 0.6:
+            self.draw(random_shape(rng))
+        elif roll < 0.75:
+            self.undo()
+        elif roll < 0.85:
+            self.redo()
+        elif roll < 0.9 and len(self.document.layers) < 4:
+            layer = Layer(name=f"Layer {len(self.document.layers)}")
+            self.document.add_layer(layer)
+            self.journal.record_add_layer(layer.name, layer.background_color)
+        elif roll < 0.95:
+            self.current = rng.randrange(len(self.document.layers))
+            self.journal.record_layer_op(OP_SELECT_LAYER, self.current)
+        elif roll < 0.97:
+            self.document.layers[self.current].clear()
+            self.journal.record_layer_op(OP_CLEAR_LAYER, self.current)
+        else:
+            layer = self.document.layers[self.current]
+            count = len(layer.shapes) // 2
+            if count:
+                layer.compact(count)
+                self.journal.record_compaction(self.current, count)
+
+    def compact_in_background(self, ops_meanwhile, rng):
+        """Tömörítés úgy, mint a háttérmentésnél: a pillanatkép elkészülte előtt még jönnek műveletek."""
+        snapshot = self.document.snapshot()
+        filename = self.journal.begin_compaction(self.current)
+        for _ in range(ops_meanwhile):
+            self.random_op(rng)
+        save_project(snapshot, filename)
+        self.journal.finish_compaction(True)
+
+
+def pixels(document):
+    return pygame.image.tobytes(document.flatten(), "RGBA")
+
+
+def assert_same_document(restored, live):
+    assert [layer.name for layer in restored.layers] == [layer.name for layer in live.layers]
+    for a, b in zip(restored.layers, live.layers):
+        assert len(a.shapes) == len(b.shapes)
+        assert len(a.redo_stack) == len(b.redo_stack)
+    assert pixels(restored) == pixels(live)
+
+
+def test_replay_matches_live_session(tmp_path):
+    filename = str(tmp_path / "autosave.journal")
+    rng = random.Random(7)
+    session = Session(filename)
+    for _ in range(3):
+        for _ in range(60):
+            session.random_op(rng)
+        session.compact_in_background(15, rng)
+    for _ in range(40):
+        session.random_op(rng)
+    session.journal.close()
+
+    journal = Journal(filename)
+    document, current, replayed = journal.restore()
+    journal.close()
+    assert replayed > 40
+    assert current == session.current
+    assert_same_document(document, session.document)
+    # A régi generációk pillanatképei törlődtek
+    assert sorted(os.listdir(tmp_path)) == ["autosave.journal", f"autosave.journal.{journal.generation}.pmez"]
+
+
+def test_torn_or_corrupt_tail_is_dropped(tmp_path):
+    filename = str(tmp_path / "autosave.journal")
+    rng = random.Random(3)
+    session = Session(filename)
+    for _ in range(20):
+        session.draw(random_shape(rng))
+    expected = pixels(session.document)
+    session.journal.close()
+
+    # Egy ép rekord után egy félbeszakadt, majd egy hibás CRC-jű
+    with open(filename, "rb") as f:
+        intact = f.read()
+    session.journal.file = open(filename, "ab")
+    session.draw(random_shape(rng))
+    session.journal.close()
+    with open(filename, "rb") as f:
+        extra = f.read()[len(intact):]
+    for tail in (extra[:-3], extra[:-1] + bytes([extra[-1] ^ 0xFF])):
+        with open(filename, "wb") as f:
+            f.write(intact + tail)
+        journal = Journal(filename)
+        document, _, replayed = journal.restore()
+        assert replayed == 20
+        assert pixels(document) == expected
+        # A hibás farok levágódik, az új rekordok az ép rész után jönnek
+        assert os.path.getsize(filename) == len(intact)
+        journal.record_layer_op(OP_UNDO, 0)
+        journal.close()
+        assert len(read_records(filename)[1]) == 21
+
+
+def test_unreadable_journal_is_set_aside(tmp_path):
+    filename = str(tmp_path / "autosave.journal")
+    session = Session(filename)
+    session.draw(make_shape('rect', start=(1, 1), end=(50, 50), color=(255, 0, 0)))
+    session.journal.close()
+    snapshot = session.journal.snapshot_name(session.journal.generation)
+    # Értelmes fejléc, de a pillanatkép sérült
+    with open(snapshot, "r+b") as f:
+        f.write(b"garbage!")
+
+    journal = Journal(filename)
+    assert journal.restore() is None
+    assert sorted(os.listdir(tmp_path)) == ["autosave.journal.1.pmez.bad", "autosave.journal.bad"]
+
+    # Az új munkamenet a félretett fájlokat nem bántja
+    journal.start(Document(SIZE))
+    journal.close()
+    assert "autosave.journal.bad" in os.listdir(tmp_path)
+    assert "autosave.journal.1.pmez.bad" in os.listdir(tmp_path)
+
+    # Nem is napló: szintén félrekerül
+    with open(filename, "wb") as f:
+        f.write(b"nem napl\xf3")
+    assert Journal(filename).restore() is None
+    assert not os.path.exists(filename)
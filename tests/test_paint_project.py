@@ -0,0 +1,181 @@
+"""A paint_project (.pmez) formátum regressziós tesztjei (ablak nélkül)."""
+import os
+import struct
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import pytest
+
+import paint_project
+from paint_core import WHITE, Document, FillShape, Layer, LoadedImageShape, make_shape
+from paint_project import load_project, pack_shape, save_project, unpack_shape
+
+SIZE = (600, 400)
+
+
+def sample_document():
+    """Két réteg minden alakzattípussal, beégetett alapraszterrel és redo-veremmel."""
+    document = Document(SIZE)
+    base = Layer(name="Alap", background_color=WHITE)
+    document.add_layer(base)
+    base.add_shape(make_shape('rect', start=(10, 10), end=(200, 120), color=(255, 0, 0), fill=True, thickness=1))
+    base.add_shape(make_shape('ellipse', start=(300, 50), end=(150, 300), color=(0, 0, 255), fill=False,
+                              thickness=7))
+    base.add_shape(make_shape('line', points=[(5, 390), (300, 20), (595, 390)], color=(0, 128, 0), thickness=4))
+    base.compact(2)  # az első két alakzatból alapraszter lesz
+    base.add_shape(make_shape('eraser', points=[(0, 0), (599, 399)], thickness=12))
+    base.add_shape(FillShape([50, 20, 80, 51, 18, 82, 52, 25, 60], (10, 20, 30)))
+    image = pygame.Surface((40, 30), pygame.SRCALPHA)
+    image.fill((200, 100, 50, 128))
+    base.add_shape(LoadedImageShape(image))
+    base.redo_stack.append(make_shape('rect', start=(1, 2), end=(3, 4), color=(9, 9, 9), fill=False,
+                                      thickness=2))
+    base.redo_stack.append(make_shape('line', points=[(7, 8), (9, 10)], color=(1, 2, 3), thickness=3))
+
+    top = Layer(name="Felső réteg")
+    document.add_layer(top)
+    top.opacity = 0.5
+    top.blend_mode = 'multiply'
+    top.visible = False
+    top.add_shape(make_shape('line', points=[(-20, 5), (620, 395)], color=(90, 0, 90), thickness=9))
+    return document
+
+
+def pixels(surface):
+    return pygame.image.tobytes(surface, "RGBA")
+
+
+def assert_shapes_equal(loaded, original):
+    assert [shape.type for shape in loaded] == [shape.type for shape in original]
+    for a, b in zip(loaded, original):
+        if a.type == 'loaded_image':
+            assert pixels(a.surface) == pixels(b.surface)
+        elif a.type == 'raster':
+            assert a.baked == b.baked
+            assert sorted(a.raster.tiles) == sorted(b.raster.tiles)
+            for key, tile in b.raster.tiles.items():
+                assert pixels(a.raster.tiles[key]) == pixels(tile)
+        else:
+            assert a == b
+
+
+@pytest.mark.parametrize("include_rasters", [False, True])
+def test_round_trip(tmp_path, include_rasters):
+    document = sample_document()
+    filename = tmp_path / "doc.pmez"
+    save_project(document, filename, include_rasters=include_rasters)
+    loaded = load_project(filename)
+
+    assert loaded.size == document.size
+    assert len(loaded.layers) == len(document.layers)
+    for a, b in zip(loaded.layers, document.layers):
+        assert (a.name, a.visible, a.background_color, a.opacity, a.blend_mode) == \
+               (b.name, b.visible, b.background_color, b.opacity, b.blend_mode)
+        assert_shapes_equal(a.shapes, b.shapes)
+        assert_shapes_equal(a.redo_stack, b.redo_stack)
+        assert a.cache_valid == (include_rasters and bool(b.render().tiles))
+    assert pixels(loaded.flatten()) == pixels(document.flatten())
+
+    # Az undo / redo a betöltött előzményen is ugyanoda vezet
+    for doc in (document, loaded):
+        layer = doc.layers[0]
+        layer.redo_stack.append(layer.pop_shape())
+        layer.add_shape(layer.redo_stack.pop())
+        layer.add_shape(layer.redo_stack.pop())
+    assert pixels(loaded.flatten()) == pixels(document.flatten())
+
+
+def test_pack_shape_round_trip():
+    shapes = [
+        make_shape('rect', start=(-5, 7), end=(100, -3), color=(1, 2, 3), fill=True, thickness=2),
+        make_shape('ellipse', start=(0, 0), end=(30, 40), color=(4, 5, 6), fill=False, thickness=5),
+        make_shape('line', points=[(1, 2), (-3, 4), (32000, -32000)], color=(7, 8, 9), thickness=3),
+        make_shape('eraser', points=[(10, 10), (20, 20)], thickness=8),
+        FillShape([3, 1, 9, 4, 0, 11], (10, 11, 12)),
+    ]
+    for shape in shapes:
+        assert unpack_shape(pack_shape(shape)) == shape
+    with pytest.raises(ValueError):
+        pack_shape(LoadedImageShape(pygame.Surface((2, 2))))
+
+
+def test_truncated_or_corrupted_file_raises_value_error(tmp_path):
+    filename = tmp_path / "doc.pmez"
+    save_project(sample_document(), filename, include_rasters=True)
+    data = filename.read_bytes()
+    broken = tmp_path / "broken.pmez"
+
+    # Minden csonkítás (a fájl egyetlen bájtja sem felesleges) ValueError-t ad
+    for length in range(0, len(data), max(1, len(data) // 997)):
+        broken.write_bytes(data[:length])
+        with pytest.raises(ValueError):
+            load_project(broken)
+
+    # Könyvtár a fájlon túlra, hamis darabszámok, ismeretlen alakzattípus
+    header = paint_project._HEADER.size
+    entry = paint_project._DIRECTORY_ENTRY
+    offset, length = entry.unpack_from(data, header)
+    name_len = struct.unpack_from("<H", data, offset)[0]
+    head_pos = offset + 2 + name_len
+    record_pos = head_pos + paint_project._LAYER_HEAD.size + paint_project._LAYER_STYLE.size
+    corruptions = [
+        data[:header] + entry.pack(offset, len(data)) + data[header + entry.size:],
+        data[:head_pos + 6] + struct.pack("<I", 10 ** 6) + data[head_pos + 10:],
+        data[:record_pos] + b"\xee" + data[record_pos + 1:],
+        data[:offset] + struct.pack("<H", 60000) + data[offset + 2:],
+    ]
+    for corrupted in corruptions:
+        broken.write_bytes(corrupted)
+        with pytest.raises(ValueError):
+            load_project(broken)
+
+    broken.write_bytes(b"\x89PNG\r\n\x1a\n" + data[8:])
+    assert not paint_project.is_project_file(broken)
+    with pytest.raises(ValueError):
+        load_project(broken)
+
+
+def _with_version(data, version):
+    magic, _, flags, width, height, count = paint_project._HEADER.unpack_from(data)
+    return paint_project._HEADER.pack(magic, version, flags, width, height, count) + \
+        data[paint_project._HEADER.size:]
+
+
+def test_version_handling(tmp_path):
+    filename = tmp_path / "doc.pmez"
+    document = Document(SIZE)
+    layer = Layer(name="Egyes", background_color=WHITE)
+    document.add_layer(layer)
+    layer.add_shape(make_shape('rect', start=(10, 10), end=(50, 60), color=(255, 0, 0), fill=True, thickness=1))
+    layer.opacity = 0.25
+    save_project(document, filename)
+    data = filename.read_bytes()
+    with paint_project.ProjectReader(filename) as reader:
+        assert reader.version == paint_project.VERSION
+
+    # Újabb verziót nem próbál értelmezni
+    newer = tmp_path / "newer.pmez"
+    newer.write_bytes(_with_version(data, paint_project.VERSION + 1))
+    with pytest.raises(ValueError, match="verzió"):
+        load_project(newer)
+
+    # Az 1. verzióban még nincs átlátszóság / keverési mód: a réteg az alapértékeket kapja
+    header = paint_project._HEADER.size
+    entry = paint_project._DIRECTORY_ENTRY
+    offset, length = entry.unpack_from(data, header)
+    name_len = struct.unpack_from("<H", data, offset)[0]
+    style_pos = offset + 2 + name_len + paint_project._LAYER_HEAD.size
+    style_size = paint_project._LAYER_STYLE.size
+    v1 = (_with_version(data[:header], 1) + entry.pack(offset, length - style_size) +
+          data[header + entry.size:style_pos] + data[style_pos + style_size:])
+    old = tmp_path / "old.pmez"
+    old.write_bytes(v1)
+    with paint_project.ProjectReader(old) as reader:
+        assert reader.version == 1
+        loaded = reader.read_document()
+    assert loaded.layers[0].opacity == 1.0
+    assert loaded.layers[0].blend_mode == 'normal'
+    assert loaded.layers[0].shapes == layer.shapes
+    layer.opacity = 1.0
+    assert pixels(loaded.flatten()) == pixels(document.flatten())